@@ -0,0 +1,231 @@
+# Benchmarks for the catalog and circulation hot paths.
+#
+# For each catalog size the database is cleared and re-seeded with samle_data.generate_bulk
+# (fixed seed, so every run sees the same rows), then each operation is timed by calling
+# the storage job its GUI handler submits to the worker, without Tk. Results are written
+# as JSON so runs from different commits can be compared:
+#
+#   python benchmark.py --output before.json
+#   python benchmark.py --output after.json --compare before.json
+#
+# By default each size gets a fresh SQLite database in a temporary directory. With
+# --backend mysql the database from .env is used instead, and its contents are DELETED.
+# --backend normalized does the same with the normalized layout (converting that database
+# to it if needed) and records each table's data and index size for comparison.
+# --text-queries runs the registered hot statements (storage.QUERIES) as plain text instead
+# of prepared statements, so two runs show what parsing each call costs:
+#
+#   python benchmark.py --backend mysql --sizes 100000 --output prepared.json
+#   python benchmark.py --backend mysql --sizes 100000 --text-queries --compare prepared.json
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import tempfile
+import time
+
+import storage
+import samle_data
+
+DEFAULT_SIZES = (1000, 100000, 1000000)
+# One student for every BOOKS_PER_STUDENT books, as in a typical branch
+BOOKS_PER_STUDENT = 10
+PAGE_SIZE = 100  # same as main.PAGE_SIZE
+
+
+# ---------- Operations ----------
+# Each takes (store, conn, rng, sample) and runs one iteration. sample holds IDs picked from
+# the seeded data; operations that change rows put them back, so iterations stay comparable.
+
+def display_records(store, conn, rng, sample):
+    store.list_books(conn, None, PAGE_SIZE)
+
+def display_records_scrolled(store, conn, rng, sample):
+    # The page a librarian gets after scrolling deep into the table
+    store.list_books(conn, rng.choice(sample['book_rows']), PAGE_SIZE)
+
+def display_records_sorted(store, conn, rng, sample):
+    store.list_books(conn, None, PAGE_SIZE, ('GENRE', False), {'BK_STATUS': 'Issued'})
+
+def search_records(store, conn, rng, sample):
+    store.search_books(conn, rng.choice(samle_data.AUTHORS).split()[-1], 200)
+
+def display_students(store, conn, rng, sample):
+    store.list_students(conn, None, PAGE_SIZE)
+
+def generate_next_book_id(store, conn, rng, sample):
+    # Usually answered from the reserved block
+    store.next_book_id(conn)
+
+def generate_next_book_id_reserve(store, conn, rng, sample):
+    # A fresh desk (or an exhausted block) has to reserve from ID_Sequences
+    store.ids.blocks.clear()
+    store.next_book_id(conn)
+
+def issuer_card(store, conn, rng, sample):
+    # Card check as seen by a desk that has not validated this card before
+    store.valid_cards.clear()
+    store.card_exists(conn, rng.choice(sample['cards']))
+
+def issuer_card_cached(store, conn, rng, sample):
+    store.card_exists(conn, sample['cards'][0])
+
+def change_availability(store, conn, rng, sample):
+    # Issue an available book and take it back, as two clicks on Change Book Availability
+    bk_id = rng.choice(sample['available'])
+    store.set_availability(conn, bk_id, 'Issued', rng.choice(sample['cards']))
+    store.set_availability(conn, bk_id, 'Available', None)
+
+def dashboard(store, conn, rng, sample):
+    store.counters(conn)
+
+def refresh_book(store, conn, rng, sample):
+    # The single-row re-read after every action (refresh_books)
+    store.get_books(conn, [rng.choice(sample['book_rows'])[1]])
+
+def poll_changes(store, conn, rng, sample):
+    # What each idle desk runs every few seconds
+    store.changes_since(conn, store.last_change_id(conn), 500)
+
+OPERATIONS = (display_records, display_records_scrolled, display_records_sorted, search_records,
+              display_students, generate_next_book_id, generate_next_book_id_reserve,
+              issuer_card, issuer_card_cached, change_availability, dashboard, refresh_book, poll_changes)
+
+
+# ---------- Running ----------
+def open_benchmark_store(backend, directory, size, prepared):
+    if backend == 'sqlite':
+        return storage.SQLiteStorage(os.path.join(directory, f'library-{size}.db'), prepared)
+    if backend == 'normalized':
+        return storage.NormalizedMySQLStorage(pool_size=1, prepared=prepared)
+    return storage.MySQLStorage(pool_size=1, prepared=prepared)
+
+def seed(store, conn, size, seed_value, workers):
+    store.migrate()
+    store.delete_all_books(conn)
+    store.delete_all_students(conn)
+    store.reset_ids(conn)
+    samle_data.generate_bulk(store, conn, max(size // BOOKS_PER_STUDENT, 1), size, workers=workers, seed=seed_value)
+
+def pick_sample(store, conn, rng, size):
+    # A spread of existing rows, found by primary key so picking is cheap at any size
+    rows = store.get_books(conn, [f'BK-{rng.randint(1, size):04d}' for _ in range(200)])
+    students = max(size // BOOKS_PER_STUDENT, 1)
+    return {
+        'book_rows': rows,
+        'available': [row[1] for row in rows if row[4] == 'Available'],
+        'cards': [f'LIB-{rng.randint(1, students):04d}' for _ in range(200)],
+    }
+
+def table_footprint(store, conn):
+    # MySQL only: {table: [data bytes, index bytes]}, with statistics refreshed first
+    tables = [row[0] for row in store.fetch_all(conn, '''
+        SELECT TABLE_NAME FROM information_schema.TABLES
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_TYPE = 'BASE TABLE'
+    ''')]
+    store.fetch_all(conn, f"ANALYZE TABLE {', '.join(tables)}")
+    return {row[0]: [row[1], row[2]] for row in store.fetch_all(conn, '''
+        SELECT TABLE_NAME, DATA_LENGTH, INDEX_LENGTH FROM information_schema.TABLES
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_TYPE = 'BASE TABLE'
+    ''')}
+
+def time_operation(operation, store, conn, rng, sample, repeat):
+    operation(store, conn, rng, sample)  # warm-up
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        operation(store, conn, rng, sample)
+        timings.append((time.perf_counter() - started) * 1000)
+    timings.sort()
+    return {
+        'runs': repeat,
+        'min_ms': timings[0],
+        'median_ms': statistics.median(timings),
+        'p95_ms': timings[min(len(timings) - 1, int(len(timings) * 0.95))],
+        'max_ms': timings[-1],
+        'mean_ms': statistics.fmean(timings),
+    }
+
+def run(args):
+    results, footprint = [], {}
+    with tempfile.TemporaryDirectory() as directory:
+        for size in args.sizes:
+            store = open_benchmark_store(args.backend, directory, size, not args.text_queries)
+            with store.connection() as conn:
+                started = time.perf_counter()
+                seed(store, conn, size, args.seed, args.workers)
+                print(f'Seeded {size} books in {time.perf_counter() - started:.1f}s')
+                if args.backend != 'sqlite':
+                    footprint[size] = table_footprint(store, conn)
+                    for table, (data, index) in sorted(footprint[size].items()):
+                        print(f'  {table:<32}{data / 2**20:>10.1f} MiB data{index / 2**20:>10.1f} MiB indexes')
+                rng = random.Random(args.seed)
+                sample = pick_sample(store, conn, rng, size)
+                for operation in OPERATIONS:
+                    if args.only and operation.__name__ not in args.only:
+                        continue
+                    result = time_operation(operation, store, conn, rng, sample, args.repeat)
+                    results.append({'size': size, 'operation': operation.__name__, **result})
+                    print(f"  {operation.__name__:<32}{result['median_ms']:>10.3f} ms median"
+                          f"{result['p95_ms']:>10.3f} ms p95")
+    return results, footprint
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def compare(results, path):
+    # Median of this run against the same size/operation in an earlier results file
+    with open(path, encoding='utf-8') as handle:
+        baseline = {(row['size'], row['operation']): row for row in json.load(handle)['results']}
+    print(f'\nCompared with {path} (median, >1.00x is slower):')
+    for row in results:
+        before = baseline.get((row['size'], row['operation']))
+        if before:
+            print(f"  {row['size']:>8} {row['operation']:<32}{before['median_ms']:>10.3f} -> "
+                  f"{row['median_ms']:>10.3f} ms  {row['median_ms'] / max(before['median_ms'], 1e-9):.2f}x")
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Time the catalog and circulation operations at several catalog sizes.')
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES, help='numbers of books to seed')
+    parser.add_argument('--repeat', type=int, default=50, help='timed runs per operation')
+    parser.add_argument('--backend', choices=('sqlite', 'mysql', 'normalized'), default='sqlite',
+                        help='sqlite: temporary local databases; mysql: the .env database (its data is deleted); '
+                             'normalized: the .env database in the normalized layout (converted if needed)')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--text-queries', action='store_true',
+                        help='run the registered hot statements as plain text queries, not prepared ones '
+                             '(on SQLite: turn off the statement cache)')
+    parser.add_argument('--workers', type=int, default=None, help='seeding processes (default: CPU count)')
+    parser.add_argument('--only', nargs='+', metavar='OPERATION', choices=[op.__name__ for op in OPERATIONS],
+                        help='run only these operations')
+    parser.add_argument('--output', default='benchmark_results.json', help='JSON results file')
+    parser.add_argument('--compare', metavar='FILE', help='earlier results file to compare against')
+    return parser.parse_args()
+
+if __name__ == '__main__':
+    args = parse_args()
+    results, footprint = run(args)
+    report = {
+        'commit': git_commit(),
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'backend': args.backend,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'seed': args.seed,
+        'repeat': args.repeat,
+        'prepared': not args.text_queries,
+        'results': results,
+        'footprint': footprint,
+    }
+    with open(args.output, 'w', encoding='utf-8') as handle:
+        json.dump(report, handle, indent=2)
+    print(f'Wrote {args.output}')
+    if args.compare:
+        compare(results, args.compare)
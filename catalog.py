@@ -0,0 +1,97 @@
+# Compact in-memory model for the book and student tables.
+#
+# Loaded rows are kept as __slots__ records instead of tuples. Values that repeat from
+# row to row (genre, status, author, issuer card, course) are interned, so every row
+# shares one string object per distinct value. TableModel keeps the records in display
+# order and indexes them by key. The Treeview in main.py only holds the rows currently
+# on screen and is redrawn from the model as it scrolls.
+from bisect import bisect_left
+import sys
+
+
+def shared(value):
+    return sys.intern(value) if isinstance(value, str) else value
+
+
+class Book:
+    __slots__ = ('name', 'bk_id', 'author', 'genre', 'status', 'card_id', 'version')
+    key_index = 1  # position of the key in a database row
+
+    # Same order as storage.BOOK_ROW_FIELDS
+    def __init__(self, name, bk_id, author, genre, status, card_id, version=None):
+        self.name = name
+        self.bk_id = bk_id
+        self.author = shared(author)
+        self.genre = shared(genre)
+        self.status = shared(status)
+        self.card_id = shared(card_id)
+        self.version = version
+
+    @property
+    def key(self):
+        return self.bk_id
+
+
+class Student:
+    __slots__ = ('card_id', 'name', 'email', 'course', 'year')
+    key_index = 0
+
+    # Same order as storage.STUDENT_FIELDS
+    def __init__(self, card_id, name, email, course, year):
+        self.card_id = card_id
+        self.name = name
+        self.email = email
+        self.course = shared(course)
+        self.year = year
+
+    @property
+    def key(self):
+        return self.card_id
+
+    def row(self):
+        return (self.card_id, self.name, self.email, self.course, self.year)
+
+
+class TableModel:
+    # Records in display order (keys) plus a key -> record index (records)
+    def __init__(self, record_type):
+        self.record_type = record_type
+        self.keys = []
+        self.records = {}
+
+    def __len__(self):
+        return len(self.keys)
+
+    def __contains__(self, key):
+        return key in self.records
+
+    def get(self, key):
+        return self.records.get(key)
+
+    def clear(self):
+        self.keys = []
+        self.records = {}
+
+    def append_rows(self, rows):
+        for row in rows:
+            record = self.record_type(*row)
+            if record.key not in self.records:
+                self.keys.append(record.key)
+            self.records[record.key] = record
+
+    def update_row(self, row):
+        record = self.record_type(*row)
+        self.records[record.key] = record
+
+    def insert_sorted(self, row):
+        # Only valid while keys are in key order (no column sort applied)
+        record = self.record_type(*row)
+        self.keys.insert(bisect_left(self.keys, record.key), record.key)
+        self.records[record.key] = record
+
+    def remove(self, key):
+        if self.records.pop(key, None) is not None:
+            self.keys.remove(key)
+
+    def window(self, start, stop):
+        return [self.records[key] for key in self.keys[start:stop]]
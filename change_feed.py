@@ -0,0 +1,52 @@
+# Client side of the change feed (storage.Change_Log).
+#
+# Each desk keeps a ChangeCursor: the highest Change_ID it has applied, plus the lower IDs it
+# has not seen yet. With MySQL, AUTO_INCREMENT IDs are handed out when a row is inserted, not
+# when its transaction commits, so a poll can see entry 12 while entry 11 is still uncommitted.
+# Moving straight to 12 would lose 11 for good. These holes are remembered, and the next polls
+# also ask for them by ID. A hole that stays empty for GAP_TIMEOUT seconds was a rolled-back
+# write and is dropped.
+import time
+
+GAP_TIMEOUT = 60
+# Holes remembered at most; past that the oldest are given up on
+MAX_GAPS = 1000
+
+
+class ChangeCursor:
+    def __init__(self, position):
+        self.position = position
+        self.gaps = {}  # Change_ID -> time the hole was first seen
+
+    def missing(self):
+        return sorted(self.gaps)
+
+    def advance(self, changes, now=None):
+        # changes: rows from storage.changes_since(). Returns the ones not applied yet,
+        # oldest first, and moves the cursor past them
+        now = time.monotonic() if now is None else now
+        fresh = []
+        for change in sorted(changes):
+            change_id = change[0]
+            if change_id > self.position:
+                for gap in range(max(self.position + 1, change_id - MAX_GAPS), change_id):
+                    self.gaps[gap] = now
+                self.position = change_id
+                fresh.append(change)
+            elif self.gaps.pop(change_id, None) is not None:
+                fresh.append(change)
+
+        for gap, seen in list(self.gaps.items()):
+            if now - seen > GAP_TIMEOUT:
+                del self.gaps[gap]
+        for gap in self.missing()[:-MAX_GAPS]:
+            del self.gaps[gap]
+        return fresh
+
+    @staticmethod
+    def keys_by_table(changes):
+        # {table: [Row_Key]} in order, without duplicates; '*' means reload the whole table
+        keys = {}
+        for _, table, key in changes:
+            keys.setdefault(table, {})[key] = None
+        return {table: list(table_keys) for table, table_keys in keys.items()}
@@ -0,0 +1,99 @@
+# Background database worker. Jobs run on a pool of threads, each using a connection
+# from the storage backend (see storage.py). Results are handed back to the Tk thread
+# through root.after, so a slow query never freezes the window.
+from dotenv import load_dotenv
+import sys
+import os
+
+load_dotenv()  # Load variables from .env
+
+POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "4"))
+# Statements slower than this are appended to the slow-query log (off when no file is named)
+SLOW_QUERY_MS = float(os.getenv("DB_SLOW_QUERY_MS", "200"))
+SLOW_QUERY_LOG = os.getenv("DB_SLOW_QUERY_LOG", "")
+# Run the fixed hot statements (storage.QUERIES) as server-side prepared statements
+PREPARED_STATEMENTS = os.getenv("DB_PREPARED_STATEMENTS", "1") != "0"
+# Prometheus text file with the query histograms, rewritten every METRICS_INTERVAL_MS (off when empty)
+METRICS_FILE = os.getenv("DB_METRICS_FILE", "")
+METRICS_INTERVAL_MS = 15000
+# How often the Tk thread checks for finished jobs while any are pending
+POLL_MS = 15
+# Loans: books are due LOAN_DAYS after they are issued. Each day overdue adds FINE_PER_DAY
+# (in cents) up to FINE_MAX, and the borrower is reminded every REMINDER_DAYS days.
+LOAN_DAYS = int(os.getenv("LOAN_DAYS", "14"))
+FINE_PER_DAY = int(os.getenv("FINE_PER_DAY", "10"))
+FINE_MAX = int(os.getenv("FINE_MAX", "1000"))
+REMINDER_DAYS = int(os.getenv("REMINDER_DAYS", "7"))
+
+
+def connection_settings():
+    return dict(
+        host=os.getenv("DB_HOST", "localhost"),
+        user=os.getenv("DB_USER", "root"),
+        password=os.getenv("DB_PASSWORD", "yourpassword"),
+        database=os.getenv("DB_NAME", "librarydb")
+    )
+
+
+class DbWorker:
+    # Runs job(conn, *args) with a storage connection in a background thread. on_done/on_error
+    # are called on the Tk thread. One thread per pooled connection keeps the pool from
+    # ever being exhausted.
+    def __init__(self, root, storage, on_error, on_busy=None, size=POOL_SIZE):
+        # Imported here so scripts that only use connection_settings() don't pay for them
+        from concurrent.futures import ThreadPoolExecutor
+        import queue
+
+        self.root = root
+        self.storage = storage
+        self.on_error = on_error
+        self.on_busy = on_busy
+        self.executor = ThreadPoolExecutor(max_workers=size, thread_name_prefix='db')
+        self.results = queue.Queue()
+        self.pending = 0
+        self.polling = False
+
+    def _run(self, site, job, *args):
+        with self.storage.connection() as conn, self.storage.stats.call_site(site):
+            return job(conn, *args)
+
+    def submit(self, job, *args, on_done=None, on_error=None):
+        # Queries are attributed to the handler that submitted them, e.g. "change_availability > set_availability"
+        code = sys._getframe(1).f_code
+        name = getattr(code, 'co_qualname', code.co_name).replace('.<locals>', '')
+        site = f"{name} > {job.__name__}"
+        self.pending += 1
+        if self.pending == 1:
+            self._busy_changed()
+        if not self.polling:
+            self.polling = True
+            self.root.after(POLL_MS, self._poll)
+        future = self.executor.submit(self._run, site, job, *args)
+        future.add_done_callback(lambda done: self.results.put((done, on_done, on_error)))
+        return future
+
+    def _poll(self):
+        # Only this (Tk) thread takes from the queue, so empty() cannot race with get_nowait()
+        while not self.results.empty():
+            future, on_done, on_error = self.results.get_nowait()
+            self.pending -= 1
+            try:
+                error = future.exception()
+                if error is not None:
+                    (on_error or self.on_error)(error)
+                elif on_done is not None:
+                    on_done(future.result())
+            except Exception:
+                self.root.report_callback_exception(*sys.exc_info())
+        if self.pending:
+            self.root.after(POLL_MS, self._poll)
+        else:
+            self.polling = False
+            self._busy_changed()
+
+    def _busy_changed(self):
+        if self.on_busy is not None:
+            self.on_busy(self.pending > 0)
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
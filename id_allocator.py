@@ -0,0 +1,52 @@
+# Counter-based ID allocator for Book IDs and Library Card IDs.
+#
+# Each desk reserves a block of numbers from the ID_Sequences table with a single
+# atomic update, then hands them out locally. Two desks never see the same preview
+# ID, no MAX() scan is needed, and the numeric part is not limited to four digits.
+# Numbers left in a block when a desk closes are simply skipped. The table itself is
+# created by migrations.py; the update is backend-specific (see storage.reserve_ids).
+import threading
+
+BLOCK_SIZE = 20
+
+# name -> (prefix, table, key column)
+SEQUENCES = {
+    'book': ('BK-', 'Library', 'BK_ID'),
+    'student': ('LIB-', 'Students', 'Card_ID'),
+}
+
+
+class IdAllocator:
+    # Safe to share between worker threads; each call uses the caller's connection.
+    # reserve(conn, name, count) advances the stored counter and returns its new value.
+    def __init__(self, reserve, block_size=BLOCK_SIZE):
+        self.reserve = reserve
+        self.block_size = block_size
+        self.blocks = {}  # name -> [next number, end of block)
+        self.lock = threading.Lock()
+
+    def _next(self, conn, name):
+        block = self.blocks.get(name)
+        if block is None or block[0] >= block[1]:
+            end = self.reserve(conn, name, self.block_size)
+            block = self.blocks[name] = [end - self.block_size, end]
+        return block
+
+    def peek(self, conn, name):
+        with self.lock:
+            return f"{SEQUENCES[name][0]}{self._next(conn, name)[0]:04d}"
+
+    def take(self, conn, name):
+        # The next ID, handed out exactly once: for callers that store it straight away,
+        # where two concurrent requests must not both get the previewed ID
+        with self.lock:
+            block = self._next(conn, name)
+            block[0] += 1
+            return f"{SEQUENCES[name][0]}{block[0] - 1:04d}"
+
+    def mark_used(self, conn, name, value):
+        # Advance past the previewed ID once it has been stored; IDs typed by hand are ignored
+        with self.lock:
+            block = self._next(conn, name)
+            if value == f"{SEQUENCES[name][0]}{block[0]:04d}":
+                block[0] += 1
@@ -0,0 +1,295 @@
+# Command-line interface to the library database, for scripts, cron jobs and quick checks
+# without the GUI:
+#
+#   python library.py list books --sort genre --where status=Issued
+#   python library.py search "harry pot"
+#   python library.py issue LIB-0007 BK-0012 BK-0031
+#   python library.py return BK-0012
+#   python library.py add-student "Asha Rao" asha@example.com "B.Sc CS" 2
+#   python library.py stats --from 2025-01 --to 2025-06
+#   python library.py counters --reconcile
+#   python library.py prune-changes --days 7
+#   python library.py overdue
+#   python library.py notices --mark-sent
+#   python library.py export books books.csv
+#   python library.py import students students.jsonl --upsert
+#   python library.py migrate
+#
+# Results are printed one row per line, tab-separated, with empty fields for NULL. Only
+# argparse is imported up front: the storage backend and its driver are loaded when a
+# command runs, and the schema is only touched by `migrate`.
+import argparse
+import re
+import sys
+
+# Rows fetched per query while listing; the output is streamed page by page
+LIST_PAGE_SIZE = 1000
+
+TABLE_NAMES = {'books': 'Library', 'students': 'Students'}
+
+
+def print_rows(rows):
+    for row in rows:
+        print('\t'.join('' if value is None else str(value) for value in row))
+
+
+def open_store():
+    import storage
+
+    store = storage.open_storage(pool_size=1)
+    # Each run is a short-lived desk: reserve IDs one at a time so unused ones aren't skipped
+    store.ids.block_size = 1
+    return store
+
+
+def column_name(fields, name):
+    # Accept column names in any case, plus the short forms used in the GUI headings
+    aliases = {'name': 'BK_NAME', 'id': 'BK_ID', 'author': 'AUTHOR_NAME', 'status': 'BK_STATUS', 'card': 'CARD_ID'}
+    for field in fields:
+        if field.lower() == name.lower():
+            return field
+    if fields[0] == 'BK_NAME' and name.lower() in aliases:
+        return aliases[name.lower()]
+    raise SystemExit(f"error: unknown column {name!r}; expected one of {', '.join(fields)}")
+
+
+def list_command(args):
+    import storage
+
+    store = open_store()
+    if args.table == 'books':
+        fields, fetch = storage.BOOK_FIELDS, store.list_books
+    else:
+        fields, fetch = storage.STUDENT_FIELDS, store.list_students
+    sort = (column_name(fields, args.sort), args.desc) if args.sort else None
+    filters = {}
+    for condition in args.where:
+        name, _, value = condition.partition('=')
+        filters[column_name(fields, name)] = value or None  # "card=" matches NULL
+
+    remaining = args.limit
+    last_row = None
+    with store.connection() as conn:
+        while remaining is None or remaining > 0:
+            size = LIST_PAGE_SIZE if remaining is None else min(LIST_PAGE_SIZE, remaining)
+            rows = fetch(conn, last_row, size, sort, filters)
+            print_rows(row[:len(fields)] for row in rows)
+            if len(rows) < size:
+                break
+            last_row = rows[-1]
+            if remaining is not None:
+                remaining -= len(rows)
+
+
+def search_command(args):
+    import storage
+
+    store = open_store()
+    with store.connection() as conn:
+        print_rows(row[:len(storage.BOOK_FIELDS)] for row in store.search_books(conn, args.text, args.limit))
+
+
+def circulate_command(args, status, card_id=None):
+    import storage
+
+    store = open_store()
+    try:
+        with store.connection() as conn:
+            count = store.circulate(conn, args.book_ids, status, card_id)
+    except storage.CirculationError as error:
+        print('Nothing was saved:', *error.problems, sep='\n', file=sys.stderr)
+        return 1
+    print(f"{count} book(s) {'issued to ' + card_id if status == 'Issued' else 'returned'}.")
+
+
+def add_student_command(args):
+    import storage
+
+    store = open_store()
+    with store.connection() as conn:
+        card_id = args.card_id or store.take_card_id(conn)
+        try:
+            store.add_student(conn, (card_id, args.name, args.email, args.course, args.year))
+        except storage.IntegrityError:
+            print(f'error: Card ID {card_id} already exists.', file=sys.stderr)
+            return 1
+    print(card_id)
+
+
+def stats_command(args):
+    for period in (args.first, args.last):
+        if period and not re.fullmatch(r'\d{4}-\d{2}', period):
+            raise SystemExit('error: periods must be written as YYYY-MM')
+    store = open_store()
+    with store.connection() as conn:
+        stats = store.loan_stats(conn, args.first, args.last, args.limit)
+    for title, key in (('Most borrowed books', 'books'), ('Loans by genre', 'genres'),
+                       ('Most active students', 'students')):
+        print(f'# {title}')
+        print_rows(stats[key])
+
+
+def counters_command(args):
+    store = open_store()
+    with store.connection() as conn:
+        if args.reconcile:
+            # Meant for cron: corrects counters that drifted, e.g. after manual SQL edits
+            print(f'{store.reconcile_counters(conn)} counter(s) corrected', file=sys.stderr)
+        counters = store.counters(conn)
+    for title, kind in (('Books by status', 'status'), ('Books by genre', 'genre'),
+                        ('Outstanding loans by course', 'course')):
+        print(f'# {title}')
+        print_rows(counters[kind])
+
+
+def overdue_command(args):
+    # Meant for a daily cron job: fines the overdue loans and queues their reminder notices
+    store = open_store()
+    with store.connection() as conn:
+        loans, total, notices = store.assess_overdue(conn)
+        rows = store.overdue_loans(conn, args.limit)
+    print(f'{loans} overdue loan(s), {total / 100:.2f} in fines, {notices} notice(s) queued', file=sys.stderr)
+    print_rows(rows)
+
+
+def notices_command(args):
+    # Unsent notices, oldest first, for a mail script; --mark-sent takes the printed ones off the queue
+    store = open_store()
+    with store.connection() as conn:
+        rows = store.pending_notifications(conn, args.limit)
+        print_rows(rows)
+        if args.mark_sent:
+            store.mark_notifications_sent(conn, [row[0] for row in rows])
+
+
+def prune_changes_command(args):
+    store = open_store()
+    with store.connection() as conn:
+        removed = store.prune_changes(conn, args.days)
+    print(f'{removed} change log entries removed', file=sys.stderr)
+
+
+def file_format(args):
+    import transfer
+
+    try:
+        return transfer.file_format(args.path, args.format)
+    except ValueError as error:
+        raise SystemExit(f'error: {error}')
+
+
+def export_command(args):
+    import transfer
+
+    fmt = file_format(args)
+    store = open_store()
+    with store.connection() as conn:
+        transfer.export_table(store, conn, TABLE_NAMES[args.table], args.path, fmt, args.batch_size)
+
+
+def import_command(args):
+    import transfer
+
+    fmt = file_format(args)
+    store = open_store()
+    with store.connection() as conn:
+        _, rejected = transfer.import_table(store, conn, TABLE_NAMES[args.table], args.path, fmt,
+                                            args.upsert, args.batch_size)
+    if rejected:
+        print(f'{rejected} row(s) were rejected.', file=sys.stderr)
+        return 1
+
+
+def migrate_command(args):
+    store = open_store()
+    applied = store.migrate()
+    print(f"Applied migrations {', '.join(map(str, applied))}" if applied else 'Schema is up to date')
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='library', description='Library database from the command line.')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    listing = commands.add_parser('list', help='list books or students in key order, or sorted/filtered')
+    listing.add_argument('table', choices=('books', 'students'))
+    listing.add_argument('--sort', metavar='COLUMN', help='sort by this column instead of the ID')
+    listing.add_argument('--desc', action='store_true', help='sort in descending order')
+    listing.add_argument('--where', metavar='COLUMN=VALUE', action='append', default=[],
+                         help='only rows with this exact value (repeatable; COLUMN= matches empty)')
+    listing.add_argument('--limit', type=int, help='stop after this many rows')
+    listing.set_defaults(run=list_command)
+
+    search = commands.add_parser('search', help='search books by title, author or genre')
+    search.add_argument('text')
+    search.add_argument('--limit', type=int, default=50)
+    search.set_defaults(run=search_command)
+
+    issue = commands.add_parser('issue', help='issue one or more books to a student')
+    issue.add_argument('card_id')
+    issue.add_argument('book_ids', nargs='+', metavar='book_id')
+    issue.set_defaults(run=lambda args: circulate_command(args, 'Issued', args.card_id))
+
+    returning = commands.add_parser('return', help='mark one or more books as returned')
+    returning.add_argument('book_ids', nargs='+', metavar='book_id')
+    returning.set_defaults(run=lambda args: circulate_command(args, 'Available'))
+
+    student = commands.add_parser('add-student', help='register a student and print the new Card ID')
+    student.add_argument('name')
+    student.add_argument('email')
+    student.add_argument('course')
+    student.add_argument('year', type=int)
+    student.add_argument('--card-id', help='use this Card ID instead of the next free one')
+    student.set_defaults(run=add_student_command)
+
+    stats = commands.add_parser('stats', help='loan statistics, optionally between two months')
+    stats.add_argument('--from', dest='first', metavar='YYYY-MM')
+    stats.add_argument('--to', dest='last', metavar='YYYY-MM')
+    stats.add_argument('--limit', type=int, default=20)
+    stats.set_defaults(run=stats_command)
+
+    counters = commands.add_parser('counters', help='dashboard totals: books by status and genre, loans by course')
+    counters.add_argument('--reconcile', action='store_true', help='recount from the tables first')
+    counters.set_defaults(run=counters_command)
+
+    overdue = commands.add_parser('overdue', help='fine overdue loans, queue reminders and list the loans '
+                                                  '(card, name, book, due date, days, fine in cents)')
+    overdue.add_argument('--limit', type=int, default=100, help='overdue loans listed')
+    overdue.set_defaults(run=overdue_command)
+
+    notices = commands.add_parser('notices', help='unsent overdue notices (ID, card, name, email, book, title, '
+                                                  'due date, days, fine in cents)')
+    notices.add_argument('--limit', type=int, default=1000)
+    notices.add_argument('--mark-sent', action='store_true', help='mark the printed notices as sent')
+    notices.set_defaults(run=notices_command)
+
+    prune = commands.add_parser('prune-changes', help='drop old entries from the change log desks sync from')
+    prune.add_argument('--days', type=int, default=7, help='keep this many days of changes')
+    prune.set_defaults(run=prune_changes_command)
+
+    export = commands.add_parser('export', help='write every book or student to a CSV or JSON Lines file')
+    export.add_argument('table', choices=('books', 'students'))
+    export.add_argument('path', help="output file, or - for stdout")
+    export.add_argument('--format', choices=('csv', 'json'), help='default: from the file extension')
+    export.add_argument('--batch-size', type=int, default=5000, help='rows fetched per batch')
+    export.set_defaults(run=export_command)
+
+    load = commands.add_parser('import', help='load books or students from a CSV or JSON Lines file')
+    load.add_argument('table', choices=('books', 'students'))
+    load.add_argument('path', help="input file, or - for stdin")
+    load.add_argument('--format', choices=('csv', 'json'), help='default: from the file extension')
+    load.add_argument('--upsert', action='store_true', help='update rows whose ID already exists')
+    load.add_argument('--batch-size', type=int, default=5000, help='rows validated and inserted per batch')
+    load.set_defaults(run=import_command)
+
+    migrate = commands.add_parser('migrate', help='create or upgrade the database schema')
+    migrate.set_defaults(run=migrate_command)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    return args.run(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
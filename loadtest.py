@@ -0,0 +1,193 @@
+# Load test for server.py. CONCURRENCY clients, each on its own keep-alive connection, send
+# a fixed mix of requests for DURATION seconds. Every request is timed, and the script then
+# prints requests/sec and latency percentiles, overall and per request type:
+#
+#   python server.py --port 8080 &
+#   python loadtest.py --url http://127.0.0.1:8080 --concurrency 50 --duration 15
+#
+# --spawn starts server.py itself (on the .env database) and stops it afterwards. Issues and
+# returns change the data: each client returns every book it issues, so the catalog ends up
+# as it started, apart from the loan history. A 409 Conflict (two clients picked the same
+# book) is counted as a conflict rather than an error.
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import time
+from urllib.parse import urlsplit, quote
+
+# (request type, weight)
+MIX = (('list_books', 30), ('search_books', 15), ('get_book', 30), ('get_student', 10),
+       ('list_students', 5), ('issue_return', 10))
+SEARCH_WORDS = ('the', 'king', 'rowling', 'fantasy', 'mystery', 'tolkien', 'science', 'history')
+
+
+class Client:
+    # One keep-alive HTTP/1.1 connection
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        self.reader = self.writer = None
+
+    async def request(self, method, path, body=None):
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        content = json.dumps(body).encode() if body is not None else b''
+        self.writer.write(f'{method} {path} HTTP/1.1\r\nHost: {self.host}\r\n'
+                          f'Content-Type: application/json\r\nContent-Length: {len(content)}\r\n\r\n'.encode()
+                          + content)
+        await self.writer.drain()
+        status = int((await self.reader.readline()).split()[1])
+        length = 0
+        while True:
+            line = await self.reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            if name.strip().lower() == 'content-length':
+                length = int(value)
+        payload = await self.reader.readexactly(length)
+        return status, json.loads(payload) if payload else None
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+
+
+async def run_client(client, rng, sample, deadline, timings, statuses):
+    kinds = [kind for kind, _ in MIX]
+    weights = [weight for _, weight in MIX]
+    while time.perf_counter() < deadline:
+        kind = rng.choices(kinds, weights)[0]
+        started = time.perf_counter()
+        if kind == 'list_books':
+            status, _ = await client.request('GET', f'/books?limit=100&after={quote(rng.choice(sample["books"]))}')
+        elif kind == 'search_books':
+            status, _ = await client.request('GET', f'/books/search?q={rng.choice(SEARCH_WORDS)}&limit=50')
+        elif kind == 'get_book':
+            status, _ = await client.request('GET', f'/books/{quote(rng.choice(sample["books"]))}')
+        elif kind == 'get_student':
+            status, _ = await client.request('GET', f'/students/{quote(rng.choice(sample["cards"]))}')
+        elif kind == 'list_students':
+            status, _ = await client.request('GET', '/students?limit=100')
+        else:
+            bk_id = rng.choice(sample['available'])
+            status, _ = await client.request('POST', '/issue', {'card_id': rng.choice(sample['cards']),
+                                                                'book_ids': [bk_id]})
+            if status == 200:
+                status, _ = await client.request('POST', '/return', {'book_ids': [bk_id]})
+        timings.setdefault(kind, []).append((time.perf_counter() - started) * 1000)
+        statuses[status] = statuses.get(status, 0) + 1
+
+
+async def load_sample(client):
+    # IDs to pick from: a spread of books (and the available ones, for issuing) and cards
+    _, books = await client.request('GET', '/books?limit=1000')
+    _, students = await client.request('GET', '/students?limit=1000')
+    if not books or not students:
+        raise SystemExit('The database has no books or students; seed it with samle_data.py first')
+    return {
+        'books': [book['BK_ID'] for book in books],
+        'available': [book['BK_ID'] for book in books if book['BK_STATUS'] == 'Available'] or [books[0]['BK_ID']],
+        'cards': [student['Card_ID'] for student in students],
+    }
+
+
+def percentile(sorted_values, fraction):
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * fraction))]
+
+
+def summary(values, seconds):
+    values = sorted(values)
+    return {'requests': len(values), 'rps': len(values) / seconds, 'median_ms': statistics.median(values),
+            'p95_ms': percentile(values, 0.95), 'p99_ms': percentile(values, 0.99), 'max_ms': values[-1]}
+
+
+async def run(args):
+    url = urlsplit(args.url)
+    host, port = url.hostname, url.port or 80
+    setup = Client(host, port)
+    sample = await load_sample(setup)
+    setup.close()
+
+    clients = [Client(host, port) for _ in range(args.concurrency)]
+    timings, statuses = {}, {}
+    started = time.perf_counter()
+    deadline = started + args.duration
+    try:
+        await asyncio.gather(*(run_client(client, random.Random(args.seed + number), sample, deadline,
+                                          timings, statuses) for number, client in enumerate(clients)))
+    finally:
+        for client in clients:
+            client.close()
+    seconds = time.perf_counter() - started
+    return {
+        'concurrency': args.concurrency,
+        'seconds': seconds,
+        'statuses': statuses,
+        'overall': summary([value for values in timings.values() for value in values], seconds),
+        'by_type': {kind: summary(values, seconds) for kind, values in sorted(timings.items())},
+    }
+
+
+def report(result):
+    overall = result['overall']
+    print(f"{overall['requests']} requests in {result['seconds']:.1f}s from {result['concurrency']} clients: "
+          f"{overall['rps']:,.0f} requests/sec, p99 {overall['p99_ms']:.1f} ms")
+    print(f"  {'type':<16}{'req/s':>10}{'median':>10}{'p95':>10}{'p99':>10}{'max':>10}  (ms)")
+    for kind, row in list(result['by_type'].items()) + [('all', overall)]:
+        print(f"  {kind:<16}{row['rps']:>10,.0f}{row['median_ms']:>10.2f}{row['p95_ms']:>10.2f}"
+              f"{row['p99_ms']:>10.2f}{row['max_ms']:>10.2f}")
+    conflicts = result['statuses'].get(409, 0)
+    errors = sum(count for status, count in result['statuses'].items() if status >= 400 and status != 409)
+    print(f'  {conflicts} conflicts, {errors} errors; responses by status: {result["statuses"]}')
+
+
+async def wait_for_server(host, port, process, timeout=30):
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        if process.poll() is not None:
+            raise SystemExit('server.py exited during startup')
+        try:
+            _, writer = await asyncio.open_connection(host, port)
+            writer.close()
+            return
+        except OSError:
+            await asyncio.sleep(0.2)
+    raise SystemExit('server.py did not start listening in time')
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Load test for the library HTTP API (server.py).')
+    parser.add_argument('--url', default='http://127.0.0.1:8080')
+    parser.add_argument('--concurrency', type=int, default=50, help='simultaneous clients')
+    parser.add_argument('--duration', type=float, default=15, help='seconds to run')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--spawn', action='store_true', help='start server.py on the URL\'s port for the run')
+    parser.add_argument('--output', help='also write the results to this JSON file')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    server = None
+    if args.spawn:
+        url = urlsplit(args.url)
+        script = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'server.py')
+        server = subprocess.Popen([sys.executable, script, '--host', url.hostname, '--port', str(url.port or 80)])
+    try:
+        if server is not None:
+            asyncio.run(wait_for_server(urlsplit(args.url).hostname, urlsplit(args.url).port or 80, server))
+        result = asyncio.run(run(args))
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+    report(result)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as handle:
+            json.dump(result, handle, indent=2)
@@ -1,44 +1,13 @@
-import mysql.connector
 from tkinter import *
 import tkinter.ttk as ttk
 import tkinter.messagebox as mb
 import tkinter.simpledialog as sd
-from dotenv import load_dotenv
-import os
-
-load_dotenv()  # Load variables from .env
-
-connector = mysql.connector.connect(
-    host=os.getenv("DB_HOST", "localhost"),
-    user=os.getenv("DB_USER", "root"),
-    password=os.getenv("DB_PASSWORD", "yourpassword"),
-    database=os.getenv("DB_NAME", "librarydb")
-)
-
-cursor = connector.cursor()
-
-# Creating tables if not exists
-cursor.execute("""
-CREATE TABLE IF NOT EXISTS Library (
-    BK_NAME VARCHAR(255),
-    BK_ID VARCHAR(50) PRIMARY KEY,
-    AUTHOR_NAME VARCHAR(255),
-    GENRE VARCHAR(50),
-    BK_STATUS VARCHAR(20),
-    CARD_ID VARCHAR(50)
-)
-""")
-
-cursor.execute("""
-CREATE TABLE IF NOT EXISTS Students (
-    Card_ID VARCHAR(50) PRIMARY KEY,
-    Name VARCHAR(255),
-    Email VARCHAR(255),
-    Course VARCHAR(100),
-    Year INT
-)
-""")
-connector.commit()
+import re
+import storage
+import catalog
+import change_feed
+import student_index
+import db
 
 # Common genres for suggestions
 COMMON_GENRES = [
@@ -47,62 +16,528 @@ COMMON_GENRES = [
     "Adventure", "Crime", "Drama", "Poetry", "Self-Help"
 ]
 
+# Rows fetched per round-trip when filling the book/student tables
+PAGE_SIZE = 100
+# Keep at least this many loaded rows below the visible window
+PREFETCH_ROWS = 50
+# Rows scrolled per mouse wheel notch
+WHEEL_ROWS = 3
+
+# Shown in the Issuer Card ID column for books that are not issued (stored as NULL)
+NO_CARD = 'N/A'
+
+# Catalog search: wait this long after the last keystroke, and show at most SEARCH_LIMIT hits
+SEARCH_DELAY_MS = 250
+SEARCH_LIMIT = 200
+
+# Students suggested while typing in the issuer picker
+SUGGESTION_LIMIT = 20
+
+# Rows shown in each Statistics table
+STATS_LIMIT = 20
+
+# The Dashboard re-reads its counters this often while it is the open tab
+DASHBOARD_REFRESH_MS = 5000
+
+# Other desks' changes are picked up from the change log this often, at most SYNC_LIMIT
+# entries per poll (a full batch polls again straight away)
+SYNC_INTERVAL_MS = 3000
+SYNC_LIMIT = 500
+
+# Treeview heading -> database column, for sorting and filtering in SQL
+BOOK_HEADINGS = {'Book Name': 'BK_NAME', 'Book ID': 'BK_ID', 'Author': 'AUTHOR_NAME',
+                 'Genre': 'GENRE', 'Status': 'BK_STATUS', 'Issuer Card ID': 'CARD_ID'}
+STUDENT_HEADINGS = {'Card ID': 'Card_ID', 'Name': 'Name', 'Email': 'Email', 'Course': 'Course', 'Year': 'Year'}
+
+# Paging state for the book and student tables. Loaded rows live in 'model' (see
+# catalog.py); the Treeview only holds the 'rows' rows starting at model position 'top'
+# and is redrawn from the model as it scrolls. 'selected' is the key of the selected row,
+# kept while it is scrolled out of view. 'generation' changes on every full reload so
+# pages still in flight from before the reload are dropped. 'filtered' is set while the
+# table shows search results or a sorted/filtered view, so refreshed rows are never
+# inserted by key order into them. 'sort' is None or (column, descending); 'filters' maps
+# column -> value. 'last_row' is the last row loaded, which the next page seeks past.
+# 'total' is the row count of the whole unfiltered table when known, so the scrollbar thumb
+# keeps its size while pages load; books take it from the status counters, and students
+# (who have no counter) size the thumb from the rows loaded so far. 'target' is the top row
+# the thumb was dragged to while it is past the loaded rows; pages are loaded until it is in.
+# 'scrollbar' is set once the window is built.
+book_pages = {'model': catalog.TableModel(catalog.Book), 'top': 0, 'rows': 20, 'selected': None,
+              'last_row': None, 'done': False, 'loading': False, 'generation': 0, 'filtered': False,
+              'sort': None, 'filters': {}, 'total': None, 'target': None, 'scrollbar': None}
+student_pages = {'model': catalog.TableModel(catalog.Student), 'top': 0, 'rows': 20, 'selected': None,
+                 'last_row': None, 'done': False, 'loading': False, 'generation': 0, 'filtered': False,
+                 'sort': None, 'filters': {}, 'total': None, 'target': None, 'scrollbar': None}
+
+def stored_card(Cid):
+    return None if Cid in (None, '', NO_CARD) else Cid
+
+def book_values(book):
+    return (book.name, book.bk_id, book.author, book.genre, book.status,
+            NO_CARD if book.card_id is None else book.card_id)
+
+def student_values(student):
+    return student.row()
+
+def selected_book():
+    return book_pages['model'].get(book_pages['selected'])
+
+def selected_student():
+    return student_pages['model'].get(student_pages['selected'])
+
 # Functions
-def issuer_card():
-    Cid = sd.askstring('Issuer Card ID', 'What is the Issuer\'s Card ID?\t\t\t')
-    if not Cid:
-        mb.showerror('Issuer ID cannot be empty!', 'Please enter a valid Card ID.')
-        return None
-    
-    # Check if the card ID exists in Students table
-    cursor.execute('SELECT * FROM Students WHERE Card_ID = %s', (Cid,))
-    student = cursor.fetchone()
-    
-    if not student:
-        mb.showerror('Invalid Card ID', 'This Card ID is not registered. Please register as a student first.')
-        return None
+def show_db_error(error):
+    mb.showerror('Database error', f'An error occurred: {error}')
+
+def show_busy(busy):
+    busy_var.set('Working...' if busy else '')
+    root.config(cursor='watch' if busy else '')
+
+def show_conflict(error, bk_id):
+    # Another desk changed the book first: show the current row instead of overwriting it
+    refresh_books(bk_id)
+    mb.showwarning('Changed at another desk', f'{error}. Nothing was saved; the row now shows the current values.')
+
+def issuer_card(then):
+    # Asks for the issuer and calls then(card_id) once the card is confirmed to be registered.
+    # Students matching what has been typed (Card ID, name or email prefix) are listed as
+    # suggestions from students_by_prefix, without a query per keystroke.
+    dialog = Toplevel(root)
+    dialog.title('Issuer Card ID')
+    dialog.transient(root)
+    dialog.resizable(0, 0)
+    typed = StringVar()
+    matches = []
+
+    Label(dialog, text='Type the issuer\'s Card ID, name or email:', font=lbl_font).pack(anchor=W, padx=10, pady=(10, 5))
+    entry = Entry(dialog, textvariable=typed, font=entry_font, width=60)
+    entry.pack(fill=X, padx=10)
+    suggestions = Listbox(dialog, font=entry_font, height=10, activestyle=NONE, exportselection=False)
+    suggestions.pack(fill=BOTH, padx=10, pady=5)
+    buttons = Frame(dialog)
+    buttons.pack(anchor=E, padx=10, pady=(0, 10))
+
+    def suggest(*args):
+        matches[:] = students_by_prefix.suggest(typed.get(), SUGGESTION_LIMIT) if students_by_prefix else []
+        suggestions.delete(0, END)
+        for card, name, email, course in matches:
+            suggestions.insert(END, f'{card}    {name}    {email}    {course or ""}')
+        # Only an exact Card ID is preselected. A name or ID prefix has to be picked with the
+        # arrows or the mouse, so Enter never issues to whoever happens to sort first.
+        exact = typed.get().strip().lower()
+        for index, match in enumerate(matches):
+            if match[0].lower() == exact:
+                suggestions.selection_set(index)
+                suggestions.see(index)
+                break
+
+    def move(step):
+        if matches:
+            current = suggestions.curselection()
+            index = min(max((current[0] if current else -1) + step, 0), len(matches) - 1)
+            suggestions.selection_clear(0, END)
+            suggestions.selection_set(index)
+            suggestions.see(index)
+        return 'break'
+
+    def check(Cid):
+        if not Cid:
+            mb.showerror('Issuer ID cannot be empty!', 'Please enter a valid Card ID.')
+            return
+
+        def checked(exists):
+            if not exists:
+                mb.showerror('Invalid Card ID', 'This Card ID is not registered. Please register as a student first.')
+            else:
+                then(Cid)
+
+        # Picked students and recently validated cards skip the database entirely. The picker's
+        # own index is asked first, so the card cache's hit rate only counts the lookups it serves.
+        if (students_by_prefix is not None and Cid in students_by_prefix) or store.is_cached_card(Cid):
+            then(Cid)
+            return
+
+        # Check if the card ID exists in Students table
+        worker.submit(store.load_card, Cid, on_done=checked)
+
+    def choose(event=None):
+        # The highlighted suggestion, or the text as typed (checked as a Card ID) when none is
+        current = suggestions.curselection()
+        Cid = matches[current[0]][0] if current else typed.get().strip()
+        dialog.destroy()
+        check(Cid)
+
+    typed.trace_add('write', suggest)
+    entry.bind('<Down>', lambda event: move(1))
+    entry.bind('<Up>', lambda event: move(-1))
+    entry.bind('<Return>', choose)
+    suggestions.bind('<Double-Button-1>', choose)
+    dialog.bind('<Escape>', lambda event: dialog.destroy())
+    Button(buttons, text='OK', font=btn_font, bg=btn_hlb_bg, width=10, command=choose).pack(side=LEFT, padx=5)
+    Button(buttons, text='Cancel', font=btn_font, bg=btn_hlb_bg, width=10, command=dialog.destroy).pack(side=LEFT)
+    entry.focus_set()
+    dialog.grab_set()
+
+def table_size(state):
+    # Rows the scrollbar stands for: the whole table when its total is known, else those loaded
+    if state['done']:
+        return len(state['model'])
+    return max(len(state['model']), state['total'] or 0)
+
+def render(view, state, to_values, load_next):
+    # Draw the model rows that fit in the view, starting at state['top']
+    model = state['model']
+    rows = state['rows']
+    target = state['target']
+    if target is not None:
+        state['top'] = target
+        if state['done'] or target + rows <= len(model):
+            state['target'] = target = None
+    top = state['top'] = max(0, min(state['top'], len(model) - rows))
+    view.delete(*view.get_children())
+    for record in model.window(top, top + rows):
+        view.insert('', END, iid=record.key, values=to_values(record))
+    if state['selected'] is not None and view.exists(state['selected']):
+        view.selection_set(state['selected'])
+        view.focus(state['selected'])
+    # Until a drag target is reached, the last loaded rows are drawn but the thumb stays put
+    shown = top if target is None else target
+    size = table_size(state)
+    if size:
+        state['scrollbar'].set(shown / size, min(1.0, (shown + rows) / size))
+    else:
+        state['scrollbar'].set(0.0, 1.0)
+    # Fetch another page once fewer than PREFETCH_ROWS loaded rows remain below the window
+    if not state['done'] and not state['loading'] and top + rows + PREFETCH_ROWS > len(model):
+        root.after_idle(load_next)
+
+def render_books():
+    render(tree, book_pages, book_values, load_book_page)
+
+def render_students():
+    render(student_tree, student_pages, student_values, load_student_page)
+
+def load_page(state, fetch, redraw):
+    if state['done'] or state['loading']:
+        return
+    state['loading'] = True
+    generation = state['generation']
+
+    def show(rows):
+        if generation != state['generation']:
+            return
+        state['loading'] = False
+        state['model'].append_rows(rows)
+        if rows:
+            state['last_row'] = rows[-1]
+        state['done'] = len(rows) < PAGE_SIZE
+        redraw()
+
+    def failed(error):
+        if generation == state['generation']:
+            state['loading'] = False
+        show_db_error(error)
+
+    worker.submit(fetch, state['last_row'], PAGE_SIZE, state['sort'], state['filters'],
+                  on_done=show, on_error=failed)
+
+def reset_pages(state, redraw):
+    state['model'].clear()
+    state.update(top=0, selected=None, last_row=None, done=False, loading=False, total=None, target=None,
+                 filtered=bool(state['filters']) or state['sort'] is not None,
+                 generation=state['generation'] + 1)
+    redraw()
+
+def load_book_page():
+    load_page(book_pages, store.list_books, render_books)
+
+def load_student_page():
+    load_page(student_pages, store.list_students, render_students)
+
+def load_book_total():
+    # The status counters add up to the number of books, without counting the catalog
+    generation = book_pages['generation']
+
+    def show(counters):
+        if generation == book_pages['generation']:
+            book_pages['total'] = sum(value for _, value in counters['status'])
+            render_books()
+
+    worker.submit(store.counters, on_done=show)
+
+def scroll_table(state, redraw, *args):
+    # Scrollbar command protocol: ('moveto', fraction) or ('scroll', count, 'units' or 'pages')
+    if args[0] == 'moveto':
+        # Past the loaded rows, render() keeps fetching pages until the row is loaded
+        state['top'] = state['target'] = int(float(args[1]) * table_size(state))
     else:
-        return Cid
+        state['target'] = None
+        state['top'] += int(args[1]) * (state['rows'] if args[2] == 'pages' else 1)
+    redraw()
+
+def wheel_scroll(event, state, redraw):
+    # <MouseWheel> on Windows/macOS, <Button-4>/<Button-5> on X11
+    up = event.num == 4 or getattr(event, 'delta', 0) > 0
+    scroll_table(state, redraw, 'scroll', -WHEEL_ROWS if up else WHEEL_ROWS, 'units')
+    return 'break'
+
+def key_scroll(view, state, redraw, step):
+    # Arrow keys past the first or last drawn row move the window instead of stopping
+    children = view.get_children()
+    if view.focus() not in children:
+        return None
+    index = children.index(view.focus()) + step
+    if 0 <= index < len(children):
+        return None  # the Treeview moves the selection itself
+    position = state['top'] + index
+    if 0 <= position < len(state['model']):
+        state['target'] = None
+        state['top'] += step
+        state['selected'] = state['model'].keys[position]
+        redraw()
+    return 'break'
+
+def resize_table(event, state, redraw):
+    # Draw as many rows as fit below the headings
+    row_height = int(ttk.Style().lookup('Treeview', 'rowheight') or 20)
+    rows = max(1, (event.height - row_height - 6) // row_height)
+    if rows != state['rows']:
+        state['rows'] = rows
+        redraw()
+
+def remember_selection(view, state):
+    # Selections are only ever set by clicks and keys here; redraws re-apply them
+    if view.selection():
+        state['selected'] = view.selection()[0]
+
+def bind_table(view, scrollbar, state, redraw):
+    state['scrollbar'] = scrollbar
+    scrollbar.configure(command=lambda *args: scroll_table(state, redraw, *args))
+    view.bind('<Configure>', lambda event: resize_table(event, state, redraw))
+    view.bind('<<TreeviewSelect>>', lambda event: remember_selection(view, state))
+    for sequence in ('<MouseWheel>', '<Button-4>', '<Button-5>'):
+        view.bind(sequence, lambda event: wheel_scroll(event, state, redraw))
+    view.bind('<Up>', lambda event: key_scroll(view, state, redraw, -1))
+    view.bind('<Down>', lambda event: key_scroll(view, state, redraw, 1))
+
+def apply_changes(state, fetch, redraw, keys, on_rows=None):
+    # Re-read only the given keys and patch the model; only the drawn rows are redrawn.
+    # on_rows(keys, rows) also gets the rows read, whether or not the table still shows them.
+    keys = [str(key) for key in keys if key]
+    if not keys:
+        return
+    generation = state['generation']
+
+    def patch(found):
+        if on_rows:
+            on_rows(keys, found)
+        if generation != state['generation']:
+            return  # a full reload has replaced the table meanwhile
+        model = state['model']
+        rows = {str(row[model.record_type.key_index]): row for row in found}
+        for key in keys:
+            row = rows.get(key)
+            if row is None:
+                model.remove(key)
+                if state['selected'] == key:
+                    state['selected'] = None
+            elif key in model:
+                model.update_row(row)
+            elif state['filtered']:
+                continue
+            elif state['done'] or (model.keys and key < model.keys[-1]):
+                # Rows past the loaded window are picked up by the next page instead
+                model.insert_sorted(row)
+        redraw()
+
+    worker.submit(fetch, keys, on_done=patch)
+
+def refresh_books(*bk_ids):
+    apply_changes(book_pages, store.get_books, render_books, bk_ids)
+
+def refresh_students(*card_ids):
+    apply_changes(student_pages, store.get_students, render_students, card_ids, patch_students_by_prefix)
+
+def build_students_by_prefix(conn):
+    return student_index.StudentIndex(store.student_directory(conn))
+
+def load_students_by_prefix():
+    # One query, built on a worker thread; after that every student this desk adds, edits or
+    # deletes, or sees change at another desk, goes through refresh_students and is patched in
+    def loaded(index):
+        global students_by_prefix
+        students_by_prefix = index
+
+    worker.submit(build_students_by_prefix, on_done=loaded)
+
+def patch_students_by_prefix(card_ids, rows):
+    if students_by_prefix is None:
+        return
+    found = {row[0]: row for row in rows}
+    for card_id in card_ids:
+        if card_id in found:
+            students_by_prefix.put(found[card_id])
+        else:
+            students_by_prefix.remove(card_id)
+
+students_by_prefix = None
 
 def display_records():
-    tree.delete(*tree.get_children())
-    cursor.execute('SELECT BK_NAME, BK_ID, AUTHOR_NAME, GENRE, BK_STATUS, CARD_ID FROM Library')
-    data = cursor.fetchall()
-    for record in data:
-        tree.insert('', END, values=record)
+    if search_var.get().strip():
+        search_records()
+        return
+    reset_pages(book_pages, render_books)
+    load_book_page()
+    if not book_pages['filters']:
+        load_book_total()
+
+def search_records():
+    text = search_var.get()
+    reset_pages(book_pages, render_books)
+    # Results replace the paged view until the search box is cleared
+    book_pages.update(done=True, filtered=True)
+    generation = book_pages['generation']
+
+    def show(rows):
+        if generation != book_pages['generation']:
+            return  # a newer search or reload has started
+        book_pages['model'].append_rows(rows)
+        render_books()
+
+    worker.submit(store.search_books, text, SEARCH_LIMIT, on_done=show)
+
+def schedule_search(*args):
+    # Debounce keystrokes so only the last one in each burst hits the database
+    global search_after_id
+    if search_after_id is not None:
+        root.after_cancel(search_after_id)
+    search_after_id = root.after(SEARCH_DELAY_MS, run_search)
+
+def run_search():
+    global search_after_id
+    search_after_id = None
+    display_records()
+
+search_after_id = None
 
 def display_students():
-    student_tree.delete(*student_tree.get_children())
-    cursor.execute('SELECT * FROM Students')
-    data = cursor.fetchall()
-    for record in data:
-        student_tree.insert('', END, values=record)
+    reset_pages(student_pages, render_students)
+    load_student_page()
+
+def show_headings(view, state, headings, summary_var):
+    # Mark the sort column with an arrow and filtered columns with an asterisk
+    for heading, column in headings.items():
+        text = heading
+        if state['sort'] and state['sort'][0] == column:
+            text += ' \u25bc' if state['sort'][1] else ' \u25b2'
+        if column in state['filters']:
+            text += ' *'
+        view.heading(heading, text=text)
+    summary_var.set(', '.join(f"{heading} = {NO_CARD if state['filters'][column] is None else state['filters'][column]}"
+                              for heading, column in headings.items() if column in state['filters']))
+
+def sort_by(view, state, headings, summary_var, heading, reload):
+    # First click sorts ascending, clicking the same heading again flips the direction
+    column = headings[heading]
+    if state['sort'] and state['sort'][0] == column:
+        state['sort'] = (column, not state['sort'][1])
+    else:
+        state['sort'] = (column, False)
+    show_headings(view, state, headings, summary_var)
+    reload()
+
+def filter_by(event, view, state, headings, summary_var, reload):
+    # Right-click a heading to show only rows with that exact value; blank removes the filter
+    if view.identify_region(event.x, event.y) != 'heading':
+        return
+    index = int(view.identify_column(event.x)[1:]) - 1
+    if index < 0:
+        return
+    heading = view['columns'][index]
+    column = headings[heading]
+    value = sd.askstring('Filter', f'Show only rows where {heading} is:\n(leave blank to show all)',
+                         initialvalue=state['filters'].get(column) or '')
+    if value is None:
+        return
+    value = value.strip()
+    if not value:
+        state['filters'].pop(column, None)
+    elif column == 'CARD_ID':
+        state['filters'][column] = stored_card(value)
+    else:
+        state['filters'][column] = value
+    show_headings(view, state, headings, summary_var)
+    reload()
+
+def clear_filters(view, state, headings, summary_var, reload):
+    state['filters'] = {}
+    state['sort'] = None
+    show_headings(view, state, headings, summary_var)
+    reload()
 
 def clear_fields():
     bk_status.set('Available')
-    bk_id.set(generate_next_book_id())
+    worker.submit(store.next_book_id, on_done=bk_id.set)
     bk_name.set('')
     author_name.set('')
     card_id.set('')
     genre_var.set('')
     bk_id_entry.config(state='readonly')
     bk_id_entry.config(state='normal')
-    try:
-        tree.selection_remove(tree.selection()[0])
-    except:
-        pass
+    book_pages['selected'] = None
+    tree.selection_set(())
 
 def clear_student_fields():
     for var in [student_name_var, student_email_var, student_course_var]:
         var.set('')
     student_year_var.set(0)
-    lib_id_preview.set(generate_next_card_id())
+    worker.submit(store.next_card_id, on_done=lib_id_preview.set)
+    student_pages['selected'] = None
+    student_tree.selection_set(())
+
+def start_sync():
+    # Start from the newest change, then load the tables: anything written after that
+    # point is applied by poll_changes, even if it lands while the first pages load
+    def start(position):
+        global change_cursor
+        change_cursor = change_feed.ChangeCursor(position)
+        clear_and_display()
+        root.after(SYNC_INTERVAL_MS, poll_changes)
 
-    try:
-        student_tree.selection_remove(student_tree.selection()[0])
-    except:
-        pass
+    def failed(error):
+        show_db_error(error)
+        clear_and_display()
 
+    worker.submit(store.last_change_id, on_done=start, on_error=failed)
+
+def poll_changes():
+    # One small indexed query per poll; only the rows named in new entries are re-read.
+    # A desk's own writes come back here too, which costs one redundant refresh.
+    def apply(changes):
+        fresh = change_cursor.advance(changes)
+        for table, keys in change_cursor.keys_by_table(fresh).items():
+            if table == 'Library' and '*' in keys:
+                display_records()
+            elif table == 'Library':
+                refresh_books(*keys)
+            elif table == 'Students' and '*' in keys:
+                display_students()
+                load_students_by_prefix()
+            elif table == 'Students':
+                refresh_students(*keys)
+        root.after(0 if len(changes) == SYNC_LIMIT else SYNC_INTERVAL_MS, poll_changes)
+
+    def failed(error):
+        # Retried on the next poll rather than shown as a dialog every few seconds
+        busy_var.set(f'Sync paused: {error}')
+        root.after(SYNC_INTERVAL_MS, poll_changes)
+
+    worker.submit(store.changes_since, change_cursor.position, SYNC_LIMIT, change_cursor.missing(),
+                  on_done=apply, on_error=failed)
+
+change_cursor = None
+
+# Full reload of both tables; actions use refresh_books()/refresh_students() instead
 def clear_and_display():
     clear_fields()
     clear_student_fields()
@@ -110,138 +545,270 @@ def clear_and_display():
     display_students()
 
 
-def generate_next_card_id():
-    cursor.execute("SELECT MAX(Card_ID) FROM Students")
-    last_id = cursor.fetchone()[0]
-    if last_id:
-        # Correctly extract the numeric part, skipping "LIB-"
-        num = int(last_id[4:]) + 1  # Now starts after 'LIB-'
-        return f"LIB-{num:04d}"
-    else:
-        return "LIB-0001"  # First student
-
 def add_record():
     if not (bk_name.get() and author_name.get() and genre_var.get()):
         mb.showerror("Error", "Please fill all fields including genre!")
         return
-        
-    if bk_status.get() == 'Issued':
-        card_id_val = issuer_card()
-        if not card_id_val:
+
+    def confirm(card):
+        card_id.set(card)
+        surety = mb.askyesno('Are you sure?',
+            'Are you sure you want to add this book?\nNote: Book ID cannot be changed later.')
+        if not surety:
             return
-        card_id.set(card_id_val)
+
+        values = (bk_name.get(), bk_id.get(), author_name.get(), 
+                 genre_var.get(), bk_status.get(), stored_card(card_id.get()))
+
+        def added(_):
+            clear_fields()
+            refresh_books(values[1])
+            if values[4] == 'Issued':
+                mb.showinfo('Success', f'Book added successfully! It is due back on {storage.due_date()}.')
+            else:
+                mb.showinfo('Success', 'Book added successfully!')
+
+        def failed(error):
+            if isinstance(error, storage.IntegrityError):
+                mb.showerror('Error', 'This Book ID already exists!')
+            else:
+                show_db_error(error)
+
+        worker.submit(store.add_book, values, on_done=added, on_error=failed)
+
+    if bk_status.get() == 'Issued':
+        issuer_card(confirm)
     else:
-        card_id.set('N/A')
-
-    surety = mb.askyesno('Are you sure?',
-        'Are you sure you want to add this book?\nNote: Book ID cannot be changed later.')
-
-    if surety:
-        try:
-            values = (bk_name.get(), bk_id.get(), author_name.get(), 
-                     genre_var.get(), bk_status.get(), card_id.get())
-            cursor.execute('''
-                INSERT INTO Library 
-                (BK_NAME, BK_ID, AUTHOR_NAME, GENRE, BK_STATUS, CARD_ID) 
-                VALUES (%s, %s, %s, %s, %s, %s)
-            ''', values)
-            connector.commit()
-            clear_and_display()
-            mb.showinfo('Success', 'Book added successfully!')
-        except mysql.connector.IntegrityError:
-            mb.showerror('Error', 'This Book ID already exists!')
+        confirm(NO_CARD)
 
 def view_record():
-    if not tree.selection():
+    book = selected_book()
+    if book is None:
         mb.showerror('Error', 'Please select a book!')
         return
-        
-    selected = tree.focus()
-    values = tree.item(selected)['values']
-    bk_name.set(values[0])
-    bk_id.set(values[1])
-    author_name.set(values[2])
-    genre_var.set(values[3])  # Set genre from record
-    bk_status.set(values[4])
-    card_id.set(values[5])
+
+    # Read from the model, so IDs keep their exact text (Tk would turn '0012' into 12)
+    bk_name.set(book.name)
+    bk_id.set(book.bk_id)
+    author_name.set(book.author)
+    genre_var.set(book.genre or '')
+    bk_status.set(book.status)
+    card_id.set(NO_CARD if book.card_id is None else book.card_id)
 
 def update_record():
-    if not tree.selection():
+    book = selected_book()
+    if book is None:
         mb.showerror('Select a row!', 'Please select a record to update.')
         return
         
     view_record()
     
-    def update():
-        if bk_status.get() == 'Issued':
-            card_id_val = issuer_card()
-            if not card_id_val:
-                return
-            card_id.set(card_id_val)
-        else:
-            card_id.set('N/A')
-
-        cursor.execute('''
-            UPDATE Library SET 
-            BK_NAME=%s, BK_STATUS=%s, AUTHOR_NAME=%s, GENRE=%s, CARD_ID=%s 
-            WHERE BK_ID=%s
-        ''', (bk_name.get(), bk_status.get(), author_name.get(), 
-              genre_var.get(), card_id.get(), bk_id.get()))
-        connector.commit()
-        clear_and_display()
+    def finish():
+        clear_fields()
         edit.destroy()
         bk_id_entry.config(state='normal')
         clear.config(state='normal')
 
+    def update():
+        def save(card):
+            card_id.set(card)
+            values = (bk_name.get(), bk_status.get(), author_name.get(),
+                      genre_var.get(), stored_card(card_id.get()), bk_id.get())
+
+            def saved(_):
+                refresh_books(values[5])
+                finish()
+
+            def failed(error):
+                if isinstance(error, storage.ConflictError):
+                    finish()
+                    show_conflict(error, values[5])
+                else:
+                    show_db_error(error)
+
+            # Only saved if nobody else has changed the book since this desk loaded it
+            worker.submit(store.update_book, values, book.version, on_done=saved, on_error=failed)
+
+        if bk_status.get() == 'Issued':
+            issuer_card(save)
+        else:
+            save(NO_CARD)
+
     bk_id_entry.config(state='disabled')
     clear.config(state='disabled')
     edit = Button(left_frame, text='Update Record', font=btn_font, bg=btn_hlb_bg, width=20, command=update)
     edit.place(x=50, y=425)
 
 def remove_record():
-    if not tree.selection():
+    book = selected_book()
+    if book is None:
         mb.showerror('Error!', 'Please select a book to delete.')
         return
-    selected = tree.focus()
-    values = tree.item(selected)['values']
-    cursor.execute('DELETE FROM Library WHERE BK_ID=%s', (values[1],))
-    connector.commit()
-    tree.delete(selected)
-    mb.showinfo('Deleted', 'Record deleted successfully.')
-    clear_and_display()
+
+    def deleted(_):
+        refresh_books(book.bk_id)
+        mb.showinfo('Deleted', 'Record deleted successfully.')
+        clear_fields()
+
+    worker.submit(store.delete_book, book.bk_id, on_done=deleted)
 
 def delete_inventory():
     if mb.askyesno('Are you sure?', 'Do you really want to delete the entire inventory?'):
-        tree.delete(*tree.get_children())
-        cursor.execute('DELETE FROM Library')
-        connector.commit()
-        mb.showinfo('Inventory Cleared', 'All books have been deleted from inventory.')
+        def deleted(_):
+            reset_pages(book_pages, render_books)
+            mb.showinfo('Inventory Cleared', 'All books have been deleted from inventory.')
+
+        worker.submit(store.delete_all_books, on_done=deleted)
 
 def change_availability():
-    if not tree.selection():
+    book = selected_book()
+    if book is None:
         mb.showerror('Error!', 'Please select a book from the database')
         return
 
-    selected = tree.focus()
-    values = tree.item(selected)['values']
-    BK_id = values[1]
-    BK_status = values[4]  # Updated index to account for genre
+    BK_id = book.bk_id
+    BK_status = book.status
 
+    def changed(message):
+        refresh_books(BK_id)
+        clear_fields()
+        mb.showinfo('Success', message)
+
+    def failed(error):
+        if isinstance(error, storage.ConflictError):
+            clear_fields()
+            show_conflict(error, BK_id)
+        else:
+            show_db_error(error)
+
+    # The status shown here is passed as the expected one, so if another desk issued or
+    # returned the book meanwhile nothing is changed and the librarian is told
     if BK_status == 'Issued':
         if mb.askyesno('Return Confirmed?', 'Has the book been returned?'):
-            cursor.execute('UPDATE Library SET BK_STATUS=%s, CARD_ID=%s WHERE BK_ID=%s', ('Available', 'N/A', BK_id))
-            connector.commit()
-            mb.showinfo('Success', 'Book has been returned and marked as Available.')
+            worker.submit(store.set_availability, BK_id, 'Available', None, BK_status,
+                          on_done=lambda _: changed('Book has been returned and marked as Available.'),
+                          on_error=failed)
         else:
             mb.showinfo('Not returned', 'Cannot mark as Available until returned.')
     else:
-        new_card = issuer_card()
-        if new_card:
-            cursor.execute('UPDATE Library SET BK_STATUS=%s, CARD_ID=%s WHERE BK_ID=%s', ('Issued', new_card, BK_id))
-            connector.commit()
-            mb.showinfo('Success', 'Book has been issued successfully.')
+        def issue(new_card):
+            worker.submit(store.set_availability, BK_id, 'Issued', new_card, BK_status,
+                          on_done=lambda _: changed(f'Book has been issued successfully. '
+                                                    f'It is due back on {storage.due_date()}.'),
+                          on_error=failed)
+
+        issuer_card(issue)
+
+def scanned_book_ids():
+    # Book IDs typed or scanned into the batch box: one per line, or separated by spaces/commas
+    return list(dict.fromkeys(re.findall(r'[^\s,;]+', batch_text.get('1.0', END).upper())))
+
+def circulate_batch(status):
+    bk_ids = scanned_book_ids()
+    if not bk_ids:
+        mb.showerror('Error!', 'Please scan or enter at least one Book ID.')
+        return
+    Cid = batch_card_var.get().strip()
+    if status == 'Issued' and not Cid:
+        mb.showerror('Issuer ID cannot be empty!', 'Please enter the Card ID to issue these books to.')
+        return
+
+    def done(count):
+        refresh_books(*bk_ids)
+        batch_text.delete('1.0', END)
+        batch_card_var.set('')
+        batch_result_var.set(f"{count} book(s) {'issued to ' + Cid if status == 'Issued' else 'returned'}.")
 
-    clear_and_display()
+    def failed(error):
+        if isinstance(error, storage.CirculationError):
+            batch_result_var.set('Nothing was saved:\n' + '\n'.join(error.problems[:15]))
+        else:
+            show_db_error(error)
+
+    batch_result_var.set('')
+    worker.submit(store.circulate, bk_ids, status, Cid or None, on_done=done, on_error=failed)
+
+def show_statistics():
+    first, last = stats_from_var.get().strip(), stats_to_var.get().strip()
+    for period in (first, last):
+        if period and not re.fullmatch(r'\d{4}-\d{2}', period):
+            mb.showerror('Error!', 'Periods must be written as YYYY-MM, or left blank.')
+            return
+
+    def show(stats):
+        for view, rows in ((stats_books_tree, stats['books']), (stats_genres_tree, stats['genres']),
+                           (stats_students_tree, stats['students'])):
+            view.delete(*view.get_children())
+            for record in rows:
+                view.insert('', END, values=record)
+
+    worker.submit(store.loan_stats, first or None, last or None, STATS_LIMIT, on_done=show)
+
+def show_dashboard():
+    # Reads only the counter rows (storage.counters), never the catalog itself
+    def show(counters):
+        statuses = dict(counters['status'])
+        dashboard_var.set(f"{sum(statuses.values())} books: {statuses.get('Available', 0)} available, "
+                          f"{statuses.get('Issued', 0)} issued")
+        for view, rows in ((dash_genres_tree, counters['genre']), (dash_courses_tree, counters['course'])):
+            view.delete(*view.get_children())
+            for record in rows:
+                view.insert('', END, values=record)
+
+    worker.submit(store.counters, on_done=show)
+
+def refresh_dashboard():
+    if notebook.select() == str(dashboard_frame):
+        show_dashboard()
+    root.after(DASHBOARD_REFRESH_MS, refresh_dashboard)
+
+def reconcile_dashboard():
+    def done(corrected):
+        show_dashboard()
+        mb.showinfo('Recounted', f'{corrected} counter(s) corrected.')
+
+    worker.submit(store.reconcile_counters, on_done=done)
+
+def show_diagnostics():
+    # Timings are collected in memory by store.stats, so no query is needed to show them
+    for view, rows in ((diag_queries_tree, store.stats.query_summary()), (diag_sites_tree, store.stats.site_summary())):
+        view.delete(*view.get_children())
+        for record in rows:
+            view.insert('', END, values=tuple(f'{value:.1f}' if isinstance(value, float) else value
+                                              for value in record))
+    cards = store.valid_cards.stats()
+    card_cache_var.set(f'Issuer card cache: {cards["size"]} cards, {cards["hits"]} hits, '
+                       f'{cards["misses"]} misses ({cards["hit_rate"]:.0%} hit rate)')
+
+def reset_diagnostics():
+    store.stats.reset()
+    show_diagnostics()
+
+def write_metrics():
+    try:
+        store.stats.write_metrics(db.METRICS_FILE)
+    except OSError as error:
+        busy_var.set(f'Could not write {db.METRICS_FILE}: {error}')
+    root.after(db.METRICS_INTERVAL_MS, write_metrics)
+
+def tab_selected(event):
+    if notebook.select() == str(dashboard_frame):
+        show_dashboard()
+    elif notebook.select() == str(stats_frame):
+        show_statistics()
+    elif notebook.select() == str(diagnostics_frame):
+        show_diagnostics()
+
+def stats_table(parent, title, columns, widths, side=LEFT):
+    frame = Frame(parent)
+    frame.pack(side=side, fill=BOTH, expand=True, padx=5)
+    Label(frame, text=title, bg=rbf_bg, font=("Noto Sans CJK TC", 13, 'bold')).pack(fill=X)
+    view = ttk.Treeview(frame, selectmode=BROWSE, columns=columns, show='headings')
+    for column, width in zip(columns, widths):
+        view.heading(column, text=column, anchor=CENTER)
+        view.column(column, width=width, stretch=NO)
+    view.pack(fill=BOTH, expand=True)
+    return view
 
 def add_student():
     student_name = student_name_var.get()
@@ -256,36 +823,34 @@ def add_student():
     # Generate the next Card ID
     new_card_id = lib_id_preview.get()
 
-    try:
-        cursor.execute("""
-            INSERT INTO Students (Card_ID, Name, Email, Course, Year)
-            VALUES (%s, %s, %s, %s, %s)
-        """, (new_card_id, student_name, student_email, student_course, student_year))
-        connector.commit()
+    def added(_):
         mb.showinfo("Success", f"Student added successfully. Card ID: {new_card_id}")
         clear_student_fields()
-        display_students()
-    except mysql.connector.IntegrityError:
-        mb.showerror('Error!', 'This student already exists.')
-    except Exception as e:
-        mb.showerror("Error", f"An error occurred: {str(e)}")
+        refresh_students(new_card_id)
+
+    def failed(error):
+        if isinstance(error, storage.IntegrityError):
+            mb.showerror('Error!', 'This student already exists.')
+        else:
+            mb.showerror("Error", f"An error occurred: {str(error)}")
+
+    worker.submit(store.add_student, (new_card_id, student_name, student_email, student_course, student_year),
+                  on_done=added, on_error=failed)
 
 selected_student_card_id = None
 
 def view_student():
     global selected_student_card_id
-    if not student_tree.selection():
+    student = selected_student()
+    if student is None:
         mb.showerror('Select a student!', 'To view a record, you must select it in the table.')
         return
 
-    current_item_selected = student_tree.focus()
-    selection = student_tree.item(current_item_selected)['values']
-
-    selected_student_card_id = selection[0]  # Save Card_ID globally
-    student_name_var.set(selection[1])
-    student_email_var.set(selection[2])
-    student_course_var.set(selection[3])
-    student_year_var.set(selection[4])
+    selected_student_card_id = student.card_id  # Save Card_ID globally
+    student_name_var.set(student.name)
+    student_email_var.set(student.email)
+    student_course_var.set(student.course)
+    student_year_var.set(student.year)
 
 def update_student():
     global selected_student_card_id
@@ -302,44 +867,35 @@ def update_student():
         mb.showerror("Error", "All fields are required!")
         return
 
-    try:
-        cursor.execute("""
-            UPDATE Students 
-            SET Name = %s, Email = %s, Course = %s, Year = %s 
-            WHERE Card_ID = %s
-        """, (student_name_val, student_email_val, student_course_val, student_year_val, card_id))
+    Cid = selected_student_card_id
 
-        connector.commit()
+    def updated(_):
         mb.showinfo("Success", "Student details updated successfully.")
         clear_student_fields()
-        display_students()
-    except Exception as e:
-        mb.showerror("Error", f"An error occurred: {str(e)}")
+        refresh_students(Cid)
+
+    worker.submit(store.update_student,
+                  (student_name_val, student_email_val, student_course_val, student_year_val, Cid),
+                  on_done=updated)
 
 def delete_student():
-    if not student_tree.selection():
+    student = selected_student()
+    if student is None:
         mb.showerror('Select a student!', 'To delete a record, you must select it in the table.')
         return
 
-    current_item_selected = student_tree.focus()
-    values_in_selected_item = student_tree.item(current_item_selected)
-    selection = values_in_selected_item['values']
-
-    cursor.execute('DELETE FROM Students WHERE Card_ID = %s', (selection[0],))
-    connector.commit()
+    def deleted(_):
+        mb.showinfo('Success', 'Student record deleted successfully.')
+        clear_student_fields()
+        refresh_students(student.card_id)
 
-    mb.showinfo('Success', 'Student record deleted successfully.')
-    clear_student_fields()
-    display_students()
+    def failed(error):
+        if isinstance(error, storage.IntegrityError):
+            mb.showerror('Error!', 'This student still has books issued. Return them before deleting the record.')
+        else:
+            show_db_error(error)
 
-def generate_next_book_id():
-    cursor.execute("SELECT MAX(BK_ID) FROM Library")
-    last_id = cursor.fetchone()[0]
-    if last_id:
-        num = int(last_id[3:]) + 1  # Skip 'BK-'
-        return f"BK-{num:04d}"
-    else:
-        return "BK-0001"
+    worker.submit(store.delete_student, student.card_id, on_done=deleted, on_error=failed)
 
 # GUI Config
 lf_bg = 'LightSkyBlue'
@@ -351,193 +907,328 @@ lbl_font = ('Georgia', 13)
 entry_font = ('Times New Roman', 12)
 btn_font = ('Gill Sans MT', 13)
 
-root = Tk()
-root.title('PythonGeeks Library Management System')
-root.geometry('1200x650')
-root.resizable(0, 0)
-
-# Variables
-bk_status = StringVar(value='Available')
-bk_name = StringVar()
-bk_id = StringVar()
-author_name = StringVar()
-card_id = StringVar()
-genre_var = StringVar()
-
-student_name_var = StringVar()
-student_email_var = StringVar()
-student_course_var = StringVar()
-student_year_var = IntVar()
-lib_id_preview = StringVar()
-
-# Main container
-main_container = Frame(root)
-main_container.pack(fill=BOTH, expand=True)
-
-# Header
-header = Frame(main_container, bg=btn_hlb_bg)
-header.pack(fill=X)
-Label(header, text='LIBRARY MANAGEMENT SYSTEM', font=("Noto Sans CJK TC", 15, 'bold'), bg=btn_hlb_bg, fg='White').pack(pady=10)
-
-# Notebook for tabs
-notebook = ttk.Notebook(main_container)
-notebook.pack(fill=BOTH, expand=True)
-
-# Book Management Frame
-book_frame = Frame(notebook)
-notebook.add(book_frame, text='Book Management')
-
-# Student Management Frame
-student_frame = Frame(notebook)
-notebook.add(student_frame, text='Student Management')
-
-# ========== Book Management Tab ==========
-# Left Frame (Book Form)
-left_frame = Frame(book_frame, bg=lf_bg)
-left_frame.pack(side=LEFT, fill=Y, padx=10, pady=10)
-
-# Right Frame (Book List)
-right_frame = Frame(book_frame)
-right_frame.pack(side=LEFT, fill=BOTH, expand=True, padx=10, pady=10)
-
-# Top Right Buttons (Book Management)
-button_frame = Frame(right_frame, bg=rtf_bg)
-button_frame.pack(fill=X)
-
-Button(button_frame, text='Delete book record', font=btn_font, bg=btn_hlb_bg, width=17, command=remove_record).pack(side=LEFT, padx=5, pady=5)
-Button(button_frame, text='Delete full inventory', font=btn_font, bg=btn_hlb_bg, width=17, command=delete_inventory).pack(side=LEFT, padx=5, pady=5)
-Button(button_frame, text='Update book details', font=btn_font, bg=btn_hlb_bg, width=17, command=update_record).pack(side=LEFT, padx=5, pady=5)
-Button(button_frame, text='Change Book Availability', font=btn_font, bg=btn_hlb_bg, width=19, command=change_availability).pack(side=LEFT, padx=5, pady=5)
-
-# Book Form (Left Frame)
-Label(left_frame, text='Book Details', bg=lf_bg, font=("Arial", 14, 'bold')).pack(pady=10)
-
-Label(left_frame, text='Book Name', bg=lf_bg, font=lbl_font).pack()
-Entry(left_frame, width=25, font=entry_font, textvariable=bk_name).pack(pady=5)
-
-Label(left_frame, text='Book ID', bg=lf_bg, font=lbl_font).pack()
-bk_id_entry = Entry(left_frame, width=25, font=entry_font, textvariable=bk_id)
-bk_id_entry.pack(pady=5)
-
-Label(left_frame, text='Author Name', bg=lf_bg, font=lbl_font).pack()
-Entry(left_frame, width=25, font=entry_font, textvariable=author_name).pack(pady=5)
-
-# Genre Combobox
-Label(left_frame, text='Genre', bg=lf_bg, font=lbl_font).pack()
-genre_combo = ttk.Combobox(left_frame, textvariable=genre_var, values=COMMON_GENRES)
-genre_combo.pack(pady=5)
-genre_combo.config(font=entry_font, width=22)
-
-Label(left_frame, text='Status', bg=lf_bg, font=lbl_font).pack()
-OptionMenu(left_frame, bk_status, 'Available', 'Issued').pack(pady=5)
-
-submit = Button(left_frame, text='Add new record', font=btn_font, bg=btn_hlb_bg, width=20, command=add_record)
-submit.pack(pady=10)
-
-clear = Button(left_frame, text='Clear fields', font=btn_font, bg=btn_hlb_bg, width=20, command=clear_fields)
-clear.pack(pady=10)
-
-# Book Treeview (Right Frame)
-Label(right_frame, text='BOOK INVENTORY', bg=rbf_bg, font=("Noto Sans CJK TC", 15, 'bold')).pack(fill=X)
-
-tree_frame = Frame(right_frame)
-tree_frame.pack(fill=BOTH, expand=True)
-
-tree = ttk.Treeview(tree_frame, selectmode=BROWSE, 
-                   columns=('Book Name', 'Book ID', 'Author', 'Genre', 'Status', 'Issuer Card ID'))
-
-scroll_y = ttk.Scrollbar(tree_frame, orient=VERTICAL, command=tree.yview)
-scroll_y.pack(side=RIGHT, fill=Y)
-
-scroll_x = ttk.Scrollbar(tree_frame, orient=HORIZONTAL, command=tree.xview)
-scroll_x.pack(side=BOTTOM, fill=X)
-
-tree.configure(yscrollcommand=scroll_y.set, xscrollcommand=scroll_x.set)
-
-tree.heading('Book Name', text='Book Name', anchor=CENTER)
-tree.heading('Book ID', text='Book ID', anchor=CENTER)
-tree.heading('Author', text='Author', anchor=CENTER)
-tree.heading('Genre', text='Genre', anchor=CENTER)
-tree.heading('Status', text='Status', anchor=CENTER)
-tree.heading('Issuer Card ID', text='Issuer Card ID', anchor=CENTER)
-
-tree.column('#0', width=0, stretch=NO)
-tree.column('#1', width=200, stretch=NO)
-tree.column('#2', width=100, stretch=NO)
-tree.column('#3', width=150, stretch=NO)
-tree.column('#4', width=120, stretch=NO)
-tree.column('#5', width=120, stretch=NO)
-tree.column('#6', width=150, stretch=NO)
-
-tree.pack(fill=BOTH, expand=True)
-
-# ========== Student Management Tab ==========
-# Left Frame (Student Form)
-student_left_frame = Frame(student_frame, bg=lf_bg)
-student_left_frame.pack(side=LEFT, fill=Y, padx=10, pady=10)
-
-# Right Frame (Student List)
-student_right_frame = Frame(student_frame)
-student_right_frame.pack(side=LEFT, fill=BOTH, expand=True, padx=10, pady=10)
-
-# Student Form (Left Frame)
-Label(student_left_frame, text='Student Details', bg=lf_bg, font=("Arial", 14, 'bold')).pack(pady=10)
-
-Label(student_left_frame, text='Library ID (Auto)', bg=lf_bg, font=lbl_font).pack()
-Entry(student_left_frame, width=25, font=entry_font, textvariable=lib_id_preview, state='readonly').pack(pady=5)
-
-Label(student_left_frame, text='Student Name', bg=lf_bg, font=lbl_font).pack()
-Entry(student_left_frame, width=25, font=entry_font, textvariable=student_name_var).pack(pady=5)
-
-Label(student_left_frame, text='Student Email', bg=lf_bg, font=lbl_font).pack()
-Entry(student_left_frame, width=25, font=entry_font, textvariable=student_email_var).pack(pady=5)
-
-Label(student_left_frame, text='Student Course', bg=lf_bg, font=lbl_font).pack()
-Entry(student_left_frame, width=25, font=entry_font, textvariable=student_course_var).pack(pady=5)
-
-Label(student_left_frame, text='Student Year', bg=lf_bg, font=lbl_font).pack()
-Entry(student_left_frame, width=25, font=entry_font, textvariable=student_year_var).pack(pady=5)
-
-add_student_btn = Button(student_left_frame, text='Add Student', font=btn_font, bg=btn_hlb_bg, width=20, command=add_student)
-add_student_btn.pack(pady=10)
-
-update_student_btn = Button(student_left_frame, text='Update Student', font=btn_font, bg=btn_hlb_bg, width=20, command=update_student)
-update_student_btn.pack(pady=10)
-
-delete_student_btn = Button(student_left_frame, text='Delete Student', font=btn_font, bg=btn_hlb_bg, width=20, command=delete_student)
-delete_student_btn.pack(pady=10)
-
-# Student Treeview (Right Frame)
-Label(student_right_frame, text='STUDENT RECORDS', bg=rbf_bg, font=("Noto Sans CJK TC", 15, 'bold')).pack(fill=X)
-
-student_tree_frame = Frame(student_right_frame)
-student_tree_frame.pack(fill=BOTH, expand=True)
-
-student_tree = ttk.Treeview(student_tree_frame, selectmode=BROWSE, columns=('Card ID', 'Name', 'Email', 'Course', 'Year'))
-
-student_scroll_y = ttk.Scrollbar(student_tree_frame, orient=VERTICAL, command=student_tree.yview)
-student_scroll_y.pack(side=RIGHT, fill=Y)
-
-student_scroll_x = ttk.Scrollbar(student_tree_frame, orient=HORIZONTAL, command=student_tree.xview)
-student_scroll_x.pack(side=BOTTOM, fill=X)
-
-student_tree.configure(yscrollcommand=student_scroll_y.set, xscrollcommand=student_scroll_x.set)
-
-student_tree.heading('Card ID', text='Card ID', anchor=CENTER)
-student_tree.heading('Name', text='Name', anchor=CENTER)
-student_tree.heading('Email', text='Email', anchor=CENTER)
-student_tree.heading('Course', text='Course', anchor=CENTER)
-student_tree.heading('Year', text='Year', anchor=CENTER)
-
-student_tree.column('#0', width=0, stretch=NO)
-student_tree.column('#1', width=150, stretch=NO)
-student_tree.column('#2', width=200, stretch=NO)
-student_tree.column('#3', width=250, stretch=NO)
-student_tree.column('#4', width=200, stretch=NO)
-student_tree.column('#5', width=100, stretch=NO)
-
-student_tree.pack(fill=BOTH, expand=True)
-
-# Start program
-clear_and_display()
-root.mainloop()
\ No newline at end of file
+# The database connection, schema upgrade and window are only set up when main.py is run
+# directly; importing it has no side effects. Scripts should use library.py instead.
+if __name__ == '__main__':
+    # DB_BACKEND in .env picks MySQL or the embedded SQLite backend
+    store = storage.open_storage()
+
+    # Create or upgrade the schema before anything else touches it
+    store.migrate()
+
+    root = Tk()
+    root.title('PythonGeeks Library Management System')
+    root.geometry('1200x650')
+    root.resizable(0, 0)
+
+    # Variables
+    bk_status = StringVar(value='Available')
+    bk_name = StringVar()
+    bk_id = StringVar()
+    author_name = StringVar()
+    card_id = StringVar()
+    genre_var = StringVar()
+
+    student_name_var = StringVar()
+    student_email_var = StringVar()
+    student_course_var = StringVar()
+    student_year_var = IntVar()
+    lib_id_preview = StringVar()
+    card_cache_var = StringVar()
+    busy_var = StringVar()
+    batch_card_var = StringVar()
+    batch_result_var = StringVar()
+    stats_from_var = StringVar()
+    stats_to_var = StringVar()
+    dashboard_var = StringVar()
+    search_var = StringVar()
+    search_var.trace_add('write', schedule_search)
+    book_filter_var = StringVar()
+    student_filter_var = StringVar()
+
+    worker = db.DbWorker(root, store, on_error=show_db_error, on_busy=show_busy)
+
+    # Main container
+    main_container = Frame(root)
+    main_container.pack(fill=BOTH, expand=True)
+
+    # Header
+    header = Frame(main_container, bg=btn_hlb_bg)
+    header.pack(fill=X)
+    Label(header, text='LIBRARY MANAGEMENT SYSTEM', font=("Noto Sans CJK TC", 15, 'bold'), bg=btn_hlb_bg, fg='White').pack(pady=10)
+    Label(header, textvariable=busy_var, font=lbl_font, bg=btn_hlb_bg, fg='White').place(relx=0.01, rely=0.5, anchor=W)
+    Button(header, text='Reload all', font=btn_font, bg=rtf_bg, command=clear_and_display).place(relx=0.99, rely=0.5, anchor=E)
+    root.bind('<F5>', lambda event: clear_and_display())
+
+    # Notebook for tabs
+    notebook = ttk.Notebook(main_container)
+    notebook.pack(fill=BOTH, expand=True)
+
+    # Book Management Frame
+    book_frame = Frame(notebook)
+    notebook.add(book_frame, text='Book Management')
+
+    # Student Management Frame
+    student_frame = Frame(notebook)
+    notebook.add(student_frame, text='Student Management')
+
+    # Batch Circulation Frame
+    circulation_frame = Frame(notebook, bg=lf_bg)
+    notebook.add(circulation_frame, text='Batch Circulation')
+
+    # Dashboard Frame
+    dashboard_frame = Frame(notebook)
+    notebook.add(dashboard_frame, text='Dashboard')
+
+    # Statistics Frame
+    stats_frame = Frame(notebook)
+    notebook.add(stats_frame, text='Statistics')
+
+    # Diagnostics Frame
+    diagnostics_frame = Frame(notebook)
+    notebook.add(diagnostics_frame, text='Diagnostics')
+    notebook.bind('<<NotebookTabChanged>>', tab_selected)
+
+    # ========== Book Management Tab ==========
+    # Left Frame (Book Form)
+    left_frame = Frame(book_frame, bg=lf_bg)
+    left_frame.pack(side=LEFT, fill=Y, padx=10, pady=10)
+
+    # Right Frame (Book List)
+    right_frame = Frame(book_frame)
+    right_frame.pack(side=LEFT, fill=BOTH, expand=True, padx=10, pady=10)
+
+    # Top Right Buttons (Book Management)
+    button_frame = Frame(right_frame, bg=rtf_bg)
+    button_frame.pack(fill=X)
+
+    Button(button_frame, text='Delete book record', font=btn_font, bg=btn_hlb_bg, width=17, command=remove_record).pack(side=LEFT, padx=5, pady=5)
+    Button(button_frame, text='Delete full inventory', font=btn_font, bg=btn_hlb_bg, width=17, command=delete_inventory).pack(side=LEFT, padx=5, pady=5)
+    Button(button_frame, text='Update book details', font=btn_font, bg=btn_hlb_bg, width=17, command=update_record).pack(side=LEFT, padx=5, pady=5)
+    Button(button_frame, text='Change Book Availability', font=btn_font, bg=btn_hlb_bg, width=19, command=change_availability).pack(side=LEFT, padx=5, pady=5)
+
+    # Book Form (Left Frame)
+    Label(left_frame, text='Book Details', bg=lf_bg, font=("Arial", 14, 'bold')).pack(pady=10)
+
+    Label(left_frame, text='Book Name', bg=lf_bg, font=lbl_font).pack()
+    Entry(left_frame, width=25, font=entry_font, textvariable=bk_name).pack(pady=5)
+
+    Label(left_frame, text='Book ID', bg=lf_bg, font=lbl_font).pack()
+    bk_id_entry = Entry(left_frame, width=25, font=entry_font, textvariable=bk_id)
+    bk_id_entry.pack(pady=5)
+
+    Label(left_frame, text='Author Name', bg=lf_bg, font=lbl_font).pack()
+    Entry(left_frame, width=25, font=entry_font, textvariable=author_name).pack(pady=5)
+
+    # Genre Combobox
+    Label(left_frame, text='Genre', bg=lf_bg, font=lbl_font).pack()
+    genre_combo = ttk.Combobox(left_frame, textvariable=genre_var, values=COMMON_GENRES)
+    genre_combo.pack(pady=5)
+    genre_combo.config(font=entry_font, width=22)
+
+    Label(left_frame, text='Status', bg=lf_bg, font=lbl_font).pack()
+    OptionMenu(left_frame, bk_status, 'Available', 'Issued').pack(pady=5)
+
+    submit = Button(left_frame, text='Add new record', font=btn_font, bg=btn_hlb_bg, width=20, command=add_record)
+    submit.pack(pady=10)
+
+    clear = Button(left_frame, text='Clear fields', font=btn_font, bg=btn_hlb_bg, width=20, command=clear_fields)
+    clear.pack(pady=10)
+
+    # Book Treeview (Right Frame)
+    Label(right_frame, text='BOOK INVENTORY', bg=rbf_bg, font=("Noto Sans CJK TC", 15, 'bold')).pack(fill=X)
+
+    # Search box (title, author or genre)
+    search_frame = Frame(right_frame, bg=rbf_bg)
+    search_frame.pack(fill=X)
+    Label(search_frame, text='Search', bg=rbf_bg, font=lbl_font).pack(side=LEFT, padx=5, pady=5)
+    Entry(search_frame, width=50, font=entry_font, textvariable=search_var).pack(side=LEFT, padx=5, pady=5)
+    # Column sorting/filtering applies to the paged view; a search shows its own ranked results
+    Button(search_frame, text='Clear filters', font=btn_font, bg=btn_hlb_bg,
+           command=lambda: clear_filters(tree, book_pages, BOOK_HEADINGS, book_filter_var, display_records)).pack(side=RIGHT, padx=5, pady=5)
+    Label(search_frame, textvariable=book_filter_var, bg=rbf_bg, font=lbl_font).pack(side=RIGHT, padx=5, pady=5)
+
+    tree_frame = Frame(right_frame)
+    tree_frame.pack(fill=BOTH, expand=True)
+
+    tree = ttk.Treeview(tree_frame, selectmode=BROWSE, 
+                       columns=('Book Name', 'Book ID', 'Author', 'Genre', 'Status', 'Issuer Card ID'))
+
+    scroll_y = ttk.Scrollbar(tree_frame, orient=VERTICAL)
+    scroll_y.pack(side=RIGHT, fill=Y)
+
+    scroll_x = ttk.Scrollbar(tree_frame, orient=HORIZONTAL, command=tree.xview)
+    scroll_x.pack(side=BOTTOM, fill=X)
+
+    tree.configure(xscrollcommand=scroll_x.set)
+    bind_table(tree, scroll_y, book_pages, render_books)
+
+    # Click a heading to sort by it, right-click it to filter on a value
+    for heading in BOOK_HEADINGS:
+        tree.heading(heading, text=heading, anchor=CENTER,
+                     command=lambda heading=heading: sort_by(tree, book_pages, BOOK_HEADINGS, book_filter_var,
+                                                             heading, display_records))
+    tree.bind('<Button-3>', lambda event: filter_by(event, tree, book_pages, BOOK_HEADINGS, book_filter_var, display_records))
+
+    tree.column('#0', width=0, stretch=NO)
+    tree.column('#1', width=200, stretch=NO)
+    tree.column('#2', width=100, stretch=NO)
+    tree.column('#3', width=150, stretch=NO)
+    tree.column('#4', width=120, stretch=NO)
+    tree.column('#5', width=120, stretch=NO)
+    tree.column('#6', width=150, stretch=NO)
+
+    tree.pack(fill=BOTH, expand=True)
+
+    # ========== Batch Circulation Tab ==========
+    Label(circulation_frame, text='Batch Issue / Return', bg=lf_bg, font=("Arial", 14, 'bold')).pack(pady=10)
+    Label(circulation_frame, text='Book IDs (scan or type, one per line)', bg=lf_bg, font=lbl_font).pack()
+
+    batch_text = Text(circulation_frame, width=40, height=14, font=entry_font)
+    batch_text.pack(pady=5)
+
+    Label(circulation_frame, text='Issuer Card ID (for issuing)', bg=lf_bg, font=lbl_font).pack()
+    Entry(circulation_frame, width=25, font=entry_font, textvariable=batch_card_var).pack(pady=5)
+
+    batch_buttons = Frame(circulation_frame, bg=lf_bg)
+    batch_buttons.pack(pady=10)
+    Button(batch_buttons, text='Issue all', font=btn_font, bg=btn_hlb_bg, width=15,
+           command=lambda: circulate_batch('Issued')).pack(side=LEFT, padx=5)
+    Button(batch_buttons, text='Return all', font=btn_font, bg=btn_hlb_bg, width=15,
+           command=lambda: circulate_batch('Available')).pack(side=LEFT, padx=5)
+
+    Label(circulation_frame, textvariable=batch_result_var, bg=lf_bg, font=lbl_font, justify=LEFT).pack(pady=5)
+
+    # ========== Dashboard Tab ==========
+    dash_controls = Frame(dashboard_frame, bg=rtf_bg)
+    dash_controls.pack(fill=X, padx=10, pady=10)
+    Label(dash_controls, textvariable=dashboard_var, bg=rtf_bg, font=("Noto Sans CJK TC", 13, 'bold')).pack(side=LEFT, padx=5, pady=5)
+    Button(dash_controls, text='Recount', font=btn_font, bg=btn_hlb_bg, width=10, command=reconcile_dashboard).pack(side=RIGHT, padx=5)
+    Button(dash_controls, text='Refresh', font=btn_font, bg=btn_hlb_bg, width=10, command=show_dashboard).pack(side=RIGHT, padx=5)
+
+    dash_tables = Frame(dashboard_frame)
+    dash_tables.pack(fill=BOTH, expand=True, padx=10)
+    dash_genres_tree = stats_table(dash_tables, 'BOOKS BY GENRE', ('Genre', 'Books'), (200, 80))
+    dash_courses_tree = stats_table(dash_tables, 'OUTSTANDING LOANS BY COURSE', ('Course', 'Loans'), (240, 80))
+
+    # ========== Statistics Tab ==========
+    stats_controls = Frame(stats_frame, bg=rtf_bg)
+    stats_controls.pack(fill=X, padx=10, pady=10)
+    Label(stats_controls, text='From (YYYY-MM)', bg=rtf_bg, font=lbl_font).pack(side=LEFT, padx=5, pady=5)
+    Entry(stats_controls, width=10, font=entry_font, textvariable=stats_from_var).pack(side=LEFT, padx=5)
+    Label(stats_controls, text='To (YYYY-MM)', bg=rtf_bg, font=lbl_font).pack(side=LEFT, padx=5)
+    Entry(stats_controls, width=10, font=entry_font, textvariable=stats_to_var).pack(side=LEFT, padx=5)
+    Button(stats_controls, text='Show', font=btn_font, bg=btn_hlb_bg, width=10, command=show_statistics).pack(side=LEFT, padx=5)
+    Label(stats_controls, text='Leave blank for all time', bg=rtf_bg, font=lbl_font).pack(side=LEFT, padx=5)
+
+    stats_tables = Frame(stats_frame)
+    stats_tables.pack(fill=BOTH, expand=True, padx=10)
+
+    stats_books_tree = stats_table(stats_tables, 'MOST BORROWED BOOKS', ('Book ID', 'Book Name', 'Loans'), (90, 180, 60))
+    stats_genres_tree = stats_table(stats_tables, 'LOANS BY GENRE', ('Genre', 'Loans'), (160, 60))
+    stats_students_tree = stats_table(stats_tables, 'MOST ACTIVE STUDENTS', ('Card ID', 'Name', 'Loans'), (90, 180, 60))
+
+    # ========== Diagnostics Tab ==========
+    diag_controls = Frame(diagnostics_frame, bg=rtf_bg)
+    diag_controls.pack(fill=X, padx=10, pady=10)
+    Button(diag_controls, text='Refresh', font=btn_font, bg=btn_hlb_bg, width=10, command=show_diagnostics).pack(side=LEFT, padx=5, pady=5)
+    Button(diag_controls, text='Reset', font=btn_font, bg=btn_hlb_bg, width=10, command=reset_diagnostics).pack(side=LEFT, padx=5)
+    Label(diag_controls, text=f'Statements over {db.SLOW_QUERY_MS:g} ms are logged to {db.SLOW_QUERY_LOG or "(off)"}',
+          bg=rtf_bg, font=lbl_font).pack(side=LEFT, padx=5)
+    Label(diag_controls, textvariable=card_cache_var, bg=rtf_bg, font=lbl_font).pack(side=LEFT, padx=5)
+
+    diag_tables = Frame(diagnostics_frame)
+    diag_tables.pack(fill=BOTH, expand=True, padx=10)
+    diag_queries_tree = stats_table(diag_tables, 'QUERIES BY TOTAL TIME',
+                                    ('Query', 'Calls', 'Avg ms', 'p95 ms', 'Max ms', 'Rows', 'Busiest caller'),
+                                    (430, 60, 70, 70, 70, 70, 330), side=TOP)
+    diag_sites_tree = stats_table(diag_tables, 'HANDLERS BY TOTAL TIME',
+                                  ('Handler', 'Calls', 'Total ms', 'Avg ms', 'p95 ms', 'Max ms'),
+                                  (430, 60, 80, 70, 70, 70), side=TOP)
+
+    # ========== Student Management Tab ==========
+    # Left Frame (Student Form)
+    student_left_frame = Frame(student_frame, bg=lf_bg)
+    student_left_frame.pack(side=LEFT, fill=Y, padx=10, pady=10)
+
+    # Right Frame (Student List)
+    student_right_frame = Frame(student_frame)
+    student_right_frame.pack(side=LEFT, fill=BOTH, expand=True, padx=10, pady=10)
+
+    # Student Form (Left Frame)
+    Label(student_left_frame, text='Student Details', bg=lf_bg, font=("Arial", 14, 'bold')).pack(pady=10)
+
+    Label(student_left_frame, text='Library ID (Auto)', bg=lf_bg, font=lbl_font).pack()
+    Entry(student_left_frame, width=25, font=entry_font, textvariable=lib_id_preview, state='readonly').pack(pady=5)
+
+    Label(student_left_frame, text='Student Name', bg=lf_bg, font=lbl_font).pack()
+    Entry(student_left_frame, width=25, font=entry_font, textvariable=student_name_var).pack(pady=5)
+
+    Label(student_left_frame, text='Student Email', bg=lf_bg, font=lbl_font).pack()
+    Entry(student_left_frame, width=25, font=entry_font, textvariable=student_email_var).pack(pady=5)
+
+    Label(student_left_frame, text='Student Course', bg=lf_bg, font=lbl_font).pack()
+    Entry(student_left_frame, width=25, font=entry_font, textvariable=student_course_var).pack(pady=5)
+
+    Label(student_left_frame, text='Student Year', bg=lf_bg, font=lbl_font).pack()
+    Entry(student_left_frame, width=25, font=entry_font, textvariable=student_year_var).pack(pady=5)
+
+    add_student_btn = Button(student_left_frame, text='Add Student', font=btn_font, bg=btn_hlb_bg, width=20, command=add_student)
+    add_student_btn.pack(pady=10)
+
+    update_student_btn = Button(student_left_frame, text='Update Student', font=btn_font, bg=btn_hlb_bg, width=20, command=update_student)
+    update_student_btn.pack(pady=10)
+
+    delete_student_btn = Button(student_left_frame, text='Delete Student', font=btn_font, bg=btn_hlb_bg, width=20, command=delete_student)
+    delete_student_btn.pack(pady=10)
+
+    # Student Treeview (Right Frame)
+    Label(student_right_frame, text='STUDENT RECORDS', bg=rbf_bg, font=("Noto Sans CJK TC", 15, 'bold')).pack(fill=X)
+
+    student_filter_frame = Frame(student_right_frame, bg=rbf_bg)
+    student_filter_frame.pack(fill=X)
+    Button(student_filter_frame, text='Clear filters', font=btn_font, bg=btn_hlb_bg,
+           command=lambda: clear_filters(student_tree, student_pages, STUDENT_HEADINGS, student_filter_var,
+                                         display_students)).pack(side=RIGHT, padx=5, pady=5)
+    Label(student_filter_frame, textvariable=student_filter_var, bg=rbf_bg, font=lbl_font).pack(side=RIGHT, padx=5, pady=5)
+
+    student_tree_frame = Frame(student_right_frame)
+    student_tree_frame.pack(fill=BOTH, expand=True)
+
+    student_tree = ttk.Treeview(student_tree_frame, selectmode=BROWSE, columns=('Card ID', 'Name', 'Email', 'Course', 'Year'))
+
+    student_scroll_y = ttk.Scrollbar(student_tree_frame, orient=VERTICAL)
+    student_scroll_y.pack(side=RIGHT, fill=Y)
+
+    student_scroll_x = ttk.Scrollbar(student_tree_frame, orient=HORIZONTAL, command=student_tree.xview)
+    student_scroll_x.pack(side=BOTTOM, fill=X)
+
+    student_tree.configure(xscrollcommand=student_scroll_x.set)
+    bind_table(student_tree, student_scroll_y, student_pages, render_students)
+
+    for heading in STUDENT_HEADINGS:
+        student_tree.heading(heading, text=heading, anchor=CENTER,
+                             command=lambda heading=heading: sort_by(student_tree, student_pages, STUDENT_HEADINGS,
+                                                                     student_filter_var, heading, display_students))
+    student_tree.bind('<Button-3>', lambda event: filter_by(event, student_tree, student_pages, STUDENT_HEADINGS,
+                                                            student_filter_var, display_students))
+
+    student_tree.column('#0', width=0, stretch=NO)
+    student_tree.column('#1', width=150, stretch=NO)
+    student_tree.column('#2', width=200, stretch=NO)
+    student_tree.column('#3', width=250, stretch=NO)
+    student_tree.column('#4', width=200, stretch=NO)
+    student_tree.column('#5', width=100, stretch=NO)
+
+    student_tree.pack(fill=BOTH, expand=True)
+
+    # Start program
+    start_sync()
+    load_students_by_prefix()
+    root.after(DASHBOARD_REFRESH_MS, refresh_dashboard)
+    if db.METRICS_FILE:
+        root.after(db.METRICS_INTERVAL_MS, write_metrics)
+    root.mainloop()
+    worker.shutdown()
+    if db.METRICS_FILE:
+        store.stats.write_metrics(db.METRICS_FILE)
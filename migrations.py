@@ -0,0 +1,606 @@
+# Versioned schema migrations.
+#
+# Each migration is (version, description, statements). A statement is SQL text or a
+# function taking the cursor, for steps that depend on the database. Applied versions are recorded
+# in Schema_Version, so every migration runs exactly once per database and existing
+# installations are upgraded in place on the next start. Append new migrations to the
+# end of MIGRATIONS; never edit one that has already shipped.
+#
+# MIGRATIONS is for MySQL; SQLITE_MIGRATIONS builds the same schema for the embedded
+# backend and keeps the same version numbers, so add new migrations to both lists.
+#
+# NORMALIZED_MIGRATIONS is the optional normalized MySQL layout (DB_SCHEMA=normalized).
+# It is applied after MIGRATIONS and tracked separately, in Normalized_Version.
+#
+# Run `python migrations.py` to upgrade a database without starting the GUI.
+
+# Rebuilds Catalog_Counters (after it is emptied) from the tables; used by migration 9 and
+# storage.reconcile_counters. The same SQL works on both backends and on the normalized view.
+COUNTER_RECOUNT = [
+    """
+    INSERT INTO Catalog_Counters (Kind, Name, Value)
+    SELECT 'status', COALESCE(BK_STATUS, 'Unknown'), COUNT(*) FROM Library GROUP BY COALESCE(BK_STATUS, 'Unknown')
+    """,
+    """
+    INSERT INTO Catalog_Counters (Kind, Name, Value)
+    SELECT 'genre', COALESCE(GENRE, 'Unknown'), COUNT(*) FROM Library GROUP BY COALESCE(GENRE, 'Unknown')
+    """,
+    """
+    INSERT INTO Catalog_Counters (Kind, Name, Value)
+    SELECT 'course', COALESCE(s.Course, 'Unknown'), COUNT(*)
+    FROM Library l LEFT JOIN Students s ON s.Card_ID = l.CARD_ID
+    WHERE l.BK_STATUS = 'Issued'
+    GROUP BY COALESCE(s.Course, 'Unknown')
+    """,
+]
+
+
+def on_flat_library(statement):
+    # A MySQL step (SQL text or a function taking the cursor) that changes the Library table.
+    # It is skipped once the normalized layout has made Library a view; NORMALIZED_MIGRATIONS
+    # makes the same change to Books.
+    def run(cursor):
+        cursor.execute("SELECT TABLE_TYPE FROM information_schema.TABLES "
+                       "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'Library'")
+        row = cursor.fetchone()
+        if row is None or row[0] == 'BASE TABLE':
+            if callable(statement):
+                statement(cursor)
+            else:
+                cursor.execute(statement)
+    return run
+
+
+def copy_flat_due_dates(cursor):
+    # A database converted after migration 11 had its due dates in the flat table; carry them
+    # over to Books, unless Library_Flat has been dropped already
+    cursor.execute("SELECT 1 FROM information_schema.COLUMNS WHERE TABLE_SCHEMA = DATABASE() "
+                   "AND TABLE_NAME = 'Library_Flat' AND COLUMN_NAME = 'Due_Date'")
+    if cursor.fetchone() is not None:
+        cursor.execute('UPDATE Books b JOIN Library_Flat f ON f.BK_ID = b.BK_ID SET b.Due_Date = f.Due_Date '
+                       "WHERE f.Due_Date IS NOT NULL AND b.BK_STATUS = 'Issued'")
+
+
+
+def backfill_due_dates(table, placeholder):
+    # Books issued before migration 11, or imported or seeded without a due date, were never
+    # seen by the overdue job. They are given a full loan period from the day of the upgrade.
+    def run(cursor):
+        from storage import due_date
+
+        cursor.execute(f"UPDATE {table} SET Due_Date = {placeholder} WHERE BK_STATUS = 'Issued' AND Due_Date IS NULL",
+                       (due_date(),))
+    return run
+
+
+MIGRATIONS = [
+    (1, 'Library and Students tables', [
+        """
+        CREATE TABLE IF NOT EXISTS Library (
+            BK_NAME VARCHAR(255),
+            BK_ID VARCHAR(50) PRIMARY KEY,
+            AUTHOR_NAME VARCHAR(255),
+            GENRE VARCHAR(50),
+            BK_STATUS VARCHAR(20),
+            CARD_ID VARCHAR(50)
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS Students (
+            Card_ID VARCHAR(50) PRIMARY KEY,
+            Name VARCHAR(255),
+            Email VARCHAR(255),
+            Course VARCHAR(100),
+            Year INT
+        )
+        """,
+    ]),
+    (2, 'ID counters', [
+        """
+        CREATE TABLE IF NOT EXISTS ID_Sequences (
+            Name VARCHAR(50) PRIMARY KEY,
+            Next_Value BIGINT NOT NULL
+        )
+        """,
+    ]),
+    (3, 'Secondary indexes for card, status, genre and author lookups', [
+        # InnoDB appends the primary key to every secondary index, so these also
+        # serve keyset pagination on BK_ID within a status or genre
+        """
+        ALTER TABLE Library
+            ADD INDEX idx_library_card (CARD_ID),
+            ADD INDEX idx_library_status (BK_STATUS),
+            ADD INDEX idx_library_genre (GENRE),
+            ADD INDEX idx_library_author (AUTHOR_NAME)
+        """,
+    ]),
+    (4, 'Foreign key from Library.CARD_ID to Students.Card_ID', [
+        # 'N/A' used to mark books with no issuer; NULL does that now
+        "UPDATE Library SET CARD_ID = NULL WHERE CARD_ID = 'N/A' OR CARD_ID = ''",
+        # Drop references to cards that were deleted while their books were still issued
+        """
+        UPDATE Library l LEFT JOIN Students s ON s.Card_ID = l.CARD_ID
+        SET l.CARD_ID = NULL
+        WHERE l.CARD_ID IS NOT NULL AND s.Card_ID IS NULL
+        """,
+        """
+        ALTER TABLE Library
+            ADD CONSTRAINT fk_library_card FOREIGN KEY (CARD_ID) REFERENCES Students (Card_ID)
+        """,
+    ]),
+    (5, 'Full-text index for catalog search', [
+        """
+        ALTER TABLE Library
+            ADD FULLTEXT INDEX ft_library_search (BK_NAME, AUTHOR_NAME, GENRE),
+            ADD INDEX idx_library_name (BK_NAME)
+        """,
+    ]),
+    (6, 'Loan history and circulation statistics', [
+        # Append-only: rows are never updated or deleted, and outlive the book and card
+        """
+        CREATE TABLE Loan_Events (
+            Event_ID BIGINT AUTO_INCREMENT PRIMARY KEY,
+            Event_Time DATETIME NOT NULL,
+            Event_Type VARCHAR(10) NOT NULL,
+            BK_ID VARCHAR(50) NOT NULL,
+            CARD_ID VARCHAR(50),
+            INDEX idx_loan_events_time (Event_Time),
+            INDEX idx_loan_events_book (BK_ID, Event_Time),
+            INDEX idx_loan_events_card (CARD_ID, Event_Time)
+        )
+        """,
+        # Issue counts per month ('YYYY-MM'), maintained as events are written
+        """
+        CREATE TABLE Book_Loan_Stats (
+            Period CHAR(7) NOT NULL,
+            BK_ID VARCHAR(50) NOT NULL,
+            BK_NAME VARCHAR(255),
+            Loans BIGINT NOT NULL,
+            PRIMARY KEY (Period, BK_ID)
+        )
+        """,
+        """
+        CREATE TABLE Genre_Loan_Stats (
+            Period CHAR(7) NOT NULL,
+            GENRE VARCHAR(50) NOT NULL,
+            Loans BIGINT NOT NULL,
+            PRIMARY KEY (Period, GENRE)
+        )
+        """,
+        """
+        CREATE TABLE Student_Loan_Stats (
+            Period CHAR(7) NOT NULL,
+            CARD_ID VARCHAR(50) NOT NULL,
+            Loans BIGINT NOT NULL,
+            PRIMARY KEY (Period, CARD_ID)
+        )
+        """,
+    ]),
+    (7, 'Indexes for sorting and filtering the student table', [
+        """
+        ALTER TABLE Students
+            ADD INDEX idx_students_name (Name),
+            ADD INDEX idx_students_email (Email),
+            ADD INDEX idx_students_course (Course),
+            ADD INDEX idx_students_year (Year)
+        """,
+    ]),
+    (8, 'Row versions for compare-and-set book updates', [
+        on_flat_library('ALTER TABLE Library ADD COLUMN Row_Version INT UNSIGNED NOT NULL DEFAULT 0'),
+    ]),
+    (9, 'Dashboard counters', [
+        """
+        CREATE TABLE Catalog_Counters (
+            Kind VARCHAR(20) NOT NULL,
+            Name VARCHAR(255) NOT NULL,
+            Value BIGINT NOT NULL,
+            PRIMARY KEY (Kind, Name)
+        )
+        """,
+        *COUNTER_RECOUNT,
+    ]),
+    (10, 'Change log for syncing desks', [
+        """
+        CREATE TABLE Change_Log (
+            Change_ID BIGINT AUTO_INCREMENT PRIMARY KEY,
+            Table_Name VARCHAR(20) NOT NULL,
+            Row_Key VARCHAR(50) NOT NULL,
+            Changed_At DATETIME NOT NULL,
+            INDEX idx_change_log_time (Changed_At)
+        )
+        """,
+    ]),
+    (11, 'Due dates, fines and the overdue notice queue', [
+        # Only issued books have a due date, and the overdue job reads just the range of
+        # issued books due before today from this index instead of scanning the catalog
+        on_flat_library('ALTER TABLE Library ADD COLUMN Due_Date DATE NULL, '
+                        'ADD INDEX idx_library_due (BK_STATUS, Due_Date)'),
+        # One row per overdue loan, reassessed on every run while the book is still out
+        """
+        CREATE TABLE Fines (
+            BK_ID VARCHAR(50) NOT NULL,
+            Due_Date DATE NOT NULL,
+            CARD_ID VARCHAR(50) NOT NULL,
+            Days_Overdue INT NOT NULL,
+            Amount INT NOT NULL,
+            Assessed_On DATE NOT NULL,
+            Next_Notice DATE,
+            PRIMARY KEY (BK_ID, Due_Date),
+            INDEX idx_fines_assessed (Assessed_On, Next_Notice),
+            INDEX idx_fines_card (CARD_ID)
+        )
+        """,
+        """
+        CREATE TABLE Notification_Queue (
+            Notice_ID BIGINT AUTO_INCREMENT PRIMARY KEY,
+            CARD_ID VARCHAR(50) NOT NULL,
+            BK_ID VARCHAR(50) NOT NULL,
+            Due_Date DATE NOT NULL,
+            Days_Overdue INT NOT NULL,
+            Amount INT NOT NULL,
+            Created_At DATETIME NOT NULL,
+            Sent_At DATETIME,
+            INDEX idx_notification_pending (Sent_At, Notice_ID)
+        )
+        """,
+    ]),
+    (12, 'Due dates for loans that had none', [
+        on_flat_library(backfill_due_dates('Library', '%s')),
+    ]),
+]
+
+SQLITE_MIGRATIONS = [
+    (1, 'Library and Students tables', [
+        """
+        CREATE TABLE IF NOT EXISTS Students (
+            Card_ID VARCHAR(50) PRIMARY KEY,
+            Name VARCHAR(255),
+            Email VARCHAR(255),
+            Course VARCHAR(100),
+            Year INT
+        )
+        """,
+        # SQLite cannot add a foreign key later, so it is declared here (MySQL version 4)
+        """
+        CREATE TABLE IF NOT EXISTS Library (
+            BK_NAME VARCHAR(255),
+            BK_ID VARCHAR(50) PRIMARY KEY,
+            AUTHOR_NAME VARCHAR(255),
+            GENRE VARCHAR(50),
+            BK_STATUS VARCHAR(20),
+            CARD_ID VARCHAR(50) REFERENCES Students (Card_ID)
+        )
+        """,
+    ]),
+    (2, 'ID counters', [
+        """
+        CREATE TABLE IF NOT EXISTS ID_Sequences (
+            Name VARCHAR(50) PRIMARY KEY,
+            Next_Value BIGINT NOT NULL
+        )
+        """,
+    ]),
+    (3, 'Secondary indexes for card, status, genre and author lookups', [
+        'CREATE INDEX idx_library_card ON Library (CARD_ID)',
+        'CREATE INDEX idx_library_status ON Library (BK_STATUS)',
+        'CREATE INDEX idx_library_genre ON Library (GENRE)',
+        'CREATE INDEX idx_library_author ON Library (AUTHOR_NAME)',
+    ]),
+    (4, 'Foreign key from Library.CARD_ID to Students.Card_ID (declared in version 1)', []),
+    (5, 'Full-text index for catalog search', [
+        'CREATE INDEX idx_library_name ON Library (BK_NAME)',
+        # External-content FTS5 table kept in step with Library by triggers
+        """
+        CREATE VIRTUAL TABLE Library_Search USING fts5(
+            BK_NAME, AUTHOR_NAME, GENRE, content='Library', content_rowid='rowid'
+        )
+        """,
+        """
+        CREATE TRIGGER library_search_insert AFTER INSERT ON Library BEGIN
+            INSERT INTO Library_Search (rowid, BK_NAME, AUTHOR_NAME, GENRE)
+            VALUES (new.rowid, new.BK_NAME, new.AUTHOR_NAME, new.GENRE);
+        END
+        """,
+        """
+        CREATE TRIGGER library_search_delete AFTER DELETE ON Library BEGIN
+            INSERT INTO Library_Search (Library_Search, rowid, BK_NAME, AUTHOR_NAME, GENRE)
+            VALUES ('delete', old.rowid, old.BK_NAME, old.AUTHOR_NAME, old.GENRE);
+        END
+        """,
+        """
+        CREATE TRIGGER library_search_update AFTER UPDATE OF BK_NAME, AUTHOR_NAME, GENRE ON Library BEGIN
+            INSERT INTO Library_Search (Library_Search, rowid, BK_NAME, AUTHOR_NAME, GENRE)
+            VALUES ('delete', old.rowid, old.BK_NAME, old.AUTHOR_NAME, old.GENRE);
+            INSERT INTO Library_Search (rowid, BK_NAME, AUTHOR_NAME, GENRE)
+            VALUES (new.rowid, new.BK_NAME, new.AUTHOR_NAME, new.GENRE);
+        END
+        """,
+        "INSERT INTO Library_Search (Library_Search) VALUES ('rebuild')",
+    ]),
+    (6, 'Loan history and circulation statistics', [
+        """
+        CREATE TABLE Loan_Events (
+            Event_ID INTEGER PRIMARY KEY AUTOINCREMENT,
+            Event_Time DATETIME NOT NULL,
+            Event_Type VARCHAR(10) NOT NULL,
+            BK_ID VARCHAR(50) NOT NULL,
+            CARD_ID VARCHAR(50)
+        )
+        """,
+        'CREATE INDEX idx_loan_events_time ON Loan_Events (Event_Time)',
+        'CREATE INDEX idx_loan_events_book ON Loan_Events (BK_ID, Event_Time)',
+        'CREATE INDEX idx_loan_events_card ON Loan_Events (CARD_ID, Event_Time)',
+        """
+        CREATE TABLE Book_Loan_Stats (
+            Period CHAR(7) NOT NULL,
+            BK_ID VARCHAR(50) NOT NULL,
+            BK_NAME VARCHAR(255),
+            Loans BIGINT NOT NULL,
+            PRIMARY KEY (Period, BK_ID)
+        )
+        """,
+        """
+        CREATE TABLE Genre_Loan_Stats (
+            Period CHAR(7) NOT NULL,
+            GENRE VARCHAR(50) NOT NULL,
+            Loans BIGINT NOT NULL,
+            PRIMARY KEY (Period, GENRE)
+        )
+        """,
+        """
+        CREATE TABLE Student_Loan_Stats (
+            Period CHAR(7) NOT NULL,
+            CARD_ID VARCHAR(50) NOT NULL,
+            Loans BIGINT NOT NULL,
+            PRIMARY KEY (Period, CARD_ID)
+        )
+        """,
+    ]),
+    (7, 'Indexes for sorting and filtering the student table', [
+        'CREATE INDEX idx_students_name ON Students (Name)',
+        'CREATE INDEX idx_students_email ON Students (Email)',
+        'CREATE INDEX idx_students_course ON Students (Course)',
+        'CREATE INDEX idx_students_year ON Students (Year)',
+    ]),
+    (8, 'Row versions for compare-and-set book updates', [
+        'ALTER TABLE Library ADD COLUMN Row_Version INTEGER NOT NULL DEFAULT 0',
+    ]),
+    (9, 'Dashboard counters', [
+        """
+        CREATE TABLE Catalog_Counters (
+            Kind VARCHAR(20) NOT NULL,
+            Name VARCHAR(255) NOT NULL,
+            Value BIGINT NOT NULL,
+            PRIMARY KEY (Kind, Name)
+        )
+        """,
+        *COUNTER_RECOUNT,
+    ]),
+    (10, 'Change log for syncing desks', [
+        # AUTOINCREMENT: IDs are never reused, even after the newest entries are deleted
+        """
+        CREATE TABLE Change_Log (
+            Change_ID INTEGER PRIMARY KEY AUTOINCREMENT,
+            Table_Name VARCHAR(20) NOT NULL,
+            Row_Key VARCHAR(50) NOT NULL,
+            Changed_At DATETIME NOT NULL
+        )
+        """,
+        'CREATE INDEX idx_change_log_time ON Change_Log (Changed_At)',
+    ]),
+    (11, 'Due dates, fines and the overdue notice queue', [
+        'ALTER TABLE Library ADD COLUMN Due_Date DATE',
+        'CREATE INDEX idx_library_due ON Library (BK_STATUS, Due_Date)',
+        """
+        CREATE TABLE Fines (
+            BK_ID VARCHAR(50) NOT NULL,
+            Due_Date DATE NOT NULL,
+            CARD_ID VARCHAR(50) NOT NULL,
+            Days_Overdue INTEGER NOT NULL,
+            Amount INTEGER NOT NULL,
+            Assessed_On DATE NOT NULL,
+            Next_Notice DATE,
+            PRIMARY KEY (BK_ID, Due_Date)
+        )
+        """,
+        'CREATE INDEX idx_fines_assessed ON Fines (Assessed_On, Next_Notice)',
+        'CREATE INDEX idx_fines_card ON Fines (CARD_ID)',
+        """
+        CREATE TABLE Notification_Queue (
+            Notice_ID INTEGER PRIMARY KEY AUTOINCREMENT,
+            CARD_ID VARCHAR(50) NOT NULL,
+            BK_ID VARCHAR(50) NOT NULL,
+            Due_Date DATE NOT NULL,
+            Days_Overdue INTEGER NOT NULL,
+            Amount INTEGER NOT NULL,
+            Created_At DATETIME NOT NULL,
+            Sent_At DATETIME
+        )
+        """,
+        'CREATE INDEX idx_notification_pending ON Notification_Queue (Sent_At, Notice_ID)',
+    ]),
+    (12, 'Due dates for loans that had none', [
+        backfill_due_dates('Library', '?'),
+    ]),
+]
+
+# Optional normalized layout for MySQL. Books refer to their author, genre and issuer by
+# integer key and store the status as a one-byte ENUM, so the repeated strings and the
+# VARCHAR keys leave the rows and the secondary indexes. The BK-/LIB- codes stay as unique
+# display columns. Library becomes a view with the original columns: every read works
+# unchanged, and storage.NormalizedMySQLStorage sends the writes to Books. The flat table
+# is kept as Library_Flat; drop it once the converted data has been checked.
+NORMALIZED_MIGRATIONS = [
+    (1, 'Author and genre lookup tables, integer student keys', [
+        """
+        CREATE TABLE Authors (
+            Author_ID INT UNSIGNED AUTO_INCREMENT PRIMARY KEY,
+            Name VARCHAR(255) NOT NULL,
+            UNIQUE KEY uq_authors_name (Name),
+            FULLTEXT INDEX ft_authors_name (Name)
+        )
+        """,
+        """
+        CREATE TABLE Genres (
+            Genre_ID SMALLINT UNSIGNED AUTO_INCREMENT PRIMARY KEY,
+            Name VARCHAR(50) NOT NULL,
+            UNIQUE KEY uq_genres_name (Name),
+            FULLTEXT INDEX ft_genres_name (Name)
+        )
+        """,
+        'INSERT INTO Authors (Name) SELECT DISTINCT AUTHOR_NAME FROM Library WHERE AUTHOR_NAME IS NOT NULL',
+        'INSERT INTO Genres (Name) SELECT DISTINCT GENRE FROM Library WHERE GENRE IS NOT NULL',
+        # Card_ID stays unique; the foreign key onto it has to go before the primary key can move
+        'ALTER TABLE Library DROP FOREIGN KEY fk_library_card',
+        """
+        ALTER TABLE Students
+            DROP PRIMARY KEY,
+            ADD COLUMN Student_ID INT UNSIGNED AUTO_INCREMENT PRIMARY KEY FIRST,
+            ADD UNIQUE KEY uq_students_card (Card_ID)
+        """,
+    ]),
+    (2, 'Books table with integer keys; Library becomes a view', [
+        """
+        CREATE TABLE Books (
+            Book_ID INT UNSIGNED AUTO_INCREMENT PRIMARY KEY,
+            BK_ID VARCHAR(50) NOT NULL,
+            BK_NAME VARCHAR(255),
+            Author_ID INT UNSIGNED,
+            Genre_ID SMALLINT UNSIGNED,
+            BK_STATUS ENUM('Available', 'Issued') NOT NULL DEFAULT 'Available',
+            Student_ID INT UNSIGNED,
+            UNIQUE KEY uq_books_code (BK_ID),
+            INDEX idx_books_name (BK_NAME),
+            INDEX idx_books_author (Author_ID),
+            INDEX idx_books_genre (Genre_ID),
+            INDEX idx_books_status (BK_STATUS),
+            INDEX idx_books_student (Student_ID),
+            FULLTEXT INDEX ft_books_name (BK_NAME),
+            CONSTRAINT fk_books_author FOREIGN KEY (Author_ID) REFERENCES Authors (Author_ID),
+            CONSTRAINT fk_books_genre FOREIGN KEY (Genre_ID) REFERENCES Genres (Genre_ID),
+            CONSTRAINT fk_books_student FOREIGN KEY (Student_ID) REFERENCES Students (Student_ID)
+        )
+        """,
+        # In BK_ID order, so Book_ID follows the display order of the old table
+        """
+        INSERT INTO Books (BK_ID, BK_NAME, Author_ID, Genre_ID, BK_STATUS, Student_ID)
+        SELECT l.BK_ID, l.BK_NAME, a.Author_ID, g.Genre_ID,
+               IF(l.BK_STATUS = 'Issued', 'Issued', 'Available'), s.Student_ID
+        FROM Library l
+        LEFT JOIN Authors a ON a.Name = l.AUTHOR_NAME
+        LEFT JOIN Genres g ON g.Name = l.GENRE
+        LEFT JOIN Students s ON s.Card_ID = l.CARD_ID
+        ORDER BY l.BK_ID
+        """,
+        'RENAME TABLE Library TO Library_Flat',
+        """
+        CREATE VIEW Library AS
+        SELECT b.BK_NAME, b.BK_ID, a.Name AS AUTHOR_NAME, g.Name AS GENRE, b.BK_STATUS, s.Card_ID AS CARD_ID
+        FROM Books b
+        LEFT JOIN Authors a ON a.Author_ID = b.Author_ID
+        LEFT JOIN Genres g ON g.Genre_ID = b.Genre_ID
+        LEFT JOIN Students s ON s.Student_ID = b.Student_ID
+        """,
+    ]),
+    (3, 'Row versions for compare-and-set book updates', [
+        'ALTER TABLE Books ADD COLUMN Row_Version INT UNSIGNED NOT NULL DEFAULT 0',
+        """
+        CREATE OR REPLACE VIEW Library AS
+        SELECT b.BK_NAME, b.BK_ID, a.Name AS AUTHOR_NAME, g.Name AS GENRE, b.BK_STATUS, s.Card_ID AS CARD_ID,
+               b.Row_Version
+        FROM Books b
+        LEFT JOIN Authors a ON a.Author_ID = b.Author_ID
+        LEFT JOIN Genres g ON g.Genre_ID = b.Genre_ID
+        LEFT JOIN Students s ON s.Student_ID = b.Student_ID
+        """,
+    ]),
+    (4, 'Due dates for the overdue job', [
+        'ALTER TABLE Books ADD COLUMN Due_Date DATE NULL, ADD INDEX idx_books_due (BK_STATUS, Due_Date)',
+        copy_flat_due_dates,
+        """
+        CREATE OR REPLACE VIEW Library AS
+        SELECT b.BK_NAME, b.BK_ID, a.Name AS AUTHOR_NAME, g.Name AS GENRE, b.BK_STATUS, s.Card_ID AS CARD_ID,
+               b.Row_Version, b.Due_Date
+        FROM Books b
+        LEFT JOIN Authors a ON a.Author_ID = b.Author_ID
+        LEFT JOIN Genres g ON g.Genre_ID = b.Genre_ID
+        LEFT JOIN Students s ON s.Student_ID = b.Student_ID
+        """,
+    ]),
+    (5, 'Due dates for loans that had none', [
+        backfill_due_dates('Books', '%s'),
+    ]),
+]
+
+# Serializes desks that start at the same time against a database that needs upgrading
+LOCK_NAME = 'library_schema_migrations'
+LOCK_TIMEOUT = 60
+
+
+def current_version(cursor, table='Schema_Version'):
+    cursor.execute(f'SELECT COALESCE(MAX(Version), 0) FROM {table}')
+    return cursor.fetchone()[0]
+
+
+def apply_migrations(conn, cursor, migrations, placeholder, table='Schema_Version'):
+    cursor.execute(f"""
+        CREATE TABLE IF NOT EXISTS {table} (
+            Version INT PRIMARY KEY,
+            Description VARCHAR(255),
+            Applied_At TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    applied = []
+    version = current_version(cursor, table)
+    for number, description, statements in migrations:
+        if number <= version:
+            continue
+        for statement in statements:
+            if callable(statement):
+                statement(cursor)
+            else:
+                cursor.execute(statement)
+        cursor.execute(f'INSERT INTO {table} (Version, Description) VALUES ({placeholder}, {placeholder})',
+                       (number, description))
+        conn.commit()
+        applied.append(number)
+    return applied
+
+
+def migrate(conn, migrations=MIGRATIONS, table='Schema_Version'):
+    # Applies every MySQL migration newer than the version recorded in table; returns the versions applied
+    cursor = conn.cursor()
+    try:
+        cursor.execute('SELECT GET_LOCK(%s, %s)', (LOCK_NAME, LOCK_TIMEOUT))
+        if cursor.fetchone()[0] != 1:
+            raise RuntimeError('Timed out waiting for another client to finish upgrading the schema')
+        try:
+            return apply_migrations(conn, cursor, migrations, '%s', table)
+        finally:
+            cursor.execute('SELECT RELEASE_LOCK(%s)', (LOCK_NAME,))
+            cursor.fetchone()
+    finally:
+        cursor.close()
+
+
+def migrate_sqlite(conn, migrations=SQLITE_MIGRATIONS):
+    cursor = conn.cursor()
+    try:
+        return apply_migrations(conn, cursor, migrations, '?')
+    finally:
+        cursor.close()
+
+
+if __name__ == '__main__':
+    import storage
+
+    store = storage.open_storage(pool_size=1)
+    applied = store.migrate()
+    with store.connection() as conn:
+        cursor = conn.cursor()
+        version = current_version(cursor)
+        cursor.close()
+    if applied:
+        print(f"Applied migrations {', '.join(map(str, applied))}; schema is at version {version}")
+    else:
+        print(f"Schema is up to date (version {version})")
@@ -0,0 +1,254 @@
+# Timing for every database statement.
+#
+# Storage backends hand out TimedConnection wrappers, so every cursor created anywhere
+# (storage, migrations, the seeders) goes through TimedCursor. Each statement's time
+# covers execute() plus the fetches that read its results. QueryStats aggregates the
+# timings per statement and per call site into fixed-bucket histograms. Statements
+# slower than the threshold are appended to the slow-query log. The totals feed the
+# Diagnostics tab and can be written as a Prometheus text file.
+from contextlib import contextmanager
+from functools import lru_cache
+from bisect import bisect_left
+import os
+import re
+import sys
+import threading
+import time
+
+# Histogram bucket upper bounds, in seconds
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Frames from these modules are skipped when working out who ran a statement
+INTERNAL_MODULES = ('query_stats', 'storage', 'id_allocator', 'contextlib')
+
+
+@lru_cache(maxsize=1024)
+def normalize(statement):
+    # One entry per query shape: whitespace collapsed and IN (...) lists of any length merged
+    statement = ' '.join(statement.split())
+    return re.sub(r'\((?:\s*(?:%s|\?)\s*,)+\s*(?:%s|\?)\s*\)', '(...)', statement)
+
+
+def caller():
+    frame = sys._getframe(1)
+    while frame is not None and frame.f_globals.get('__name__') in INTERNAL_MODULES:
+        frame = frame.f_back
+    if frame is None:
+        return 'unknown'
+    return f"{frame.f_globals.get('__name__')}.{frame.f_code.co_name}"
+
+
+def new_totals():
+    return {'calls': 0, 'seconds': 0.0, 'max': 0.0, 'rows': 0, 'buckets': [0] * (len(BUCKETS) + 1), 'sites': {}}
+
+
+def percentile(totals, fraction):
+    # Upper bound of the bucket holding the given fraction of calls (the maximum for the last one)
+    wanted = fraction * totals['calls']
+    seen = 0
+    for bound, count in zip(BUCKETS, totals['buckets']):
+        seen += count
+        if seen >= wanted:
+            return min(bound, totals['max'])
+    return totals['max']
+
+
+def label(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class QueryStats:
+    def __init__(self, slow_seconds, slow_log=None):
+        self.slow_seconds = slow_seconds
+        self.slow_log = slow_log
+        self.queries = {}  # normalized statement -> totals
+        self.sites = {}  # call site -> totals
+        self.lock = threading.Lock()
+        self.local = threading.local()
+
+    @contextmanager
+    def call_site(self, site):
+        # Statements run inside this block are attributed to site instead of the calling function
+        previous = getattr(self.local, 'site', None)
+        self.local.site = site
+        try:
+            yield
+        finally:
+            self.local.site = previous
+
+    def _add(self, totals, seconds, rows):
+        totals['calls'] += 1
+        totals['seconds'] += seconds
+        totals['max'] = max(totals['max'], seconds)
+        totals['rows'] += rows
+        totals['buckets'][bisect_left(BUCKETS, seconds)] += 1
+
+    def current_site(self):
+        return getattr(self.local, 'site', None) or caller()
+
+    def record(self, statement, seconds, rows, site):
+        query = normalize(statement)
+        with self.lock:
+            totals = self.queries.setdefault(query, new_totals())
+            self._add(totals, seconds, rows)
+            totals['sites'][site] = totals['sites'].get(site, 0) + 1
+            self._add(self.sites.setdefault(site, new_totals()), seconds, rows)
+        if seconds >= self.slow_seconds and self.slow_log:
+            self._log_slow(query, seconds, rows, site)
+
+    def _log_slow(self, query, seconds, rows, site):
+        line = f"{time.strftime('%Y-%m-%d %H:%M:%S')}\t{seconds * 1000:.1f} ms\t{rows} rows\t{site}\t{query}\n"
+        with self.lock:
+            with open(self.slow_log, 'a', encoding='utf-8') as handle:
+                handle.write(line)
+
+    def reset(self):
+        with self.lock:
+            self.queries.clear()
+            self.sites.clear()
+
+    def query_summary(self):
+        # [(query, calls, avg ms, p95 ms, max ms, rows, busiest call site)], slowest in total first
+        with self.lock:
+            return [(query, totals['calls'], totals['seconds'] * 1000 / totals['calls'],
+                     percentile(totals, 0.95) * 1000, totals['max'] * 1000, totals['rows'],
+                     max(totals['sites'], key=totals['sites'].get))
+                    for query, totals in sorted(self.queries.items(), key=lambda item: -item[1]['seconds'])]
+
+    def site_summary(self):
+        # [(site, calls, total ms, avg ms, p95 ms, max ms)], slowest in total first
+        with self.lock:
+            return [(site, totals['calls'], totals['seconds'] * 1000, totals['seconds'] * 1000 / totals['calls'],
+                     percentile(totals, 0.95) * 1000, totals['max'] * 1000)
+                    for site, totals in sorted(self.sites.items(), key=lambda item: -item[1]['seconds'])]
+
+    def prometheus_text(self):
+        lines = []
+        with self.lock:
+            for metric, key, entries, help_text in (
+                    ('library_db_query_seconds', 'query', self.queries, 'Database statement latency by query.'),
+                    ('library_db_site_seconds', 'site', self.sites, 'Database statement latency by call site.')):
+                lines.append(f'# HELP {metric} {help_text}')
+                lines.append(f'# TYPE {metric} histogram')
+                for name, totals in entries.items():
+                    tag = f'{key}="{label(name)}"'
+                    cumulative = 0
+                    for bound, count in zip(BUCKETS, totals['buckets']):
+                        cumulative += count
+                        lines.append(f'{metric}_bucket{{{tag},le="{bound}"}} {cumulative}')
+                    lines.append(f'{metric}_bucket{{{tag},le="+Inf"}} {totals["calls"]}')
+                    lines.append(f'{metric}_sum{{{tag}}} {totals["seconds"]:.6f}')
+                    lines.append(f'{metric}_count{{{tag}}} {totals["calls"]}')
+            lines.append('# HELP library_db_query_rows_total Rows returned or changed by query.')
+            lines.append('# TYPE library_db_query_rows_total counter')
+            for name, totals in self.queries.items():
+                lines.append(f'library_db_query_rows_total{{query="{label(name)}"}} {totals["rows"]}')
+        return '\n'.join(lines) + '\n'
+
+    def write_metrics(self, path):
+        # Written to a temporary file and renamed, so a scraper never reads half a file
+        temporary = f'{path}.tmp'
+        with open(temporary, 'w', encoding='utf-8') as handle:
+            handle.write(self.prometheus_text())
+        os.replace(temporary, path)
+
+
+class TimedCursor:
+    # Wraps a DB-API cursor. A statement is recorded when the next one starts or the
+    # cursor is closed, so the time spent fetching its rows is included.
+    def __init__(self, cursor, stats, connection=None):
+        self.cursor = cursor
+        self.stats = stats
+        self.connection = connection  # the TimedConnection it came from, as in DB-API's cursor.connection
+        self.current = None  # [statement, seconds, rowcount, rows fetched, call site]
+
+    def __getattr__(self, name):
+        return getattr(self.cursor, name)
+
+    def _finish(self):
+        if self.current is not None:
+            statement, seconds, rowcount, fetched, site = self.current
+            self.current = None
+            self.stats.record(statement, seconds, max(rowcount, fetched), site)
+
+    def _run(self, method, statement, args, kwargs):
+        self._finish()
+        site = self.stats.current_site()
+        started = time.perf_counter()
+        try:
+            result = method(statement, *args, **kwargs)
+        finally:
+            rowcount = self.cursor.rowcount
+            self.current = [statement, time.perf_counter() - started, rowcount if rowcount and rowcount > 0 else 0, 0,
+                            site]
+        return self if result is self.cursor else result
+
+    def execute(self, statement, *args, **kwargs):
+        return self._run(self.cursor.execute, statement, args, kwargs)
+
+    def executemany(self, statement, *args, **kwargs):
+        return self._run(self.cursor.executemany, statement, args, kwargs)
+
+    def _fetch(self, method, *args):
+        started = time.perf_counter()
+        result = method(*args)
+        if self.current is not None:
+            self.current[1] += time.perf_counter() - started
+            if isinstance(result, list):
+                self.current[3] += len(result)
+            elif result is not None:
+                self.current[3] += 1
+        return result
+
+    def fetchone(self):
+        return self._fetch(self.cursor.fetchone)
+
+    def fetchmany(self, *args):
+        return self._fetch(self.cursor.fetchmany, *args)
+
+    def fetchall(self):
+        return self._fetch(self.cursor.fetchall)
+
+    def close(self):
+        self._finish()
+        self.cursor.close()
+
+    def __del__(self):
+        self._finish()
+
+
+class PreparedCursor(TimedCursor):
+    # Kept for one statement for the life of the real connection. close() only records the
+    # last run; the statement stays prepared on the server for the next one.
+    def close(self):
+        self._finish()
+
+
+class TimedConnection:
+    # Passes everything through to the real connection except cursor creation. statements is
+    # the backend's {statement: PreparedCursor} cache for this real connection, or None when
+    # the backend has no server-side prepared statements.
+    def __init__(self, conn, stats, statements=None):
+        self.conn = conn
+        self.stats = stats
+        self.statements = statements
+
+    def __getattr__(self, name):
+        return getattr(self.conn, name)
+
+    def cursor(self, *args, **kwargs):
+        return TimedCursor(self.conn.cursor(*args, **kwargs), self.stats, self)
+
+    def prepared(self, statement):
+        # A cursor for running statement; close it after use. With a cache, the statement is
+        # prepared on the first run and the same cursor re-executes it on every later one.
+        if self.statements is None:
+            return self.cursor()
+        cursor = self.statements.get(statement)
+        if cursor is None:
+            cursor = self.statements[statement] = PreparedCursor(self.conn.cursor(prepared=True), self.stats)
+        return cursor
+
+    def execute(self, statement, *args):
+        # sqlite3's shortcut; the returned cursor is recorded once it is read and dropped
+        return self.cursor().execute(statement, *args)
@@ -1,29 +1,41 @@
-import mysql.connector
+import argparse
+import csv
 import random
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
 from faker import Faker
-from dotenv import load_dotenv
+import storage
 import os
 
 # Initialize Faker for fake data generation
 fake = Faker()
 
-load_dotenv()  # Load variables from .env
+COURSES = ["Computer Science", "Electrical Engineering", "Mechanical Engineering",
+           "Physics", "Mathematics", "Biology", "Chemistry", "Business Administration"]
 
-conn = mysql.connector.connect(
-    host=os.getenv("DB_HOST", "localhost"),
-    user=os.getenv("DB_USER", "root"),
-    password=os.getenv("DB_PASSWORD", "yourpassword"),
-    database=os.getenv("DB_NAME", "librarydb")
-)
+AUTHORS = ["J.K. Rowling", "George R.R. Martin", "J.R.R. Tolkien",
+           "Stephen King", "Agatha Christie", "Dan Brown", "Harper Lee",
+           "Jane Austen", "Mark Twain", "Leo Tolstoy", "F. Scott Fitzgerald"]
 
-cursor = conn.cursor()
+GENRES = ["Fiction", "Science Fiction", "Fantasy", "Mystery", "Thriller",
+          "Romance", "Horror", "Biography", "History", "Science"]
+
+STATUSES = ["Available", "Issued"]
+
+STUDENT_COLUMNS = ("Card_ID", "Name", "Email", "Course", "Year")
+BOOK_COLUMNS = ("BK_NAME", "BK_ID", "AUTHOR_NAME", "GENRE", "BK_STATUS", "CARD_ID")
+
+# Opened in __main__ so worker processes can import this module without connecting
+store = None
+conn = None
 
 # Function to generate student data with unique emails
 def generate_students(count=30):
-    courses = ["Computer Science", "Electrical Engineering", "Mechanical Engineering", 
-               "Physics", "Mathematics", "Biology", "Chemistry", "Business Administration"]
-    
+    courses = COURSES
+
     used_emails = set()
+    rows = []
     
     for i in range(1, count+1):
         card_id = f"LIB-{i:04d}"
@@ -48,28 +60,24 @@ def generate_students(count=30):
         course = random.choice(courses)
         year = random.randint(1, 4)
         
-        cursor.execute("""
-            INSERT INTO Students (Card_ID, Name, Email, Course, Year)
-            VALUES (%s, %s, %s, %s, %s)
-        """, (card_id, name, email, course, year))
-    
-    conn.commit()
+        rows.append((card_id, name, email, course, year))
+
+    store.executemany(conn, """
+        INSERT INTO Students (Card_ID, Name, Email, Course, Year)
+        VALUES (%s, %s, %s, %s, %s)
+    """, rows)
     print(f"Generated {count} student records")
 
 # Function to generate book data
 def generate_books(count=50):
-    statuses = ["Available", "Issued"]
-    authors = ["J.K. Rowling", "George R.R. Martin", "J.R.R. Tolkien", 
-               "Stephen King", "Agatha Christie", "Dan Brown", "Harper Lee",
-               "Jane Austen", "Mark Twain", "Leo Tolstoy", "F. Scott Fitzgerald"]
-    
-    genres = ["Fiction", "Science Fiction", "Fantasy", "Mystery", "Thriller",
-              "Romance", "Horror", "Biography", "History", "Science"]
-    
+    statuses = STATUSES
+    authors = AUTHORS
+    genres = GENRES
+
     # Get all student card IDs for issuing books
-    cursor.execute("SELECT Card_ID FROM Students")
-    student_ids = [row[0] for row in cursor.fetchall()]
-    
+    student_ids = [row[0] for row in store.fetch_all(conn, "SELECT Card_ID FROM Students")]
+    rows = []
+
     for i in range(1, count+1):
         bk_id = f"BK-{i:04d}"
         genre = random.choice(genres)
@@ -83,30 +91,148 @@ def generate_books(count=50):
         if status == "Issued" and student_ids:
             card_id = random.choice(student_ids)
         
-        cursor.execute("""
-            INSERT INTO Library (BK_NAME, BK_ID, AUTHOR_NAME, GENRE, BK_STATUS, CARD_ID)
-            VALUES (%s, %s, %s, %s, %s, %s)
-        """, (bk_name, bk_id, author, genre, status, card_id))
-    
-    conn.commit()
+        rows.append((bk_name, bk_id, author, genre, status, card_id))
+
+    # Through the storage layer, which also handles the normalized schema
+    store.import_rows(conn, "Library", rows)
     print(f"Generated {count} book records")
 
+# ---------- Bulk seeding ----------
+# Rows are generated in chunks of card/book numbers [start, stop). Each chunk seeds its own
+# Faker and Random from (seed, start), so the output is identical for any worker count.
+
+def student_rows(start, stop, seed):
+    chunk_fake = Faker()
+    chunk_fake.seed_instance(seed * 1_000_003 + start)
+    rng = random.Random(seed * 1_000_003 + start)
+    rows = []
+    for i in range(start, stop):
+        name = chunk_fake.name()
+        name_parts = name.split()
+        # The card number makes the email unique without a retry loop
+        email = f"{name_parts[0].lower()}.{name_parts[-1].lower()}.{i}@university.edu"
+        rows.append((f"LIB-{i:04d}", name, email, rng.choice(COURSES), rng.randint(1, 4)))
+    return rows
+
+def book_rows(start, stop, seed, student_count):
+    chunk_fake = Faker()
+    chunk_fake.seed_instance(seed * 1_000_033 + start)
+    rng = random.Random(seed * 1_000_033 + start)
+    rows = []
+    for i in range(start, stop):
+        bk_name = f"{chunk_fake.word().capitalize()} {chunk_fake.word().capitalize()}"
+        if rng.random() > 0.7:
+            bk_name = f"The {bk_name}"
+        status = rng.choice(STATUSES)
+        card_id = None
+        if status == "Issued" and student_count:
+            card_id = f"LIB-{rng.randint(1, student_count):04d}"
+        rows.append((bk_name, f"BK-{i:04d}", rng.choice(AUTHORS), rng.choice(GENRES), status, card_id))
+    return rows
+
+def generate_chunks(make_rows, count, batch_size, workers, *args):
+    # Yield row chunks in order while keeping at most 2 * workers chunks in flight
+    starts = iter(range(1, count + 1, batch_size))
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = []
+        for start in starts:
+            pending.append(pool.submit(make_rows, start, min(start + batch_size, count + 1), *args))
+            if len(pending) >= 2 * workers:
+                yield pending.pop(0).result()
+        for future in pending:
+            yield future.result()
+
+def insert_rows(store, connection, table, columns, rows):
+    # One batched INSERT per chunk (mysql.connector rewrites executemany INSERTs into one
+    # multi-row statement); columns are always the table's storage.TABLES fields
+    store.import_rows(connection, table, rows)
+
+def load_rows(store, connection, table, columns, rows):
+    # MySQL only: the server parses the batch straight from a temporary CSV file
+    if table == "Library":
+        # Issued books are due a loan period from today, as import_rows would set them
+        due = storage.due_date()
+        rows = [row + (due if row[4] == "Issued" else None,) for row in rows]
+        columns = columns + ("Due_Date",)
+    with tempfile.NamedTemporaryFile("w", newline="", suffix=".csv", delete=False) as handle:
+        writer = csv.writer(handle, lineterminator="\n")
+        for row in rows:
+            writer.writerow(["\\N" if value is None else value for value in row])
+        path = handle.name
+    try:
+        bulk_cursor = connection.cursor()
+        bulk_cursor.execute(f"""
+            LOAD DATA LOCAL INFILE %s INTO TABLE {table}
+            FIELDS TERMINATED BY ',' OPTIONALLY ENCLOSED BY '"'
+            LINES TERMINATED BY '\\n'
+            ({', '.join(columns)})
+        """, (path,))
+        bulk_cursor.close()
+        connection.commit()
+    finally:
+        os.remove(path)
+
+def bulk_seed(store, connection, table, columns, make_rows, count, batch_size, workers, use_load_data, *args):
+    write = load_rows if use_load_data else insert_rows
+    started = time.perf_counter()
+    done = 0
+    for rows in generate_chunks(make_rows, count, batch_size, workers, *args):
+        write(store, connection, table, columns, rows)
+        done += len(rows)
+        elapsed = time.perf_counter() - started
+        print(f"\r{table}: {done}/{count} rows ({done / elapsed:,.0f} rows/sec)", end="", flush=True)
+    elapsed = time.perf_counter() - started
+    print(f"\r{table}: {done} rows in {elapsed:.1f}s ({done / max(elapsed, 1e-9):,.0f} rows/sec)")
+
+def generate_bulk(store, connection, students, books, batch_size=5000, workers=None, seed=42, use_load_data=False):
+    workers = workers or os.cpu_count() or 1
+    bulk_seed(store, connection, "Students", STUDENT_COLUMNS, student_rows, students,
+              batch_size, workers, use_load_data, seed)
+    bulk_seed(store, connection, "Library", BOOK_COLUMNS, book_rows, books,
+              batch_size, workers, use_load_data, seed, students)
+    if use_load_data:
+        # LOAD DATA bypasses storage, so the dashboard counters are recounted once at the end
+        store.reconcile_counters(connection)
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Populate the library database with fake data.")
+    parser.add_argument("--bulk", action="store_true", help="batched, parallel seeding for large datasets")
+    parser.add_argument("--students", type=int, default=30, help="number of students to generate")
+    parser.add_argument("--books", type=int, default=50, help="number of books to generate")
+    parser.add_argument("--batch-size", type=int, default=5000, help="rows per INSERT batch (bulk mode)")
+    parser.add_argument("--workers", type=int, default=None, help="generator processes (bulk mode, default: CPU count)")
+    parser.add_argument("--seed", type=int, default=42, help="random seed (bulk mode)")
+    parser.add_argument("--load-data", action="store_true",
+                        help="load batches with LOAD DATA LOCAL INFILE instead of INSERT (bulk mode)")
+    return parser.parse_args()
+
 # Main execution
 if __name__ == "__main__":
+    args = parse_args()
+    store = storage.open_storage(pool_size=1, allow_local_infile=True) if args.load_data \
+        else storage.open_storage(pool_size=1)
+    if args.load_data and not isinstance(store, storage.MySQLStorage):
+        raise SystemExit("--load-data needs the MySQL backend")
+    if args.load_data and isinstance(store, storage.NormalizedMySQLStorage):
+        raise SystemExit("--load-data needs the flat schema; Library is a view in the normalized one")
     try:
-        # Clear existing data (optional)
-        cursor.execute("DELETE FROM Library")
-        cursor.execute("DELETE FROM Students")
-        conn.commit()
-        print("Cleared existing data")
-        
-        # Generate new data
-        generate_students(30)  # Generate 30 students
-        generate_books(50)     # Generate 50 books
-        
+        store.migrate()
+        with store.connection() as conn:
+            # Clear existing data (optional)
+            store.delete_all_books(conn)
+            store.delete_all_students(conn)
+            # Let main.py re-seed the ID counters from the new data
+            store.reset_ids(conn)
+            print("Cleared existing data")
+
+            # Generate new data
+            if args.bulk:
+                generate_bulk(store, conn, args.students, args.books, args.batch_size,
+                              args.workers, args.seed, args.load_data)
+            else:
+                generate_students(args.students)
+                generate_books(args.books)
+
         print("Database populated successfully!")
     except Exception as e:
         print(f"Error: {e}")
-    finally:
-        cursor.close()
-        conn.close()
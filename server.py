@@ -0,0 +1,387 @@
+# Asyncio HTTP/JSON service for the catalog and circulation operations, so many desks and
+# kiosks can share one backend and one connection pool instead of each running its own:
+#
+#   python server.py --port 8080
+#
+# Requests are parsed on the event loop; the storage methods are blocking, so they run on
+# a thread pool with one thread per pooled connection (as in db.DbWorker). Single-row
+# lookups that arrive together are fetched with one IN (...) query, and hot reads (pages,
+# searches, counters) are cached for CACHE_TTL seconds and shared by identical requests
+# that arrive while one is running. Any write clears the cache. Only the standard library
+# is used, so the service runs wherever main.py does.
+#
+#   GET    /books?after=BK-0100&limit=100&sort=GENRE&desc=1&after_value=Fantasy&BK_STATUS=Issued
+#   GET    /books/search?q=harry+pot&limit=50
+#   GET    /books/BK-0012
+#   POST   /issue              {"card_id": "LIB-0007", "book_ids": ["BK-0012", "BK-0031"]}
+#   POST   /return             {"book_ids": ["BK-0012"]}
+#   GET    /students?after=LIB-0100&limit=100
+#   GET    /students/LIB-0007
+#   POST   /students           {"name": ..., "email": ..., "course": ..., "year": 2}
+#   PUT    /students/LIB-0007  {"name": ..., "email": ..., "course": ..., "year": 2}
+#   DELETE /students/LIB-0007
+#   GET    /counters
+#   GET    /metrics            (Prometheus text: query timings)
+#
+# Rows are JSON objects keyed by column name. List filters are column=value parameters
+# (column= matches NULL); with sort, pass the last row's sort value as after_value (also
+# required; after_value= when it is NULL).
+import argparse
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import json
+import re
+import sys
+from urllib.parse import urlsplit, parse_qsl
+
+import db
+import storage
+from cache import TTLCache
+
+DEFAULT_LIMIT = 100
+MAX_LIMIT = 1000
+# Cached responses per server, and how long one is served before it is read again
+CACHE_SIZE = 1024
+CACHE_TTL = 2.0
+# Keys fetched per batched lookup query
+MAX_BATCH = 500
+MAX_BODY = 1 << 20
+
+REASONS = {200: 'OK', 201: 'Created', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+           409: 'Conflict', 413: 'Payload Too Large', 500: 'Internal Server Error'}
+
+
+class HttpError(Exception):
+    def __init__(self, status, message, **details):
+        super().__init__(message)
+        self.status = status
+        self.details = details
+
+
+class Batcher:
+    # Collects the keys asked for during one pass of the event loop and fetches them with
+    # one query; every caller gets its own row (or None)
+    def __init__(self, service, fetch, key_index):
+        self.service = service
+        self.fetch = fetch
+        self.key_index = key_index
+        self.pending = {}  # key -> [futures]
+
+    async def get(self, key):
+        loop = asyncio.get_running_loop()
+        if not self.pending:
+            loop.call_soon(lambda: asyncio.ensure_future(self._flush()))
+        future = loop.create_future()
+        self.pending.setdefault(key, []).append(future)
+        return await future
+
+    async def _flush(self):
+        pending, self.pending = self.pending, {}
+        keys = list(pending)
+        for start in range(0, len(keys), MAX_BATCH):
+            chunk = keys[start:start + MAX_BATCH]
+            try:
+                rows = await self.service.run(self.fetch, chunk)
+            except Exception as error:
+                for key in chunk:
+                    for future in pending[key]:
+                        if not future.done():
+                            future.set_exception(error)
+                continue
+            found = {row[self.key_index]: row for row in rows}
+            for key in chunk:
+                for future in pending[key]:
+                    if not future.done():
+                        future.set_result(found.get(key))
+
+
+class LibraryService:
+    def __init__(self, store, threads):
+        self.store = store
+        self.executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix='db')
+        self.cache = TTLCache(CACHE_SIZE, CACHE_TTL)
+        self.inflight = {}  # cache key -> task already reading it
+        self.generation = 0  # bumped by every write, so reads started before it aren't cached
+        self.books = Batcher(self, store.get_books, 1)
+        self.students = Batcher(self, store.get_students, 0)
+        self.routes = [
+            ('GET', r'/books', self.list_books),
+            ('GET', r'/books/search', self.search_books),
+            ('GET', r'/books/([^/]+)', self.get_book),
+            ('POST', r'/issue', self.issue),
+            ('POST', r'/return', self.return_books),
+            ('GET', r'/students', self.list_students),
+            ('POST', r'/students', self.add_student),
+            ('GET', r'/students/([^/]+)', self.get_student),
+            ('PUT', r'/students/([^/]+)', self.update_student),
+            ('DELETE', r'/students/([^/]+)', self.delete_student),
+            ('GET', r'/counters', self.counters),
+            ('GET', r'/metrics', self.metrics),
+        ]
+
+    # ---------- Running storage jobs ----------
+    def _run(self, site, job, args):
+        with self.store.connection() as conn, self.store.stats.call_site(site):
+            return job(conn, *args)
+
+    async def run(self, job, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, self._run, f'server > {job.__name__}', job, args)
+
+    async def cached(self, key, job, *args):
+        value = self.cache.get(key)
+        if value is not None:
+            return value
+        task = self.inflight.get(key)
+        if task is None:
+            generation = self.generation
+            task = self.inflight[key] = asyncio.ensure_future(self.run(job, *args))
+
+            def finished(done):
+                if self.inflight.get(key) is done:
+                    del self.inflight[key]
+                if not done.cancelled() and done.exception() is None and generation == self.generation:
+                    self.cache.put(key, done.result())
+
+            task.add_done_callback(finished)
+        return await asyncio.shield(task)
+
+    async def write(self, job, *args):
+        try:
+            return await self.run(job, *args)
+        finally:
+            self.generation += 1
+            self.cache.clear()
+            self.inflight.clear()
+
+    # ---------- Request helpers ----------
+    @staticmethod
+    def limit(query):
+        try:
+            return max(1, min(int(query.get('limit', DEFAULT_LIMIT)), MAX_LIMIT))
+        except ValueError:
+            raise HttpError(400, 'limit must be a whole number') from None
+
+    def page_args(self, fields, key_column, query):
+        # (after_row, limit, sort, filters) for LibraryStorage._page from the query string
+        limit = self.limit(query)
+        sort_column = query.get('sort')
+        sort = (sort_column, query.get('desc', '').lower() in ('1', 'true', 'yes')) if sort_column else None
+        filters = {name: value or None for name, value in query.items() if name in fields}
+        after_row = None
+        if query.get('after'):
+            after_row = [None] * len(fields)
+            after_row[fields.index(key_column)] = query['after']
+            if sort_column in fields and sort_column != key_column:
+                # Without the sort value the seek would start after a NULL one: a wrong page
+                if 'after_value' not in query:
+                    raise HttpError(400, 'after_value is required with sort and after')
+                after_row[fields.index(sort_column)] = query['after_value'] or None
+        return after_row, limit, sort, filters
+
+    @staticmethod
+    def records(fields, rows):
+        return [dict(zip(fields, row)) for row in rows]
+
+    @staticmethod
+    def field(body, name, kind=str):
+        value = body.get(name)
+        if value is None or value == '':
+            raise HttpError(400, f'{name} is required')
+        try:
+            return kind(value)
+        except (TypeError, ValueError):
+            raise HttpError(400, f'{name} must be a whole number' if kind is int else f'{name} is invalid') from None
+
+    @staticmethod
+    def book_ids(body):
+        bk_ids = body.get('book_ids')
+        if not isinstance(bk_ids, list) or not all(isinstance(bk_id, str) for bk_id in bk_ids):
+            raise HttpError(400, 'book_ids must be a list of Book IDs')
+        return bk_ids
+
+    # ---------- Books ----------
+    async def list_books(self, query, body):
+        args = self.page_args(storage.BOOK_ROW_FIELDS, 'BK_ID', query)
+        rows = await self.cached(('books', tuple(sorted(query.items()))), self.store.list_books, *args)
+        return 200, self.records(storage.BOOK_ROW_FIELDS, rows)
+
+    async def search_books(self, query, body):
+        text = query.get('q', '').strip()
+        if not text:
+            raise HttpError(400, 'q is required')
+        limit = self.limit(query)
+        rows = await self.cached(('search', text.lower(), limit), self.store.search_books, text, limit)
+        return 200, self.records(storage.BOOK_ROW_FIELDS, rows)
+
+    async def get_book(self, query, body, bk_id):
+        row = await self.books.get(bk_id)
+        if row is None:
+            raise HttpError(404, f'{bk_id} does not exist')
+        return 200, dict(zip(storage.BOOK_ROW_FIELDS, row))
+
+    async def circulate(self, bk_ids, status, card_id=None):
+        try:
+            count = await self.write(self.store.circulate, bk_ids, status, card_id)
+        except storage.CirculationError as error:
+            raise HttpError(409, 'Nothing was saved', problems=error.problems) from None
+        return 200, {'count': count}
+
+    async def issue(self, query, body):
+        return await self.circulate(self.book_ids(body), 'Issued', self.field(body, 'card_id'))
+
+    async def return_books(self, query, body):
+        return await self.circulate(self.book_ids(body), 'Available')
+
+    # ---------- Students ----------
+    async def list_students(self, query, body):
+        args = self.page_args(storage.STUDENT_FIELDS, 'Card_ID', query)
+        rows = await self.cached(('students', tuple(sorted(query.items()))), self.store.list_students, *args)
+        return 200, self.records(storage.STUDENT_FIELDS, rows)
+
+    async def get_student(self, query, body, card_id):
+        row = await self.students.get(card_id)
+        if row is None:
+            raise HttpError(404, f'{card_id} is not registered')
+        return 200, dict(zip(storage.STUDENT_FIELDS, row))
+
+    def student_values(self, body):
+        return (self.field(body, 'name'), self.field(body, 'email'), self.field(body, 'course'),
+                self.field(body, 'year', int))
+
+    async def add_student(self, query, body):
+        values = self.student_values(body)
+        # Taken, not previewed, so concurrent requests each get their own Card ID
+        card_id = body.get('card_id') or await self.run(self.store.take_card_id)
+        try:
+            await self.write(self.store.add_student, (card_id,) + values)
+        except storage.IntegrityError:
+            raise HttpError(409, f'Card ID {card_id} already exists') from None
+        return 201, dict(zip(storage.STUDENT_FIELDS, (card_id,) + values))
+
+    async def update_student(self, query, body, card_id):
+        values = self.student_values(body)
+        if await self.students.get(card_id) is None:
+            raise HttpError(404, f'{card_id} is not registered')
+        await self.write(self.store.update_student, values + (card_id,))
+        return 200, dict(zip(storage.STUDENT_FIELDS, (card_id,) + values))
+
+    async def delete_student(self, query, body, card_id):
+        if await self.students.get(card_id) is None:
+            raise HttpError(404, f'{card_id} is not registered')
+        try:
+            await self.write(self.store.delete_student, card_id)
+        except storage.IntegrityError:
+            raise HttpError(409, f'{card_id} still has books issued') from None
+        return 200, {'deleted': card_id}
+
+    # ---------- Other ----------
+    async def counters(self, query, body):
+        return 200, await self.cached(('counters',), self.store.counters)
+
+    async def metrics(self, query, body):
+        return 200, self.store.stats.prometheus_text()
+
+    # ---------- HTTP ----------
+    async def dispatch(self, method, target, body):
+        # Returns (status, payload); payload is JSON-encodable, or text
+        url = urlsplit(target)
+        path = url.path.rstrip('/') or '/'
+        allowed = False
+        for route_method, pattern, handler in self.routes:
+            match = re.fullmatch(pattern, path)
+            if match is None:
+                continue
+            if route_method != method:
+                allowed = True
+                continue
+            try:
+                data = json.loads(body) if body else {}
+                if not isinstance(data, dict):
+                    raise ValueError('the body must be a JSON object')
+            except ValueError as error:
+                return 400, {'error': f'Invalid JSON body: {error}'}
+            try:
+                return await handler(dict(parse_qsl(url.query, keep_blank_values=True)), data, *match.groups())
+            except HttpError as error:
+                return error.status, {'error': str(error), **error.details}
+            except ValueError as error:
+                return 400, {'error': str(error)}
+            except Exception as error:
+                print(f'{method} {target}: {error!r}', file=sys.stderr)
+                return 500, {'error': 'Internal error'}
+        if allowed:
+            return 405, {'error': f'{method} is not allowed on {path}'}
+        return 404, {'error': f'No such resource: {path}'}
+
+    async def handle(self, reader, writer):
+        # One HTTP/1.1 connection; requests are answered in order and the connection is kept open
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line.strip():
+                    break
+                method, target, version = request_line.decode('latin-1').split()
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                length = int(headers.get('content-length') or 0)
+                if length > MAX_BODY:
+                    self.respond(writer, 413, {'error': 'Request body too large'}, False)
+                    await writer.drain()
+                    break
+                body = await reader.readexactly(length) if length else b''
+                status, payload = await self.dispatch(method.upper(), target, body)
+                keep_alive = version == 'HTTP/1.1' and headers.get('connection', '').lower() != 'close'
+                self.respond(writer, status, payload, keep_alive)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass  # client went away or sent something that isn't HTTP
+        finally:
+            writer.close()
+
+    @staticmethod
+    def respond(writer, status, payload, keep_alive):
+        if isinstance(payload, str):
+            content, content_type = payload.encode(), 'text/plain; version=0.0.4'
+        else:
+            content, content_type = json.dumps(payload, default=str).encode(), 'application/json'
+        writer.write(f'HTTP/1.1 {status} {REASONS.get(status, "")}\r\n'
+                     f'Content-Type: {content_type}\r\n'
+                     f'Content-Length: {len(content)}\r\n'
+                     f'Connection: {"keep-alive" if keep_alive else "close"}\r\n\r\n'.encode() + content)
+
+
+async def serve(service, host, port):
+    server = await asyncio.start_server(service.handle, host, port)
+    print(f'Listening on http://{host}:{port}', file=sys.stderr)
+    async with server:
+        await server.serve_forever()
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='HTTP/JSON API for the library database.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--threads', type=int, default=db.POOL_SIZE,
+                        help='database threads, and pooled connections (default: DB_POOL_SIZE)')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    store = storage.open_storage(pool_size=args.threads)
+    store.migrate()
+    service = LibraryService(store, args.threads)
+    try:
+        asyncio.run(serve(service, args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        service.executor.shutdown()
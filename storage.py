@@ -0,0 +1,1176 @@
+# Storage backends for the book and student operations.
+#
+# LibraryStorage holds the SQL every backend shares, written with %s placeholders, and
+# exposes each operation as method(conn, ...), the job signature db.DbWorker expects.
+# MySQLStorage and SQLiteStorage supply connections and the dialect-specific parts.
+# open_storage() picks one from DB_BACKEND in .env (mysql by default); DB_SCHEMA=normalized
+# selects NormalizedMySQLStorage, the integer-keyed MySQL layout.
+#
+# Only what every command needs is imported here; database drivers, the migrations and
+# datetime are imported where they are used, which keeps `python library.py` quick to start.
+from contextlib import contextmanager
+import os
+import re
+import sqlite3
+import threading
+
+import db
+from cache import TTLCache
+from id_allocator import IdAllocator, SEQUENCES
+from query_stats import QueryStats, TimedConnection
+
+BOOK_FIELDS = ('BK_NAME', 'BK_ID', 'AUTHOR_NAME', 'GENRE', 'BK_STATUS', 'CARD_ID')
+STUDENT_FIELDS = ('Card_ID', 'Name', 'Email', 'Course', 'Year')
+BOOK_COLUMNS = ', '.join(BOOK_FIELDS)
+STUDENT_COLUMNS = ', '.join(STUDENT_FIELDS)
+# Book rows read for display also carry the row version, which every write to a book
+# increments; update_book compares it to detect edits made at another desk meanwhile
+BOOK_ROW_FIELDS = BOOK_FIELDS + ('Row_Version',)
+BOOK_ROW_COLUMNS = ', '.join(BOOK_ROW_FIELDS)
+
+# Named registry of the fixed statements every desk runs over and over: the issuer check,
+# one-book reads and writes, the change log and the dashboard. run_query() executes them as
+# server-side prepared statements on MySQL, one prepared cursor per statement and pooled
+# connection, parsed once and then re-executed with new values. SQLite's per-connection
+# statement cache reuses them by their text. Statements whose text varies (IN lists of any
+# length, sorted and filtered pages, searches) stay plain queries.
+QUERIES = {
+    'card_exists': 'SELECT 1 FROM Students WHERE Card_ID = %s',
+    'find_student': f'SELECT {STUDENT_COLUMNS} FROM Students WHERE Card_ID = %s',
+    'get_book': f'SELECT {BOOK_ROW_COLUMNS} FROM Library WHERE BK_ID = %s',
+    'current_book': 'SELECT BK_ID, BK_NAME, GENRE, BK_STATUS, CARD_ID FROM Library WHERE BK_ID = %s',
+    'book_counts': 'SELECT l.GENRE, l.BK_STATUS, s.Course FROM Library l '
+                   'LEFT JOIN Students s ON s.Card_ID = l.CARD_ID WHERE l.BK_ID = %s',
+    # Writes to the flat Library table (NormalizedMySQLStorage writes Books its own way).
+    # Due_Date is set first because MySQL evaluates the assignments in order and needs the old row.
+    'insert_book': f"INSERT INTO Library ({BOOK_COLUMNS}, Due_Date) VALUES ({', '.join(['%s'] * (len(BOOK_FIELDS) + 1))})",
+    'update_book': '''
+        UPDATE Library SET
+        Due_Date=CASE WHEN %s <> 'Issued' THEN NULL
+                      WHEN BK_STATUS = 'Issued' AND CARD_ID = %s THEN Due_Date ELSE %s END,
+        BK_NAME=%s, BK_STATUS=%s, AUTHOR_NAME=%s, GENRE=%s, CARD_ID=%s, Row_Version=Row_Version + 1
+        WHERE BK_ID=%s
+    ''',
+    'update_book_at_version': '''
+        UPDATE Library SET
+        Due_Date=CASE WHEN %s <> 'Issued' THEN NULL
+                      WHEN BK_STATUS = 'Issued' AND CARD_ID = %s THEN Due_Date ELSE %s END,
+        BK_NAME=%s, BK_STATUS=%s, AUTHOR_NAME=%s, GENRE=%s, CARD_ID=%s, Row_Version=Row_Version + 1
+        WHERE BK_ID=%s AND Row_Version=%s
+    ''',
+    'set_status': 'UPDATE Library SET BK_STATUS=%s, CARD_ID=%s, Due_Date=%s, Row_Version=Row_Version + 1 '
+                  'WHERE BK_ID = %s',
+    'set_status_from': 'UPDATE Library SET BK_STATUS=%s, CARD_ID=%s, Due_Date=%s, Row_Version=Row_Version + 1 '
+                       'WHERE BK_ID = %s AND BK_STATUS=%s',
+    'log_change': 'INSERT INTO Change_Log (Table_Name, Row_Key, Changed_At) VALUES (%s, %s, %s)',
+    'loan_event': 'INSERT INTO Loan_Events (Event_Time, Event_Type, BK_ID, CARD_ID) VALUES (%s, %s, %s, %s)',
+    'changes_since': 'SELECT Change_ID, Table_Name, Row_Key FROM Change_Log '
+                     'WHERE Change_ID > %s ORDER BY Change_ID LIMIT %s',
+    'counters': 'SELECT Kind, Name, Value FROM Catalog_Counters WHERE Value <> 0 ORDER BY Kind, Value DESC, Name',
+}
+
+# Tables that can be exported and imported: table -> (fields, key column, ID sequence)
+TABLES = {
+    'Library': (BOOK_FIELDS, 'BK_ID', 'book'),
+    'Students': (STUDENT_FIELDS, 'Card_ID', 'student'),
+}
+
+# InnoDB's default innodb_ft_min_token_size; shorter words fall back to a prefix LIKE
+FT_MIN_TOKEN = 3
+
+# Registered Card IDs remembered for issuing. Another desk deleting a card is picked up
+# after CARD_CACHE_TTL seconds; until then the foreign key still rejects the issue.
+CARD_CACHE_SIZE = 10000
+CARD_CACHE_TTL = 300
+
+# A write touching more rows than this is logged as a change to the whole table ('*'),
+# so desks reload it instead of re-reading thousands of keys
+CHANGE_LOG_MAX_KEYS = 500
+
+
+def due_date(issued=None):
+    # 'YYYY-MM-DD', db.LOAN_DAYS after the day a book is issued (today by default)
+    from datetime import date, timedelta
+
+    return ((issued or date.today()) + timedelta(days=db.LOAN_DAYS)).isoformat()
+
+
+class IntegrityError(Exception):
+    # Duplicate keys and foreign-key violations, whichever backend raised them
+    pass
+
+
+class CirculationError(Exception):
+    # A batch issue/return was rejected; nothing was written. problems lists the reasons.
+    def __init__(self, problems):
+        super().__init__('; '.join(problems))
+        self.problems = problems
+
+
+class ConflictError(Exception):
+    # A compare-and-set update found the row changed (or deleted) at another desk; nothing was written
+    pass
+
+
+class LibraryStorage:
+    integrity_errors = ()
+
+    def __init__(self):
+        self.ids = IdAllocator(self.reserve_ids)
+        self.valid_cards = TTLCache(CARD_CACHE_SIZE, CARD_CACHE_TTL)
+        # Every connection handed out is wrapped so its statements are timed
+        self.stats = QueryStats(db.SLOW_QUERY_MS / 1000, db.SLOW_QUERY_LOG)
+
+    # ---------- Connections and statements ----------
+    def connection(self):
+        raise NotImplementedError
+
+    def migrate(self):
+        raise NotImplementedError
+
+    def reserve_ids(self, conn, name, count):
+        # Atomically advance the named counter by count; returns the new end of the block
+        raise NotImplementedError
+
+    def sql(self, statement):
+        return statement
+
+    def increment_sql(self, table, columns, keys):
+        # INSERT a row with Loans = 1, or add 1 to Loans if the key already exists
+        raise NotImplementedError
+
+    def add_sql(self, table, columns, keys, total):
+        # INSERT a row (the last value is total), or add that value to total if the key already exists
+        raise NotImplementedError
+
+    def upsert_sql(self, table, columns, key, version=None):
+        # INSERT a row, or overwrite the other columns if the key already exists (and increment
+        # the version column, if given)
+        raise NotImplementedError
+
+    def upsert_select_sql(self, table, columns, keys, select, updates):
+        # INSERT the rows of a SELECT, overwriting the updates columns of keys that already exist.
+        # SQLite needs the SELECT to end in a WHERE clause to parse this.
+        raise NotImplementedError
+
+    def days_since_sql(self, column):
+        # Whole days from the date column to the date passed as the one parameter
+        raise NotImplementedError
+
+    def stream_cursor(self, conn):
+        # A cursor that fetches result rows as they are read instead of all at once
+        return conn.cursor()
+
+    def fetch_all(self, conn, statement, params=()):
+        cursor = conn.cursor()
+        try:
+            cursor.execute(self.sql(statement), params)
+            return cursor.fetchall()
+        finally:
+            cursor.close()
+
+    def fetch_one(self, conn, statement, params=()):
+        rows = self.fetch_all(conn, statement, params)
+        return rows[0] if rows else None
+
+    def execute(self, conn, statement, params=(), many=False):
+        cursor = conn.cursor()
+        try:
+            if many:
+                cursor.executemany(self.sql(statement), params)
+            else:
+                cursor.execute(self.sql(statement), params)
+            conn.commit()
+            return cursor.rowcount
+        except self.integrity_errors as error:
+            conn.rollback()
+            raise IntegrityError(str(error)) from error
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            cursor.close()
+
+    def executemany(self, conn, statement, rows):
+        return self.execute(conn, statement, rows, many=True)
+
+    def run_query(self, conn, name, params=()):
+        # Runs QUERIES[name] on conn (inside a transaction: cursor.connection) and returns
+        # (rows, rowcount). Nothing is committed here.
+        statement = self.sql(QUERIES[name])
+        cursor = conn.prepared(statement)
+        try:
+            cursor.execute(statement, params)
+            rows = cursor.fetchall() if cursor.description else []
+            return rows, cursor.rowcount
+        finally:
+            cursor.close()
+
+    @contextmanager
+    def transaction(self, conn):
+        # Yields a cursor whose statements commit together, or not at all on any exception
+        cursor = conn.cursor()
+        try:
+            yield cursor
+            conn.commit()
+        except self.integrity_errors as error:
+            conn.rollback()
+            raise IntegrityError(str(error)) from error
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            cursor.close()
+
+    def _seek(self, sort_column, key_column, descending, value, key):
+        # Rows after (value, key) in ORDER BY sort_column, key_column. Both backends sort NULLs
+        # first ascending and last descending, so NULL sort values need their own branch.
+        if sort_column == key_column:
+            return f"{key_column} {'<' if descending else '>'} %s", [key]
+        if not descending:
+            if value is None:
+                return f'({sort_column} IS NOT NULL OR {key_column} > %s)', [key]
+            return f'({sort_column} > %s OR ({sort_column} = %s AND {key_column} > %s))', [value, value, key]
+        if value is None:
+            return f'({sort_column} IS NULL AND {key_column} < %s)', [key]
+        return (f'({sort_column} < %s OR ({sort_column} = %s AND {key_column} < %s) OR {sort_column} IS NULL)',
+                [value, value, key])
+
+    def _page(self, conn, table, fields, key_column, after_row, limit, sort=None, filters=None):
+        # Keyset pagination: seek past the last row already shown instead of using OFFSET.
+        # sort is (column, descending); filters maps column -> value (None matches NULL).
+        # Both are applied in SQL so the indexes on these columns do the work.
+        sort_column, descending = sort or (key_column, False)
+        filters = filters or {}
+        if sort_column not in fields or any(column not in fields for column in filters):
+            raise ValueError(f'Unknown column for {table}')
+
+        conditions, params = [], []
+        for column, value in filters.items():
+            if value is None:
+                conditions.append(f'{column} IS NULL')
+            else:
+                conditions.append(f'{column} = %s')
+                params.append(value)
+        if after_row is not None:
+            condition, seek_params = self._seek(sort_column, key_column, descending,
+                                                after_row[fields.index(sort_column)],
+                                                after_row[fields.index(key_column)])
+            conditions.append(condition)
+            params.extend(seek_params)
+
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+        direction = 'DESC' if descending else 'ASC'
+        order = f'{sort_column} {direction}'
+        if sort_column != key_column:
+            order += f', {key_column} {direction}'
+        return self.fetch_all(conn, f'SELECT {", ".join(fields)} FROM {table} {where} ORDER BY {order} LIMIT %s',
+                              tuple(params) + (limit,))
+
+    def _by_keys(self, conn, table, columns, key_column, keys):
+        if not keys:
+            return []
+        marks = ', '.join(['%s'] * len(keys))
+        return self.fetch_all(conn, f'SELECT {columns} FROM {table} WHERE {key_column} IN ({marks})', tuple(keys))
+
+    def _prefix_search(self, conn, text, limit):
+        prefix = re.sub(r'([%_\\])', r'\\\1', text.strip()) + '%'
+        return self.fetch_all(conn, f'''
+            SELECT {BOOK_ROW_COLUMNS} FROM Library
+            WHERE BK_NAME LIKE %s OR AUTHOR_NAME LIKE %s OR GENRE LIKE %s
+            LIMIT %s
+        ''', (prefix, prefix, prefix, limit))
+
+    # ---------- Loan history ----------
+    def _current(self, cursor, bk_ids):
+        if len(bk_ids) == 1:
+            return {row[0]: row[1:] for row in self.run_query(cursor.connection, 'current_book', tuple(bk_ids))[0]}
+        marks = ', '.join(['%s'] * len(bk_ids))
+        cursor.execute(self.sql(f'SELECT BK_ID, BK_NAME, GENRE, BK_STATUS, CARD_ID FROM Library '
+                                f'WHERE BK_ID IN ({marks})'), tuple(bk_ids))
+        return {row[0]: row[1:] for row in cursor.fetchall()}
+
+    def _record_loans(self, cursor, event_type, loans):
+        # loans: [(BK_ID, BK_NAME, GENRE, CARD_ID)]. Appends to Loan_Events and, for issues,
+        # bumps this month's per-book, per-genre and per-student counters in the same transaction.
+        if not loans:
+            return
+        from datetime import datetime
+
+        now = datetime.now()
+        timestamp, period = now.strftime('%Y-%m-%d %H:%M:%S'), now.strftime('%Y-%m')
+        events = [(timestamp, event_type, bk_id, card) for bk_id, _, _, card in loans]
+        if len(events) == 1:
+            self.run_query(cursor.connection, 'loan_event', events[0])
+        else:
+            cursor.executemany(self.sql(QUERIES['loan_event']), events)
+        if event_type != 'issue':
+            return
+        cursor.executemany(self.sql(self.increment_sql('Book_Loan_Stats', ('Period', 'BK_ID', 'BK_NAME'),
+                                                       ('Period', 'BK_ID'))),
+                           [(period, bk_id, name) for bk_id, name, _, _ in loans])
+        cursor.executemany(self.sql(self.increment_sql('Genre_Loan_Stats', ('Period', 'GENRE'), ('Period', 'GENRE'))),
+                           [(period, genre or 'Unknown') for _, _, genre, _ in loans])
+        cursor.executemany(self.sql(self.increment_sql('Student_Loan_Stats', ('Period', 'CARD_ID'),
+                                                       ('Period', 'CARD_ID'))),
+                           [(period, card) for _, _, _, card in loans if card])
+
+    def _record_change(self, cursor, bk_id, old, name, genre, status, card_id):
+        # old: (BK_NAME, GENRE, BK_STATUS, CARD_ID) before the update
+        old_status, old_card = old[2], old[3]
+        if old_status == 'Issued' and (status != 'Issued' or card_id != old_card):
+            self._record_loans(cursor, 'return', [(bk_id, old[0], old[1], old_card)])
+        if status == 'Issued' and (old_status != 'Issued' or card_id != old_card):
+            self._record_loans(cursor, 'issue', [(bk_id, name, genre, card_id)])
+
+    def loan_stats(self, conn, first_period=None, last_period=None, limit=20):
+        # Most borrowed books, genres and students between two 'YYYY-MM' periods (inclusive).
+        # Reads only the summary tables, never Loan_Events.
+        conditions, params = [], []
+        if first_period:
+            conditions.append('Period >= %s')
+            params.append(first_period)
+        if last_period:
+            conditions.append('Period <= %s')
+            params.append(last_period)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+        params = tuple(params) + (limit,)
+        return {
+            'books': self.fetch_all(conn, f'SELECT BK_ID, MAX(BK_NAME), SUM(Loans) AS Total FROM Book_Loan_Stats '
+                                          f'{where} GROUP BY BK_ID ORDER BY Total DESC LIMIT %s', params),
+            'genres': self.fetch_all(conn, f'SELECT GENRE, SUM(Loans) AS Total FROM Genre_Loan_Stats '
+                                           f'{where} GROUP BY GENRE ORDER BY Total DESC LIMIT %s', params),
+            'students': self.fetch_all(conn, f'''
+                SELECT t.CARD_ID, s.Name, t.Total FROM (
+                    SELECT CARD_ID, SUM(Loans) AS Total FROM Student_Loan_Stats
+                    {where} GROUP BY CARD_ID ORDER BY Total DESC LIMIT %s
+                ) t LEFT JOIN Students s ON s.Card_ID = t.CARD_ID
+                ORDER BY t.Total DESC
+            ''', params),
+        }
+
+    # ---------- Dashboard counters ----------
+    # Catalog_Counters holds (Kind, Name) -> Value: books per status ('status'), books per
+    # genre ('genre') and outstanding loans per course of the issuer ('course'). Every write
+    # counts the rows it touches before and after the change and adds the difference in the
+    # same transaction, so the dashboard reads a few dozen rows however big the catalog is.
+    # reconcile_counters() recounts from the tables to correct any drift.
+    def _book_counts(self, cursor, bk_ids):
+        from collections import Counter
+
+        counts = Counter()
+        if not bk_ids:
+            return counts
+        if len(bk_ids) == 1:
+            rows = self.run_query(cursor.connection, 'book_counts', tuple(bk_ids))[0]
+        else:
+            marks = ', '.join(['%s'] * len(bk_ids))
+            cursor.execute(self.sql(f'SELECT l.GENRE, l.BK_STATUS, s.Course FROM Library l '
+                                    f'LEFT JOIN Students s ON s.Card_ID = l.CARD_ID WHERE l.BK_ID IN ({marks})'),
+                           tuple(bk_ids))
+            rows = cursor.fetchall()
+        for genre, status, course in rows:
+            counts['status', 'Unknown' if status is None else status] += 1
+            counts['genre', 'Unknown' if genre is None else genre] += 1
+            if status == 'Issued':
+                counts['course', 'Unknown' if course is None else course] += 1
+        return counts
+
+    def _course_counts(self, cursor, card_ids):
+        # Outstanding loans of the given cards, by their course
+        from collections import Counter
+
+        counts = Counter()
+        if not card_ids:
+            return counts
+        marks = ', '.join(['%s'] * len(card_ids))
+        cursor.execute(self.sql(f"SELECT s.Course FROM Library l JOIN Students s ON s.Card_ID = l.CARD_ID "
+                                f"WHERE l.CARD_ID IN ({marks}) AND l.BK_STATUS = 'Issued'"), tuple(card_ids))
+        for (course,) in cursor.fetchall():
+            counts['course', 'Unknown' if course is None else course] += 1
+        return counts
+
+    def _add_counts(self, cursor, before, after):
+        after.subtract(before)
+        # In key order, so concurrent issues and returns lock the shared counter rows in the
+        # same order and cannot deadlock each other
+        changes = sorted((kind, name, value) for (kind, name), value in after.items() if value)
+        if changes:
+            cursor.executemany(self.sql(self.add_sql('Catalog_Counters', ('Kind', 'Name'), ('Kind', 'Name'), 'Value')),
+                               changes)
+
+    def counters(self, conn):
+        # {kind: [(name, value)]}, largest first
+        result = {'status': [], 'genre': [], 'course': []}
+        for kind, name, value in self.run_query(conn, 'counters')[0]:
+            result.setdefault(kind, []).append((name, value))
+        return result
+
+    def reconcile_counters(self, conn):
+        # Full recount (one scan of Library); returns the number of counters that were wrong
+        import migrations
+
+        old = {(kind, name): value for kind, name, value in
+               self.fetch_all(conn, 'SELECT Kind, Name, Value FROM Catalog_Counters WHERE Value <> 0')}
+        with self.transaction(conn) as cursor:
+            cursor.execute('DELETE FROM Catalog_Counters')
+            for statement in migrations.COUNTER_RECOUNT:
+                cursor.execute(statement)
+        new = {(kind, name): value for kind, name, value in
+               self.fetch_all(conn, 'SELECT Kind, Name, Value FROM Catalog_Counters WHERE Value <> 0')}
+        return sum(1 for key in old.keys() | new.keys() if old.get(key) != new.get(key))
+
+    # ---------- Due dates and fines ----------
+    def assess_overdue(self, conn, today=None, per_day=db.FINE_PER_DAY, maximum=db.FINE_MAX,
+                       reminder_days=db.REMINDER_DAYS):
+        # The scheduled overdue job (library.py overdue), as three set-based statements in one
+        # transaction. First, fine every loan past its due date, found through the due-date index.
+        # Then queue a notice for each one whose reminder is due, and move its next reminder on.
+        # The work grows with the number of overdue loans, not the catalog. Running it again on
+        # the same day only refreshes the same rows. Returns (overdue loans, total fines, notices).
+        from datetime import date, datetime, timedelta
+
+        today = today or date.today()
+        day, next_notice = today.isoformat(), (today + timedelta(days=reminder_days)).isoformat()
+        fields = ('BK_ID', 'Due_Date', 'CARD_ID', 'Days_Overdue', 'Amount', 'Assessed_On', 'Next_Notice')
+        overdue = f'''
+            SELECT BK_ID, Due_Date, CARD_ID, Days, CASE WHEN Days * %s > %s THEN %s ELSE Days * %s END, %s, %s
+            FROM (SELECT BK_ID, Due_Date, CARD_ID, {self.days_since_sql('Due_Date')} AS Days FROM Library
+                  WHERE BK_STATUS = 'Issued' AND Due_Date < %s AND CARD_ID IS NOT NULL) loans
+            WHERE Days > 0
+        '''
+        with self.transaction(conn) as cursor:
+            # A loan seen for the first time gets its first notice today
+            cursor.execute(self.sql(self.upsert_select_sql('Fines', fields, ('BK_ID', 'Due_Date'), overdue,
+                                                           ('CARD_ID', 'Days_Overdue', 'Amount', 'Assessed_On'))),
+                           (per_day, maximum, maximum, per_day, day, day, day, day))
+            # Loans returned since the last run keep their last fine but are not reassessed
+            cursor.execute(self.sql('''
+                INSERT INTO Notification_Queue (CARD_ID, BK_ID, Due_Date, Days_Overdue, Amount, Created_At)
+                SELECT CARD_ID, BK_ID, Due_Date, Days_Overdue, Amount, %s FROM Fines
+                WHERE Assessed_On = %s AND Next_Notice <= %s
+            '''), (datetime.now().strftime('%Y-%m-%d %H:%M:%S'), day, day))
+            notices = cursor.rowcount
+            cursor.execute(self.sql('UPDATE Fines SET Next_Notice = %s WHERE Assessed_On = %s AND Next_Notice <= %s'),
+                           (next_notice, day, day))
+            cursor.execute(self.sql('SELECT COUNT(*), COALESCE(SUM(Amount), 0) FROM Fines WHERE Assessed_On = %s'),
+                           (day,))
+            loans, total = cursor.fetchone()
+        return loans, total, notices
+
+    def overdue_loans(self, conn, limit):
+        # Loans found overdue by the latest run, longest overdue first
+        return self.fetch_all(conn, '''
+            SELECT f.CARD_ID, s.Name, f.BK_ID, f.Due_Date, f.Days_Overdue, f.Amount
+            FROM Fines f LEFT JOIN Students s ON s.Card_ID = f.CARD_ID
+            WHERE f.Assessed_On = (SELECT MAX(Assessed_On) FROM Fines)
+            ORDER BY f.Days_Overdue DESC LIMIT %s
+        ''', (limit,))
+
+    def pending_notifications(self, conn, limit):
+        # Oldest unsent notices, with what a mailer needs to send them
+        return self.fetch_all(conn, '''
+            SELECT n.Notice_ID, n.CARD_ID, s.Name, s.Email, n.BK_ID, l.BK_NAME, n.Due_Date, n.Days_Overdue, n.Amount
+            FROM Notification_Queue n
+            LEFT JOIN Students s ON s.Card_ID = n.CARD_ID
+            LEFT JOIN Library l ON l.BK_ID = n.BK_ID
+            WHERE n.Sent_At IS NULL
+            ORDER BY n.Notice_ID LIMIT %s
+        ''', (limit,))
+
+    def mark_notifications_sent(self, conn, notice_ids):
+        from datetime import datetime
+
+        if not notice_ids:
+            return 0
+        marks = ', '.join(['%s'] * len(notice_ids))
+        return self.execute(conn, f'UPDATE Notification_Queue SET Sent_At = %s WHERE Notice_ID IN ({marks})',
+                            (datetime.now().strftime('%Y-%m-%d %H:%M:%S'), *notice_ids))
+
+    # ---------- Change feed ----------
+    # Every write appends (table, key) rows to Change_Log in its own transaction. Desks
+    # remember the last Change_ID they applied and poll for newer ones (see change_feed.py),
+    # which is one primary-key range scan per poll, then re-read just those rows.
+    def _log_changes(self, cursor, table, keys):
+        from datetime import datetime
+
+        keys = list(dict.fromkeys(keys))
+        if len(keys) > CHANGE_LOG_MAX_KEYS:
+            keys = ['*']
+        if not keys:
+            return
+        now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        if len(keys) == 1:
+            self.run_query(cursor.connection, 'log_change', (table, keys[0], now))
+        else:
+            cursor.executemany(self.sql(QUERIES['log_change']), [(table, key, now) for key in keys])
+
+    def last_change_id(self, conn):
+        return self.fetch_one(conn, 'SELECT COALESCE(MAX(Change_ID), 0) FROM Change_Log')[0]
+
+    def changes_since(self, conn, after_id, limit, missing=()):
+        # [(Change_ID, Table_Name, Row_Key)] after after_id, plus any of the missing IDs that
+        # have been committed since the last poll, oldest first
+        if not missing:
+            return self.run_query(conn, 'changes_since', (after_id, limit))[0]
+        marks = ', '.join(['%s'] * len(missing))
+        return self.fetch_all(conn, f'SELECT Change_ID, Table_Name, Row_Key FROM Change_Log '
+                                    f'WHERE Change_ID > %s OR Change_ID IN ({marks}) ORDER BY Change_ID LIMIT %s',
+                              (after_id, *missing, limit))
+
+    def prune_changes(self, conn, days):
+        # Drops entries older than days; a desk that was closed longer than that reloads anyway
+        from datetime import datetime, timedelta
+
+        cutoff = (datetime.now() - timedelta(days=days)).strftime('%Y-%m-%d %H:%M:%S')
+        return self.execute(conn, 'DELETE FROM Change_Log WHERE Changed_At < %s', (cutoff,))
+
+    # ---------- Import and export ----------
+    def stream_rows(self, conn, table, batch_size):
+        # Yields the whole table in key order, batch_size rows at a time, from a server-side
+        # cursor, so memory use does not grow with the table
+        fields, key_column, _ = TABLES[table]
+        cursor = self.stream_cursor(conn)
+        try:
+            cursor.execute(f'SELECT {", ".join(fields)} FROM {table} ORDER BY {key_column}')
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                yield rows
+        finally:
+            cursor.close()
+
+    def existing_keys(self, conn, table, keys):
+        _, key_column, _ = TABLES[table]
+        if not keys:
+            return set()
+        marks = ', '.join(['%s'] * len(keys))
+        return {row[0] for row in self.fetch_all(
+            conn, f'SELECT {key_column} FROM {table} WHERE {key_column} IN ({marks})', tuple(keys))}
+
+    def import_rows(self, conn, table, rows, upsert=False):
+        # One batched INSERT (or upsert) in one transaction. Loan history is not recorded for
+        # imported books, but issued ones are due LOAN_DAYS from the import like any other loan;
+        # the ID counter is moved past the highest imported ID.
+        fields, key_column, sequence = TABLES[table]
+        key_index = fields.index(key_column)
+        keys = [row[key_index] for row in rows]
+        count = self._book_counts if table == 'Library' else self._course_counts
+        with self.transaction(conn) as cursor:
+            # New rows count nothing before; only an upsert can change existing ones
+            before = count(cursor, keys) if upsert else count(cursor, [])
+            if table == 'Library':
+                self._write_books(cursor, rows, upsert, due_date())
+                if upsert:
+                    self._default_due_dates(cursor, keys)
+            else:
+                if upsert:
+                    statement = self.upsert_sql(table, fields, key_column)
+                else:
+                    statement = f"INSERT INTO {table} ({', '.join(fields)}) VALUES ({', '.join(['%s'] * len(fields))})"
+                cursor.executemany(self.sql(statement), rows)
+            if table == 'Library' or upsert:
+                self._add_counts(cursor, before, count(cursor, keys))
+            self._log_changes(cursor, table, keys)
+            self._advance_ids(cursor, sequence, keys)
+        if table == 'Students' and upsert:
+            for row in rows:
+                self.valid_cards.invalidate(row[key_index])
+        return len(rows)
+
+    def _advance_ids(self, cursor, name, keys):
+        prefix = SEQUENCES[name][0]
+        numbers = [int(key[len(prefix):]) for key in keys if key.startswith(prefix) and key[len(prefix):].isdigit()]
+        if numbers:
+            # Counters that don't exist yet are seeded from MAX() on first use anyway
+            cursor.execute(self.sql('UPDATE ID_Sequences SET Next_Value = %s WHERE Name = %s AND Next_Value <= %s'),
+                           (max(numbers) + 1, name, max(numbers)))
+
+    # ---------- Book writes ----------
+    # Every write to the book table goes through these, so a backend with a different
+    # physical layout (NormalizedMySQLStorage) only has to override them. Library is then
+    # a view, and all reads stay as they are.
+    books_table = 'Library'
+
+    def _write_books(self, cursor, rows, upsert=False, due=None):
+        # rows: (BK_NAME, BK_ID, AUTHOR_NAME, GENRE, BK_STATUS, CARD_ID). With due (not for
+        # upserts, see _default_due_dates), the issued ones are due back on that date.
+        if upsert:
+            cursor.executemany(self.sql(self.upsert_sql('Library', BOOK_FIELDS, 'BK_ID', 'Row_Version')), rows)
+            return
+        rows = [tuple(row) + (due if row[4] == 'Issued' else None,) for row in rows]
+        if len(rows) == 1:
+            self.run_query(cursor.connection, 'insert_book', rows[0])
+        else:
+            cursor.executemany(self.sql(QUERIES['insert_book']), rows)
+
+    def _default_due_dates(self, cursor, bk_ids):
+        # After an upsert: issued books keep the due date they had or are due LOAN_DAYS from
+        # today, and books that are not issued lose theirs
+        marks = ', '.join(['%s'] * len(bk_ids))
+        cursor.execute(self.sql(f"UPDATE {self.books_table} SET Due_Date = CASE WHEN BK_STATUS = 'Issued' "
+                                f"THEN COALESCE(Due_Date, %s) END WHERE BK_ID IN ({marks})"),
+                       (due_date(), *bk_ids))
+
+    def _update_book(self, cursor, values, version=None):
+        # values: (BK_NAME, BK_STATUS, AUTHOR_NAME, GENRE, CARD_ID, BK_ID). With a version, only
+        # a row still at that version is changed; returns the number of rows changed
+        # A book issued here, or to a different student, is due LOAN_DAYS from today
+        _, status, _, _, card_id, _ = values
+        params = (status, card_id, due_date()) + tuple(values)
+        if version is None:
+            return self.run_query(cursor.connection, 'update_book', params)[1]
+        return self.run_query(cursor.connection, 'update_book_at_version', params + (version,))[1]
+
+    def _set_status(self, cursor, bk_ids, status, card_id, expected=None):
+        # Sets status and issuer of the given books (only those currently in status expected,
+        # if given), and the due date of issued ones; returns the number of rows changed
+        due = due_date() if status == 'Issued' else None
+        if len(bk_ids) == 1 and expected:
+            return self.run_query(cursor.connection, 'set_status_from', (status, card_id, due, bk_ids[0], expected))[1]
+        if len(bk_ids) == 1:
+            return self.run_query(cursor.connection, 'set_status', (status, card_id, due, bk_ids[0]))[1]
+        marks = ', '.join(['%s'] * len(bk_ids))
+        condition = ' AND BK_STATUS=%s' if expected else ''
+        cursor.execute(self.sql(f'UPDATE Library SET BK_STATUS=%s, CARD_ID=%s, Due_Date=%s, '
+                                f'Row_Version=Row_Version + 1 WHERE BK_ID IN ({marks}){condition}'),
+                       (status, card_id, due, *bk_ids) + ((expected,) if expected else ()))
+        return cursor.rowcount
+
+    # ---------- Books ----------
+    def list_books(self, conn, after_row, limit, sort=None, filters=None):
+        return self._page(conn, 'Library', BOOK_ROW_FIELDS, 'BK_ID', after_row, limit, sort, filters)
+
+    def get_books(self, conn, bk_ids):
+        if len(bk_ids) == 1:
+            return self.run_query(conn, 'get_book', tuple(bk_ids))[0]
+        return self._by_keys(conn, 'Library', BOOK_ROW_COLUMNS, 'BK_ID', bk_ids)
+
+    def search_books(self, conn, text, limit):
+        raise NotImplementedError
+
+    def add_book(self, conn, values):
+        # values: (BK_NAME, BK_ID, AUTHOR_NAME, GENRE, BK_STATUS, CARD_ID)
+        with self.transaction(conn) as cursor:
+            self._write_books(cursor, [values], due=due_date())
+            self._add_counts(cursor, self._book_counts(cursor, []), self._book_counts(cursor, [values[1]]))
+            self._log_changes(cursor, 'Library', [values[1]])
+            if values[4] == 'Issued':
+                self._record_loans(cursor, 'issue', [(values[1], values[0], values[3], values[5])])
+        self.ids.mark_used(conn, 'book', values[1])
+
+    def update_book(self, conn, values, version=None):
+        # values: (BK_NAME, BK_STATUS, AUTHOR_NAME, GENRE, CARD_ID, BK_ID). version is the
+        # Row_Version the desk last read; if the book has changed since, nothing is written
+        name, status, _, genre, card_id, bk_id = values
+        with self.transaction(conn) as cursor:
+            old = self._current(cursor, [bk_id]).get(bk_id)
+            before = self._book_counts(cursor, [bk_id])
+            changed = self._update_book(cursor, values, version)
+            if version is not None and not changed:
+                raise ConflictError(f'{bk_id} was changed at another desk' if old
+                                    else f'{bk_id} was deleted at another desk')
+            self._add_counts(cursor, before, self._book_counts(cursor, [bk_id]))
+            self._log_changes(cursor, 'Library', [bk_id])
+            if old:
+                self._record_change(cursor, bk_id, old, name, genre, status, card_id)
+
+    def set_availability(self, conn, bk_id, status, card_id, expected=None):
+        # expected: the status the desk saw; the change is only made if the book still has it,
+        # so two desks can never both issue the same copy
+        with self.transaction(conn) as cursor:
+            old = self._current(cursor, [bk_id]).get(bk_id)
+            before = self._book_counts(cursor, [bk_id])
+            changed = self._set_status(cursor, [bk_id], status, card_id, expected)
+            if expected and not changed:
+                raise ConflictError(f'{bk_id} is now {old[2]}' if old else f'{bk_id} was deleted at another desk')
+            self._add_counts(cursor, before, self._book_counts(cursor, [bk_id]))
+            self._log_changes(cursor, 'Library', [bk_id])
+            if old:
+                self._record_change(cursor, bk_id, old, old[0], old[1], status, card_id)
+
+    def circulate(self, conn, bk_ids, status, card_id=None):
+        # Batch issue (status='Issued', card_id given) or return (status='Available') of many
+        # books: validated up front, then applied with one set-based UPDATE in one transaction
+        bk_ids = list(dict.fromkeys(bk_ids))
+        if not bk_ids:
+            raise CirculationError(['No Book IDs were entered.'])
+        expected = 'Available' if status == 'Issued' else 'Issued'
+        marks = ', '.join(['%s'] * len(bk_ids))
+
+        problems = []
+        if status == 'Issued' and not self.card_exists(conn, card_id):
+            problems.append(f'Card ID {card_id} is not registered.')
+        found = {row[0]: row[1:] for row in self.fetch_all(
+            conn, f'SELECT BK_ID, BK_NAME, GENRE, BK_STATUS, CARD_ID FROM Library WHERE BK_ID IN ({marks})',
+            tuple(bk_ids))}
+        for bk_id in bk_ids:
+            if bk_id not in found:
+                problems.append(f'{bk_id} does not exist.')
+            elif found[bk_id][2] != expected:
+                problems.append(f'{bk_id} is {found[bk_id][2]}.')
+        if problems:
+            raise CirculationError(problems)
+
+        with self.transaction(conn) as cursor:
+            before = self._book_counts(cursor, bk_ids)
+            changed = self._set_status(cursor, bk_ids, status, card_id if status == 'Issued' else None, expected)
+            if changed != len(bk_ids):
+                # Another desk changed some of these books after validation
+                raise CirculationError([f'{len(bk_ids) - changed} of the books changed while saving. '
+                                        'Nothing was saved; please check them again.'])
+            self._add_counts(cursor, before, self._book_counts(cursor, bk_ids))
+            self._log_changes(cursor, 'Library', bk_ids)
+            if status == 'Issued':
+                self._record_loans(cursor, 'issue', [(bk_id, found[bk_id][0], found[bk_id][1], card_id)
+                                                     for bk_id in bk_ids])
+            else:
+                self._record_loans(cursor, 'return', [(bk_id, found[bk_id][0], found[bk_id][1], found[bk_id][3])
+                                                      for bk_id in bk_ids])
+        return len(bk_ids)
+
+    def delete_book(self, conn, bk_id):
+        with self.transaction(conn) as cursor:
+            before = self._book_counts(cursor, [bk_id])
+            cursor.execute(self.sql(f'DELETE FROM {self.books_table} WHERE BK_ID=%s'), (bk_id,))
+            self._add_counts(cursor, before, self._book_counts(cursor, []))
+            self._log_changes(cursor, 'Library', [bk_id])
+
+    def delete_all_books(self, conn):
+        # Every counter is derived from the books, so they all go with them
+        with self.transaction(conn) as cursor:
+            cursor.execute(f'DELETE FROM {self.books_table}')
+            cursor.execute('DELETE FROM Catalog_Counters')
+            self._log_changes(cursor, 'Library', ['*'])
+
+    def next_book_id(self, conn):
+        return self.ids.peek(conn, 'book')
+
+    # ---------- Students ----------
+    def list_students(self, conn, after_row, limit, sort=None, filters=None):
+        return self._page(conn, 'Students', STUDENT_FIELDS, 'Card_ID', after_row, limit, sort, filters)
+
+    def get_students(self, conn, card_ids):
+        return self._by_keys(conn, 'Students', STUDENT_COLUMNS, 'Card_ID', card_ids)
+
+    def find_student(self, conn, card_id):
+        rows = self.run_query(conn, 'find_student', (card_id,))[0]
+        return rows[0] if rows else None
+
+    def student_directory(self, conn):
+        # Every student's (Card_ID, Name, Email, Course), to build the issuer picker's index from
+        return self.fetch_all(conn, 'SELECT Card_ID, Name, Email, Course FROM Students')
+
+    def is_cached_card(self, card_id):
+        # No connection needed, so callers can check this before queueing a query
+        return self.valid_cards.get(card_id, False)
+
+    def load_card(self, conn, card_id):
+        # Database check behind the cache; valid cards are remembered
+        exists = bool(self.run_query(conn, 'card_exists', (card_id,))[0])
+        if exists:
+            self.valid_cards.put(card_id, True)
+        return exists
+
+    def card_exists(self, conn, card_id):
+        return self.is_cached_card(card_id) or self.load_card(conn, card_id)
+
+    def add_student(self, conn, values):
+        # values: (Card_ID, Name, Email, Course, Year)
+        with self.transaction(conn) as cursor:
+            cursor.execute(self.sql("""
+                INSERT INTO Students (Card_ID, Name, Email, Course, Year)
+                VALUES (%s, %s, %s, %s, %s)
+            """), values)
+            self._log_changes(cursor, 'Students', [values[0]])
+        self.valid_cards.invalidate(values[0])
+        self.ids.mark_used(conn, 'student', values[0])
+
+    def update_student(self, conn, values):
+        # values: (Name, Email, Course, Year, Card_ID). A new course takes the student's
+        # outstanding loans with it on the dashboard.
+        with self.transaction(conn) as cursor:
+            before = self._course_counts(cursor, [values[4]])
+            cursor.execute(self.sql("""
+                UPDATE Students
+                SET Name = %s, Email = %s, Course = %s, Year = %s
+                WHERE Card_ID = %s
+            """), values)
+            self._add_counts(cursor, before, self._course_counts(cursor, [values[4]]))
+            self._log_changes(cursor, 'Students', [values[4]])
+        self.valid_cards.invalidate(values[4])
+
+    def delete_student(self, conn, card_id):
+        with self.transaction(conn) as cursor:
+            cursor.execute(self.sql('DELETE FROM Students WHERE Card_ID = %s'), (card_id,))
+            self._log_changes(cursor, 'Students', [card_id])
+        self.valid_cards.invalidate(card_id)
+
+    def delete_all_students(self, conn):
+        with self.transaction(conn) as cursor:
+            cursor.execute('DELETE FROM Students')
+            self._log_changes(cursor, 'Students', ['*'])
+        self.valid_cards.clear()
+
+    def next_card_id(self, conn):
+        # Preview for the GUI; the ID is only used up once a student is stored with it
+        return self.ids.peek(conn, 'student')
+
+    def take_card_id(self, conn):
+        return self.ids.take(conn, 'student')
+
+    def reset_ids(self, conn):
+        # Counters are re-seeded from the data on next use, e.g. after reloading sample data
+        self.execute(conn, 'DELETE FROM ID_Sequences')
+
+
+class MySQLStorage(LibraryStorage):
+    def __init__(self, pool_size=db.POOL_SIZE, prepared=db.PREPARED_STATEMENTS, **options):
+        import mysql.connector
+        import mysql.connector.pooling
+
+        self.integrity_errors = (mysql.connector.IntegrityError,)
+        # Prepared statements live as long as the server session, so with them connections
+        # go back to the pool without the session reset that would deallocate them
+        self.pool = mysql.connector.pooling.MySQLConnectionPool(pool_name='library', pool_size=pool_size,
+                                                                pool_reset_session=not prepared,
+                                                                **db.connection_settings(), **options)
+        # Server connection ID -> {statement: PreparedCursor}, or None to run plain text queries
+        self._prepared = {} if prepared else None
+        self._prepared_lock = threading.Lock()
+        super().__init__()
+
+    @contextmanager
+    def connection(self):
+        conn = self.pool.get_connection()
+        try:
+            yield TimedConnection(conn, self.stats, self._statements(conn))
+        finally:
+            try:
+                # Autocommit is off and the session is not reset, so a job that only read would
+                # leave its REPEATABLE READ snapshot open for the next job on this connection,
+                # which would then never see other desks' writes
+                conn.rollback()
+            finally:
+                conn.close()  # returns it to the pool
+
+    def _statements(self, conn):
+        # The prepared statements of this checkout's server session. A connection the pool has
+        # reopened comes back under a new connection ID; that is when the entries of sessions
+        # that have ended are dropped.
+        if self._prepared is None:
+            return None
+        with self._prepared_lock:
+            statements = self._prepared.get(conn.connection_id)
+            if statements is None:
+                self._drop_ended_sessions(conn)
+                statements = self._prepared[conn.connection_id] = {}
+            return statements
+
+    def _drop_ended_sessions(self, conn):
+        if not self._prepared:
+            return
+        cursor = conn.cursor()
+        try:
+            sessions = tuple(self._prepared)
+            marks = ', '.join(['%s'] * len(sessions))
+            cursor.execute(f'SELECT ID FROM information_schema.PROCESSLIST WHERE ID IN ({marks})', sessions)
+            alive = {row[0] for row in cursor.fetchall()}
+        finally:
+            cursor.close()
+        # The server freed their statements with the session. The cursors are not closed: that
+        # would send the old statement IDs to whichever session their connection has now.
+        for session in set(sessions) - alive:
+            del self._prepared[session]
+
+    def migrate(self):
+        import migrations
+
+        with self.connection() as conn:
+            return migrations.migrate(conn)
+
+    def increment_sql(self, table, columns, keys):
+        marks = ', '.join(['%s'] * len(columns))
+        return (f"INSERT INTO {table} ({', '.join(columns)}, Loans) VALUES ({marks}, 1) "
+                f"ON DUPLICATE KEY UPDATE Loans = Loans + 1")
+
+    def add_sql(self, table, columns, keys, total):
+        marks = ', '.join(['%s'] * (len(columns) + 1))
+        return (f"INSERT INTO {table} ({', '.join(columns)}, {total}) VALUES ({marks}) "
+                f"ON DUPLICATE KEY UPDATE {total} = {total} + VALUES({total})")
+
+    def upsert_sql(self, table, columns, key, version=None):
+        marks = ', '.join(['%s'] * len(columns))
+        updates = ', '.join(f'{column} = VALUES({column})' for column in columns if column != key)
+        if version:
+            updates += f', {version} = {version} + 1'
+        return f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({marks}) ON DUPLICATE KEY UPDATE {updates}"
+
+    def upsert_select_sql(self, table, columns, keys, select, updates):
+        return (f"INSERT INTO {table} ({', '.join(columns)}) {select} "
+                f"ON DUPLICATE KEY UPDATE {', '.join(f'{column} = VALUES({column})' for column in updates)}")
+
+    def days_since_sql(self, column):
+        return f'DATEDIFF(%s, {column})'
+
+    def stream_cursor(self, conn):
+        # Unbuffered: rows stay on the server until fetched
+        return conn.cursor(buffered=False)
+
+    def reserve_ids(self, conn, name, count):
+        cursor = conn.cursor()
+        try:
+            update = 'UPDATE ID_Sequences SET Next_Value = LAST_INSERT_ID(Next_Value + %s) WHERE Name = %s'
+            cursor.execute(update, (count, name))
+            if cursor.rowcount == 0:
+                # Only runs once per database: start the counter after the highest existing ID
+                prefix, table, column = SEQUENCES[name]
+                cursor.execute(f"""
+                    INSERT IGNORE INTO ID_Sequences (Name, Next_Value)
+                    SELECT %s, COALESCE(MAX(CAST(SUBSTRING({column}, %s) AS UNSIGNED)), 0) + 1
+                    FROM {table} WHERE {column} LIKE %s
+                """, (name, len(prefix) + 1, prefix + '%'))
+                cursor.execute(update, (count, name))
+            cursor.execute('SELECT LAST_INSERT_ID()')
+            end = cursor.fetchone()[0]
+            conn.commit()
+        finally:
+            cursor.close()
+        return end
+
+    def search_books(self, conn, text, limit):
+        long_words = [word for word in re.findall(r'\w+', text) if len(word) >= FT_MIN_TOKEN]
+        if not long_words:
+            return self._prefix_search(conn, text, limit)
+        # Every word must match, each as a prefix: "harr pot" -> "+harr* +pot*"
+        terms = ' '.join(f'+{word}*' for word in long_words)
+        return self.fetch_all(conn, f'''
+            SELECT {BOOK_ROW_COLUMNS} FROM Library
+            WHERE MATCH(BK_NAME, AUTHOR_NAME, GENRE) AGAINST (%s IN BOOLEAN MODE)
+            LIMIT %s
+        ''', (terms, limit))
+
+
+
+class NormalizedMySQLStorage(MySQLStorage):
+    # MySQL with the normalized layout (migrations.NORMALIZED_MIGRATIONS): Library is a view
+    # over Books, Authors, Genres and Students, so reads are inherited and only the writes
+    # and the full-text search change. Author and genre names are looked up (and added when
+    # new) once per batch, not per row.
+    books_table = 'Books'
+
+    def migrate(self):
+        import migrations
+
+        with self.connection() as conn:
+            applied = migrations.migrate(conn)
+            normalized = migrations.migrate(conn, migrations.NORMALIZED_MIGRATIONS, 'Normalized_Version')
+        return applied + [f'normalized {number}' for number in normalized]
+
+    def _lookup(self, cursor, table, id_column, names):
+        # name -> ID for the given authors or genres, adding the ones that are new
+        names = {name for name in names if name is not None}
+        if not names:
+            return {}
+        select = f"SELECT Name, {id_column} FROM {table} WHERE Name IN ({', '.join(['%s'] * len(names))})"
+        cursor.execute(select, tuple(names))
+        ids = dict(cursor.fetchall())
+        missing = names - ids.keys()
+        if missing:
+            # Only missing names are inserted, so existing ones never burn AUTO_INCREMENT values
+            cursor.executemany(f'INSERT IGNORE INTO {table} (Name) VALUES (%s)', [(name,) for name in missing])
+            cursor.execute(select, tuple(names))
+            ids = dict(cursor.fetchall())
+        return ids
+
+    def _student_ids(self, cursor, card_ids):
+        # Card ID -> Student_ID; an unknown card fails like the flat table's foreign key
+        card_ids = {card for card in card_ids if card is not None}
+        if not card_ids:
+            return {}
+        cursor.execute(f"SELECT Card_ID, Student_ID FROM Students WHERE Card_ID IN ({', '.join(['%s'] * len(card_ids))})",
+                       tuple(card_ids))
+        ids = dict(cursor.fetchall())
+        missing = card_ids - ids.keys()
+        if missing:
+            raise IntegrityError(f'Card ID {min(missing)} is not registered')
+        return ids
+
+    def _write_books(self, cursor, rows, upsert=False, due=None):
+        authors = self._lookup(cursor, 'Authors', 'Author_ID', {row[2] for row in rows})
+        genres = self._lookup(cursor, 'Genres', 'Genre_ID', {row[3] for row in rows})
+        students = self._student_ids(cursor, {row[5] for row in rows})
+        columns = ('BK_ID', 'BK_NAME', 'Author_ID', 'Genre_ID', 'BK_STATUS', 'Student_ID')
+        rows = [(bk_id, name, authors.get(author), genres.get(genre), status, students.get(card))
+                for name, bk_id, author, genre, status, card in rows]
+        if upsert:
+            statement = self.upsert_sql('Books', columns, 'BK_ID', 'Row_Version')
+        else:
+            columns += ('Due_Date',)
+            statement = f"INSERT INTO Books ({', '.join(columns)}) VALUES ({', '.join(['%s'] * len(columns))})"
+            rows = [row + (due if row[4] == 'Issued' else None,) for row in rows]
+        cursor.executemany(statement, rows)
+
+    def _update_book(self, cursor, values, version=None):
+        name, status, author, genre, card_id, bk_id = values
+        student_id = self._student_ids(cursor, [card_id]).get(card_id)
+        condition = ' AND Row_Version=%s' if version is not None else ''
+        cursor.execute(f'''
+            UPDATE Books SET
+            Due_Date=CASE WHEN %s <> 'Issued' THEN NULL
+                          WHEN BK_STATUS = 'Issued' AND Student_ID = %s THEN Due_Date ELSE %s END,
+            BK_NAME=%s, BK_STATUS=%s, Author_ID=%s, Genre_ID=%s, Student_ID=%s, Row_Version=Row_Version + 1
+            WHERE BK_ID=%s{condition}
+        ''', (status, student_id, due_date(), name, status,
+              self._lookup(cursor, 'Authors', 'Author_ID', [author]).get(author),
+              self._lookup(cursor, 'Genres', 'Genre_ID', [genre]).get(genre),
+              student_id, bk_id) + ((version,) if version is not None else ()))
+        return cursor.rowcount
+
+    def _set_status(self, cursor, bk_ids, status, card_id, expected=None):
+        marks = ', '.join(['%s'] * len(bk_ids))
+        condition = ' AND BK_STATUS=%s' if expected else ''
+        cursor.execute(f'UPDATE Books SET BK_STATUS=%s, Student_ID=%s, Due_Date=%s, Row_Version=Row_Version + 1 '
+                       f'WHERE BK_ID IN ({marks}){condition}',
+                       (status, self._student_ids(cursor, [card_id]).get(card_id),
+                        due_date() if status == 'Issued' else None, *bk_ids) + ((expected,) if expected else ()))
+        return cursor.rowcount
+
+    def search_books(self, conn, text, limit):
+        long_words = [word for word in re.findall(r'\w+', text) if len(word) >= FT_MIN_TOKEN]
+        if not long_words:
+            return self._prefix_search(conn, text, limit)
+        # Each name has its own index, so a book matches when all the words are in its title,
+        # or all in its author's name, or all in its genre
+        terms = ' '.join(f'+{word}*' for word in long_words)
+        return self.fetch_all(conn, f'''
+            SELECT {BOOK_ROW_COLUMNS} FROM Library WHERE BK_ID IN (
+                SELECT BK_ID FROM Books WHERE MATCH(BK_NAME) AGAINST (%s IN BOOLEAN MODE)
+                UNION
+                SELECT b.BK_ID FROM Books b JOIN Authors a ON a.Author_ID = b.Author_ID
+                WHERE MATCH(a.Name) AGAINST (%s IN BOOLEAN MODE)
+                UNION
+                SELECT b.BK_ID FROM Books b JOIN Genres g ON g.Genre_ID = b.Genre_ID
+                WHERE MATCH(g.Name) AGAINST (%s IN BOOLEAN MODE)
+            )
+            LIMIT %s
+        ''', (terms, terms, terms, limit))
+
+
+# Tuned for a single desk: WAL lets the page loader read while a save is writing, and
+# synchronous=NORMAL only risks the last transactions on power loss, never corruption.
+# Compiled statements kept per SQLite connection: the QUERIES plus the common variable ones
+SQLITE_STATEMENT_CACHE = 256
+
+SQLITE_PRAGMAS = (
+    'PRAGMA journal_mode = WAL',
+    'PRAGMA synchronous = NORMAL',
+    'PRAGMA foreign_keys = ON',
+    'PRAGMA busy_timeout = 5000',
+    'PRAGMA temp_store = MEMORY',
+    'PRAGMA cache_size = -65536',
+    'PRAGMA mmap_size = 268435456',
+)
+
+
+class SQLiteStorage(LibraryStorage):
+    integrity_errors = (sqlite3.IntegrityError,)
+
+    def __init__(self, path, prepared=db.PREPARED_STATEMENTS):
+        self.path = path
+        # sqlite3 keeps each connection's compiled statements by their text, so the QUERIES
+        # are parsed once per worker thread; without prepared every execute compiles again
+        self.statement_cache = SQLITE_STATEMENT_CACHE if prepared else 0
+        self.local = threading.local()  # one connection per worker thread
+        super().__init__()
+
+    @contextmanager
+    def connection(self):
+        conn = getattr(self.local, 'conn', None)
+        if conn is None:
+            conn = self.local.conn = sqlite3.connect(self.path, timeout=5, cached_statements=self.statement_cache)
+            for pragma in SQLITE_PRAGMAS:
+                conn.execute(pragma)
+        yield TimedConnection(conn, self.stats)
+
+    def sql(self, statement):
+        return statement.replace('%s', '?')
+
+    def migrate(self):
+        import migrations
+
+        with self.connection() as conn:
+            return migrations.migrate_sqlite(conn)
+
+    def increment_sql(self, table, columns, keys):
+        marks = ', '.join(['%s'] * len(columns))
+        return (f"INSERT INTO {table} ({', '.join(columns)}, Loans) VALUES ({marks}, 1) "
+                f"ON CONFLICT ({', '.join(keys)}) DO UPDATE SET Loans = Loans + 1")
+
+    def add_sql(self, table, columns, keys, total):
+        marks = ', '.join(['%s'] * (len(columns) + 1))
+        return (f"INSERT INTO {table} ({', '.join(columns)}, {total}) VALUES ({marks}) "
+                f"ON CONFLICT ({', '.join(keys)}) DO UPDATE SET {total} = {total} + excluded.{total}")
+
+    def upsert_sql(self, table, columns, key, version=None):
+        marks = ', '.join(['%s'] * len(columns))
+        updates = ', '.join(f'{column} = excluded.{column}' for column in columns if column != key)
+        if version:
+            updates += f', {version} = {version} + 1'
+        return f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({marks}) ON CONFLICT ({key}) DO UPDATE SET {updates}"
+
+    def upsert_select_sql(self, table, columns, keys, select, updates):
+        return (f"INSERT INTO {table} ({', '.join(columns)}) {select} "
+                f"ON CONFLICT ({', '.join(keys)}) DO UPDATE SET "
+                f"{', '.join(f'{column} = excluded.{column}' for column in updates)}")
+
+    def days_since_sql(self, column):
+        return f'CAST(julianday(%s) - julianday({column}) AS INTEGER)'
+
+    def reserve_ids(self, conn, name, count):
+        update = 'UPDATE ID_Sequences SET Next_Value = Next_Value + ? WHERE Name = ? RETURNING Next_Value'
+        cursor = conn.cursor()
+        try:
+            row = cursor.execute(update, (count, name)).fetchone()
+            if row is None:
+                prefix, table, column = SEQUENCES[name]
+                cursor.execute(f"""
+                    INSERT OR IGNORE INTO ID_Sequences (Name, Next_Value)
+                    SELECT ?, COALESCE(MAX(CAST(SUBSTR({column}, ?) AS INTEGER)), 0) + 1
+                    FROM {table} WHERE {column} LIKE ?
+                """, (name, len(prefix) + 1, prefix + '%'))
+                row = cursor.execute(update, (count, name)).fetchone()
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            cursor.close()
+        return row[0]
+
+    def search_books(self, conn, text, limit):
+        words = re.findall(r'\w+', text)
+        if not words:
+            return self._prefix_search(conn, text, limit)
+        terms = ' '.join(f'"{word}"*' for word in words)
+        columns = ', '.join(f'l.{column}' for column in BOOK_ROW_FIELDS)
+        return self.fetch_all(conn, f'''
+            SELECT {columns} FROM Library_Search s JOIN Library l ON l.rowid = s.rowid
+            WHERE Library_Search MATCH %s
+            LIMIT %s
+        ''', (terms, limit))
+
+
+def open_storage(pool_size=db.POOL_SIZE, **mysql_options):
+    backend = os.getenv('DB_BACKEND', 'mysql').lower()
+    normalized = os.getenv('DB_SCHEMA', 'flat').lower() == 'normalized'
+    if backend == 'sqlite':
+        if normalized:
+            raise ValueError('DB_SCHEMA=normalized needs the MySQL backend')
+        return SQLiteStorage(os.getenv('DB_PATH', 'library.db'))
+    if backend == 'mysql':
+        if normalized:
+            return NormalizedMySQLStorage(pool_size, **mysql_options)
+        return MySQLStorage(pool_size, **mysql_options)
+    raise ValueError(f'Unknown DB_BACKEND {backend!r}; expected mysql or sqlite')
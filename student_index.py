@@ -0,0 +1,74 @@
+# In-memory type-ahead index over the student table, for picking an issuer by Card ID,
+# name or email without a query per keystroke.
+#
+# Every student contributes a few lower-cased search terms: the Card ID, the email, the
+# full name and each later word of the name, so "rao" finds "Asha Rao". The terms are kept
+# in one sorted list, with the owning Card ID at the same position in a parallel list
+# (cheaper than a list of tuples at 100k students). A prefix is found by binary search, so a
+# lookup costs O(log n) plus the suggestions returned. main.py loads the index once and
+# patches it as students change. It is only used from the Tk thread.
+from bisect import bisect_left
+import sys
+
+
+def search_terms(card_id, name, email):
+    words = (name or '').lower().split()
+    terms = {card_id.lower(), ' '.join(words)} | set(words[1:])
+    if email:
+        terms.add(email.lower())
+    terms.discard('')
+    return terms
+
+
+class StudentIndex:
+    def __init__(self, rows=()):
+        # rows: (Card_ID, Name, Email, Course)
+        self.students = {}
+        entries = []
+        for row in rows:
+            card_id = sys.intern(row[0])
+            self.students[card_id] = (card_id,) + tuple(row[1:4])
+            entries.extend((term, card_id) for term in search_terms(*row[:3]))
+        entries.sort()
+        self.terms = [term for term, _ in entries]
+        self.cards = [card_id for _, card_id in entries]
+
+    def __len__(self):
+        return len(self.students)
+
+    def __contains__(self, card_id):
+        return card_id in self.students
+
+    def put(self, row):
+        # Adds a student, or replaces the terms of one that changed
+        card_id = sys.intern(row[0])
+        self.remove(card_id)
+        self.students[card_id] = (card_id,) + tuple(row[1:4])
+        for term in search_terms(*row[:3]):
+            position = bisect_left(self.terms, term)
+            self.terms.insert(position, term)
+            self.cards.insert(position, card_id)
+
+    def remove(self, card_id):
+        row = self.students.pop(card_id, None)
+        if row is None:
+            return
+        for term in search_terms(*row[:3]):
+            position = bisect_left(self.terms, term)
+            while self.cards[position] != card_id:
+                position += 1
+            del self.terms[position]
+            del self.cards[position]
+
+    def suggest(self, text, limit):
+        # Up to limit students with a term starting with text, as (Card_ID, Name, Email, Course)
+        prefix = ' '.join(text.lower().split())
+        if not prefix:
+            return []
+        found = {}
+        position = bisect_left(self.terms, prefix)
+        while position < len(self.terms) and len(found) < limit and self.terms[position].startswith(prefix):
+            card_id = self.cards[position]
+            found.setdefault(card_id, self.students[card_id])
+            position += 1
+        return list(found.values())
@@ -0,0 +1,42 @@
+# Needs a MySQL database: DB_BACKEND=mysql and the DB_* settings of .env. The test adds one
+# Change_Log row and removes it again.
+import os
+import unittest
+
+import db
+import storage
+
+
+@unittest.skipUnless(os.getenv('DB_BACKEND') == 'mysql', 'set DB_BACKEND=mysql to run against MySQL')
+class PooledSnapshotTest(unittest.TestCase):
+    def setUp(self):
+        # One pooled connection, so both reads below go through the same session
+        self.store = storage.MySQLStorage(pool_size=1, prepared=True)
+        self.store.migrate()
+
+    def test_pooled_connection_sees_writes_from_other_connections(self):
+        import mysql.connector
+
+        count = 'SELECT COUNT(*) FROM Change_Log'
+        with self.store.connection() as conn:
+            before = self.store.fetch_one(conn, count)[0]
+
+        other = mysql.connector.connect(**db.connection_settings())
+        try:
+            cursor = other.cursor()
+            cursor.execute("INSERT INTO Change_Log (Table_Name, Row_Key, Changed_At) "
+                           "VALUES ('Library', 'BK-TEST-SNAPSHOT', NOW())")
+            other.commit()
+            try:
+                with self.store.connection() as conn:
+                    self.assertEqual(self.store.fetch_one(conn, count)[0], before + 1)
+            finally:
+                cursor.execute("DELETE FROM Change_Log WHERE Row_Key = 'BK-TEST-SNAPSHOT'")
+                other.commit()
+                cursor.close()
+        finally:
+            other.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
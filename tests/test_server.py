@@ -0,0 +1,45 @@
+import asyncio
+import os
+import tempfile
+import unittest
+
+import server
+import storage
+
+
+class BookPagesTest(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.store = storage.SQLiteStorage(os.path.join(directory.name, 'library.db'))
+        self.store.migrate()
+        with self.store.connection() as conn:
+            self.store.import_rows(conn, 'Library', [
+                ('Dune', 'BK-0001', 'Frank Herbert', 'Science Fiction', 'Available', None),
+                ('Emma', 'BK-0002', 'Jane Austen', 'Romance', 'Available', None),
+                ('Ubik', 'BK-0003', 'Philip K. Dick', 'Science Fiction', 'Available', None),
+            ])
+        self.service = server.LibraryService(self.store, 1)
+        self.addCleanup(self.service.executor.shutdown)
+
+    def get(self, target):
+        return asyncio.run(self.service.dispatch('GET', target, b''))
+
+    def test_sorted_page_needs_after_value(self):
+        status, payload = self.get('/books?sort=GENRE&after=BK-0002')
+        self.assertEqual(status, 400)
+        self.assertIn('after_value', payload['error'])
+
+    def test_sorted_page_seeks_past_after_value(self):
+        status, payload = self.get('/books?sort=GENRE&after=BK-0002&after_value=Romance')
+        self.assertEqual(status, 200)
+        self.assertEqual([book['BK_ID'] for book in payload], ['BK-0001', 'BK-0003'])
+
+    def test_key_order_needs_no_after_value(self):
+        status, payload = self.get('/books?sort=BK_ID&after=BK-0001')
+        self.assertEqual(status, 200)
+        self.assertEqual([book['BK_ID'] for book in payload], ['BK-0002', 'BK-0003'])
+
+
+if __name__ == '__main__':
+    unittest.main()
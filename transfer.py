@@ -0,0 +1,189 @@
+# Streaming CSV / JSON Lines import and export for the Library and Students tables.
+#
+# Both directions work a batch at a time, so memory use is the same for a thousand rows
+# or ten million: export reads from a server-side cursor and writes each batch straight
+# to the file, import validates a batch of records against the database and stores it
+# with one batched INSERT (or upsert). Progress and rows/sec are reported on stderr.
+#
+# CSV files have a header row with the column names. JSON files are JSON Lines: one
+# object per line, which can be read and written incrementally, unlike a single array.
+# Empty CSV fields and JSON nulls are NULL. Used by `python library.py export/import`.
+import csv
+import json
+import sys
+import time
+
+import storage
+
+EXPORT_BATCH_SIZE = 5000
+IMPORT_BATCH_SIZE = 5000
+
+# Rejected rows printed before the rest are only counted
+MAX_REPORTED_PROBLEMS = 50
+
+FORMATS = {'.csv': 'csv', '.json': 'json', '.jsonl': 'json', '.ndjson': 'json'}
+
+
+def file_format(path, fmt=None):
+    if fmt:
+        return fmt
+    for extension, name in FORMATS.items():
+        if path.lower().endswith(extension):
+            return name
+    raise ValueError(f'Cannot tell the format of {path!r}; pass --format csv or --format json')
+
+
+def open_file(path, mode):
+    # '-' is stdin/stdout, so exports can be piped
+    if path == '-':
+        return open((sys.stdin if mode == 'r' else sys.stdout).fileno(), mode, newline='', encoding='utf-8',
+                    closefd=False)
+    return open(path, mode, newline='', encoding='utf-8')
+
+
+def report(table, action, done, started, end=''):
+    elapsed = time.perf_counter() - started
+    print(f'\r{table}: {action} {done} rows ({done / max(elapsed, 1e-9):,.0f} rows/sec)',
+          end=end, file=sys.stderr, flush=True)
+
+
+# ---------- Export ----------
+def export_table(store, conn, table, path, fmt=None, batch_size=EXPORT_BATCH_SIZE):
+    fields = storage.TABLES[table][0]
+    fmt = file_format(path, fmt)
+    started = time.perf_counter()
+    done = 0
+    with open_file(path, 'w') as handle:
+        if fmt == 'csv':
+            writer = csv.writer(handle, lineterminator='\n')
+            writer.writerow(fields)
+            write = lambda rows: writer.writerows(('' if value is None else value for value in row) for row in rows)
+        else:
+            write = lambda rows: handle.writelines(json.dumps(dict(zip(fields, row))) + '\n' for row in rows)
+        for rows in store.stream_rows(conn, table, batch_size):
+            write(rows)
+            done += len(rows)
+            report(table, 'exported', done, started)
+    report(table, 'exported', done, started, end='\n')
+    return done
+
+
+# ---------- Import ----------
+def read_records(handle, fmt):
+    # Yields (line number, {column: value}) one record at a time; the record is None for
+    # JSON lines that are not an object
+    if fmt == 'csv':
+        reader = csv.DictReader(handle)
+        for record in reader:
+            yield reader.line_num, record
+    else:
+        for number, line in enumerate(handle, 1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                record = None
+            yield number, record if isinstance(record, dict) else None
+
+
+def text(record, column, required=True):
+    value = record.get(column)
+    value = '' if value is None else str(value).strip()
+    if required and not value:
+        raise ValueError(f'{column} is empty')
+    return value or None
+
+
+def book_row(record):
+    status = text(record, 'BK_STATUS')
+    if status not in ('Available', 'Issued'):
+        raise ValueError(f'BK_STATUS must be Available or Issued, not {status!r}')
+    card_id = text(record, 'CARD_ID', required=False)
+    if card_id == 'N/A':
+        card_id = None
+    if (status == 'Issued') != (card_id is not None):
+        raise ValueError('CARD_ID must be set for Issued books and empty for Available ones')
+    return (text(record, 'BK_NAME'), text(record, 'BK_ID'), text(record, 'AUTHOR_NAME'),
+            text(record, 'GENRE', required=False), status, card_id)
+
+
+def student_row(record):
+    try:
+        year = int(text(record, 'Year'))
+    except ValueError:
+        raise ValueError(f"Year must be a whole number, not {record.get('Year')!r}") from None
+    return (text(record, 'Card_ID'), text(record, 'Name'), text(record, 'Email'), text(record, 'Course'), year)
+
+
+ROW_BUILDERS = {'Library': book_row, 'Students': student_row}
+
+
+def check_batch(store, conn, table, batch, upsert):
+    # batch: [(line number, row)]. Returns the rows that can be stored and the problems
+    # with the rest, using one query for existing keys and one for issuer cards.
+    fields, key_column, _ = storage.TABLES[table]
+    key_index = fields.index(key_column)
+    problems = []
+    unique = {}
+    for number, row in batch:
+        if row[key_index] in unique:
+            problems.append((number, f'{row[key_index]} appears twice in the file'))
+        else:
+            unique[row[key_index]] = (number, row)
+    if not upsert:
+        for key in store.existing_keys(conn, table, list(unique)):
+            problems.append((unique.pop(key)[0], f'{key} already exists (use --upsert to update it)'))
+    if table == 'Library':
+        cards = {row[5] for _, row in unique.values() if row[5] is not None}
+        missing = cards - store.existing_keys(conn, 'Students', list(cards))
+        for key, (number, row) in list(unique.items()):
+            if row[5] in missing:
+                problems.append((number, f'Card ID {row[5]} is not registered'))
+                del unique[key]
+    return [row for _, row in unique.values()], sorted(problems)
+
+
+def import_table(store, conn, table, path, fmt=None, upsert=False, batch_size=IMPORT_BATCH_SIZE):
+    # Returns (rows stored, rows rejected). Each batch is its own transaction, so an
+    # interrupted import keeps the batches that were already stored.
+    make_row = ROW_BUILDERS[table]
+    fmt = file_format(path, fmt)
+    started = time.perf_counter()
+    done = rejected = 0
+
+    def reject(number, problem):
+        nonlocal rejected
+        rejected += 1
+        if rejected <= MAX_REPORTED_PROBLEMS:
+            # Padded to overwrite the progress line
+            print(f'\rline {number}: {problem}'.ljust(70), file=sys.stderr)
+
+    def store_batch(batch):
+        nonlocal done
+        rows, problems = check_batch(store, conn, table, batch, upsert)
+        for number, problem in problems:
+            reject(number, problem)
+        if rows:
+            done += store.import_rows(conn, table, rows, upsert)
+        report(table, 'imported', done, started)
+
+    with open_file(path, 'r') as handle:
+        batch = []
+        for number, record in read_records(handle, fmt):
+            if record is None:
+                reject(number, 'not a valid JSON object')
+                continue
+            try:
+                batch.append((number, make_row(record)))
+            except ValueError as error:
+                reject(number, str(error))
+            if len(batch) >= batch_size:
+                store_batch(batch)
+                batch = []
+        if batch:
+            store_batch(batch)
+    report(table, 'imported', done, started, end='\n')
+    if rejected > MAX_REPORTED_PROBLEMS:
+        print(f'... and {rejected - MAX_REPORTED_PROBLEMS} more rejected rows', file=sys.stderr)
+    return done, rejected